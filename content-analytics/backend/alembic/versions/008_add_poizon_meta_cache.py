@@ -0,0 +1,30 @@
+"""add poizon_meta_cache table"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'poizon_meta_cache',
+        sa.Column('url_hash', sa.String(length=64), primary_key=True),
+        sa.Column('url', sa.Text(), nullable=False),
+        sa.Column('title', sa.Text(), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('image', sa.String(length=1000), nullable=True),
+        sa.Column('image_urls', postgresql.JSON(astext_type=sa.Text()), nullable=True),
+        sa.Column('fetched_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('last_accessed_at', sa.DateTime(), nullable=False, server_default=sa.text('CURRENT_TIMESTAMP')),
+    )
+    op.create_index('ix_poizon_meta_cache_last_accessed_at', 'poizon_meta_cache', ['last_accessed_at'])
+
+
+def downgrade():
+    op.drop_index('ix_poizon_meta_cache_last_accessed_at', table_name='poizon_meta_cache')
+    op.drop_table('poizon_meta_cache')
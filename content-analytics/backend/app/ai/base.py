@@ -1,6 +1,14 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional, List, AsyncGenerator
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
+import hashlib
+import json
+import re
+import httpx
+from .rate_limit import TokenBucket
+from .http import PooledAsyncClient, iter_sse_deltas
+from .cache import LLMResponseCache, response_cache
+from .prompts import SYSTEM_PROMPT, build_analysis_prompt, build_batch_analysis_prompt
 
 
 @dataclass
@@ -18,9 +26,46 @@ class AIResponse:
 class BaseAIProvider(ABC):
     """AI Provider基类"""
     
-    def __init__(self, api_key: str, base_url: Optional[str] = None):
+    # 批量分析时同时进行的请求数上限
+    MAX_CONCURRENCY = 4
+    # 请求速率上限（次/分钟）；多模态请求可单独限流，None 表示与文本请求共用
+    REQUESTS_PER_MINUTE = 60
+    MULTIMODAL_REQUESTS_PER_MINUTE: Optional[float] = None
+    # analyze_post 使用的采样温度（参与响应缓存键的计算）
+    ANALYSIS_TEMPERATURE = 0.7
+    # 批量分析时一次请求打包的纯文本笔记数（K），1 表示逐篇请求；可用 AI_ANALYSIS_BATCH_SIZES 按 Provider 覆盖
+    ANALYSIS_BATCH_SIZE = 1
+    # 批量请求中每篇笔记预留的输出 token 数
+    BATCH_MAX_TOKENS_PER_POST = 800
+    
+    def __init__(self, api_key: str, base_url: Optional[str] = None, batch_size: Optional[int] = None):
         self.api_key = api_key
         self.base_url = base_url
+        self.batch_size = max(1, batch_size or self.ANALYSIS_BATCH_SIZE)
+        self.rate_limiter = TokenBucket(self.REQUESTS_PER_MINUTE, burst=self.MAX_CONCURRENCY)
+        self.multimodal_rate_limiter = (
+            TokenBucket(self.MULTIMODAL_REQUESTS_PER_MINUTE)
+            if self.MULTIMODAL_REQUESTS_PER_MINUTE else self.rate_limiter
+        )
+        # 长连接复用的 HTTP 客户端，认证头在连接池级别设置
+        self._http = PooledAsyncClient(headers={
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """当前事件循环上复用的 HTTP 客户端"""
+        return self._http.get()
+    
+    async def aclose(self) -> None:
+        """关闭当前事件循环上的 HTTP 连接池"""
+        await self._http.aclose()
+    
+    async def acquire_rate_limit(self, multimodal: bool = False) -> float:
+        """按速率限制等待发起下一次请求，返回等待的秒数"""
+        limiter = self.multimodal_rate_limiter if multimodal else self.rate_limiter
+        return await limiter.acquire()
     
     @property
     @abstractmethod
@@ -38,6 +83,231 @@ class BaseAIProvider(ABC):
         """分析单篇笔记"""
         pass
     
+    def analysis_model(self, image_data: Optional[tuple[str, str]] = None) -> str:
+        """analyze_post 实际请求的模型（子类按是否带图片区分时覆盖）"""
+        return self.model_name
+    
+    def analysis_cache_key(
+        self,
+        input_data: Dict[str, Any],
+        image_data: Optional[tuple[str, str]] = None
+    ) -> str:
+        """计算单篇分析请求的响应缓存键"""
+        image_digest = ""
+        if image_data is not None:
+            image_digest = hashlib.sha256(image_data[0].encode("utf-8")).hexdigest()
+        return LLMResponseCache.make_key(
+            self.analysis_model(image_data),
+            SYSTEM_PROMPT,
+            build_analysis_prompt(input_data),
+            image_digest,
+            self.ANALYSIS_TEMPERATURE
+        )
+    
+    def batch_analysis_cache_key(self, input_data: Dict[str, Any]) -> str:
+        """计算批量分析中一篇笔记的响应缓存键
+        
+        批量请求使用不同的提示词模板，结果与单篇分析分开缓存；键按这篇笔记单独打包时的批量提示词计算，
+        与同批的其他笔记和编号无关。
+        """
+        return LLMResponseCache.make_key(
+            self.model_name,
+            SYSTEM_PROMPT,
+            build_batch_analysis_prompt([("1", input_data)]),
+            "",
+            self.ANALYSIS_TEMPERATURE
+        )
+    
+    async def analyze_post_cached(
+        self,
+        input_data: Dict[str, Any],
+        image_data: Optional[tuple[str, str]] = None,
+        force_refresh: bool = False
+    ) -> AIResponse:
+        """带响应缓存的单篇分析
+        
+        相同的模型、提示词、图片和温度直接返回缓存结果，不再请求也不占用限流额度；
+        force_refresh=True 时跳过读取缓存，重新请求并覆盖缓存。
+        """
+        key = self.analysis_cache_key(input_data, image_data)
+        if not force_refresh:
+            cached = await response_cache.get(key)
+            if cached is not None:
+                return AIResponse(**cached)
+        return await self._analyze_post_uncached(key, input_data, image_data)
+    
+    async def _analyze_post_uncached(
+        self,
+        key: str,
+        input_data: Dict[str, Any],
+        image_data: Optional[tuple[str, str]] = None
+    ) -> AIResponse:
+        """限流后发起单篇分析请求，并把结果写入缓存键 key"""
+        await self.acquire_rate_limit(multimodal=image_data is not None)
+        if image_data is not None:
+            response = await self.analyze_post(input_data, image_data=image_data)
+        else:
+            response = await self.analyze_post(input_data)
+        
+        # 只缓存解析成功的结构化结果，解析失败的原文兜底不缓存
+        if response.strengths or response.weaknesses or response.suggestions:
+            await response_cache.set(key, asdict(response))
+        return response
+    
+    async def _chat_completion(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        max_tokens: int,
+        temperature: float = 0.7,
+        timeout: float = 60.0
+    ) -> Dict[str, Any]:
+        """发送一次非流式 chat/completions 请求（OpenAI 兼容接口），返回响应 JSON"""
+        response = await self.client.post(
+            f"{self.base_url}/chat/completions",
+            timeout=timeout,
+            json={
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            }
+        )
+        response.raise_for_status()
+        return response.json()
+    
+    async def analyze_posts_batch(self, inputs: List[Dict[str, Any]]) -> List[Optional[AIResponse]]:
+        """一次请求分析多篇纯文本笔记
+        
+        笔记按 1..K 编号打包进同一个提示词，模型返回 JSON 数组；
+        返回与 inputs 一一对应的结果，缺失或解析失败的位置为 None。
+        """
+        item_ids = [str(i + 1) for i in range(len(inputs))]
+        prompt = build_batch_analysis_prompt(list(zip(item_ids, inputs)))
+        data = await self._chat_completion(
+            self.model_name,
+            [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=self.BATCH_MAX_TOKENS_PER_POST * len(inputs),
+            temperature=self.ANALYSIS_TEMPERATURE,
+            timeout=120.0
+        )
+        raw_response = data["choices"][0]["message"]["content"]
+        parsed = self._parse_batch_response(raw_response, item_ids)
+        
+        # 整个请求的 token 用量按篇数均摊到每条结果上
+        tokens_used = None
+        if "usage" in data:
+            tokens_used = {
+                name: round(data["usage"].get(name, 0) / len(inputs))
+                for name in ("prompt_tokens", "completion_tokens", "total_tokens")
+            }
+            tokens_used["batch_size"] = len(inputs)
+        
+        responses: List[Optional[AIResponse]] = []
+        for item_id in item_ids:
+            item = parsed.get(item_id)
+            if item is None:
+                responses.append(None)
+                continue
+            responses.append(AIResponse(
+                summary=item["summary"],
+                strengths=item["strengths"],
+                weaknesses=item["weaknesses"],
+                suggestions=item["suggestions"],
+                raw_response=json.dumps(item, ensure_ascii=False),
+                model_name=self.model_name,
+                tokens_used=tokens_used
+            ))
+        return responses
+    
+    async def analyze_posts_cached(
+        self,
+        inputs: List[Dict[str, Any]],
+        force_refresh: bool = False
+    ) -> List[Optional[AIResponse]]:
+        """带响应缓存的多篇纯文本分析，返回与 inputs 一一对应的结果（失败为 None）
+        
+        逐篇查批量分析的缓存（batch_analysis_cache_key，与单篇分析的缓存互不共用），
+        未命中的每 batch_size 篇打包成一次请求；批量响应中缺失或解析失败的笔记回退为单篇调用，
+        回退结果按单篇提示词缓存，且不再查询缓存（这篇已记过一次未命中）。
+        """
+        results: List[Optional[AIResponse]] = [None] * len(inputs)
+        misses = []
+        for index, input_data in enumerate(inputs):
+            cached = None if force_refresh else await response_cache.get(self.batch_analysis_cache_key(input_data))
+            if cached is not None:
+                results[index] = AIResponse(**cached)
+            else:
+                misses.append(index)
+        
+        fallback = []
+        for start in range(0, len(misses), self.batch_size):
+            indexes = misses[start:start + self.batch_size]
+            if len(indexes) == 1:
+                fallback.extend(indexes)
+                continue
+            await self.acquire_rate_limit()
+            try:
+                responses = await self.analyze_posts_batch([inputs[i] for i in indexes])
+            except Exception as e:
+                print(f"[ai] Batch analysis of {len(indexes)} posts failed, falling back to single requests: {e}")
+                responses = [None] * len(indexes)
+            for index, response in zip(indexes, responses):
+                if response is None:
+                    fallback.append(index)
+                    continue
+                results[index] = response
+                await response_cache.set(self.batch_analysis_cache_key(inputs[index]), asdict(response))
+        
+        if len(fallback) < len(misses):
+            print(f"[ai] Batched {len(misses) - len(fallback)}/{len(misses)} posts "
+                  f"(batch_size={self.batch_size}), {len(fallback)} single requests")
+        for index in fallback:
+            try:
+                results[index] = await self._analyze_post_uncached(
+                    self.analysis_cache_key(inputs[index]), inputs[index]
+                )
+            except Exception as e:
+                print(f"AI分析失败 (batch item {index}): {str(e)}")
+        return results
+    
+    async def _stream_chat_completion(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        timeout: float = 120.0
+    ) -> AsyncGenerator[str, None]:
+        """发送 stream=True 的 chat/completions 请求，边接收边产出增量文本
+        
+        使用实例共享的长连接客户端；调用方提前停止迭代（关闭生成器）时响应随即关闭，上游停止生成。
+        """
+        async with self.client.stream(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            timeout=timeout,
+            json={
+                "model": model,
+                "messages": messages,
+                "stream": True,
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            }
+        ) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise httpx.HTTPStatusError(
+                    f"流式请求失败（{response.status_code}）: {body.decode('utf-8', 'replace')[:500]}",
+                    request=response.request,
+                    response=response
+                )
+            async for content in iter_sse_deltas(response):
+                yield content
+    
     async def chat_stream(
         self, 
         messages: List[Dict[str, str]],
@@ -45,7 +315,7 @@ class BaseAIProvider(ABC):
         temperature: float = 0.7,
         max_tokens: int = 2000
     ) -> AsyncGenerator[str, None]:
-        """流式聊天接口（默认实现，子类可覆盖）
+        """流式聊天接口（OpenAI 兼容接口的原生流式输出，接口不兼容的子类可覆盖）
         
         Args:
             messages: 消息列表，格式 [{"role": "user", "content": "..."}, ...]
@@ -56,11 +326,13 @@ class BaseAIProvider(ABC):
         Yields:
             字符串片段（token）
         """
-        # 默认实现：调用非流式接口并逐字符返回
-        # 子类应该覆盖此方法以实现真正的流式响应
-        full_response = await self.chat(messages, system_prompt, temperature, max_tokens)
-        for char in full_response:
-            yield char
+        chat_messages = []
+        if system_prompt:
+            chat_messages.append({"role": "system", "content": system_prompt})
+        chat_messages.extend(messages)
+        
+        async for content in self._stream_chat_completion(self.model_name, chat_messages, temperature, max_tokens):
+            yield content
     
     async def chat(
         self,
@@ -103,3 +375,48 @@ class BaseAIProvider(ABC):
             'weaknesses': [],
             'suggestions': []
         }
+    
+    def _parse_batch_response(self, response: str, item_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """解析批量分析的 JSON 数组响应，返回 {编号: 结构化结果}，只包含结构完整的条目"""
+        parsed = None
+        candidates = [response]
+        # markdown 代码块，或数组前后夹带了说明文字
+        json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', response)
+        if json_match:
+            candidates.append(json_match.group(1))
+        start, end = response.find('['), response.rfind(']')
+        if 0 <= start < end:
+            candidates.append(response[start:end + 1])
+        for candidate in candidates:
+            try:
+                parsed = json.loads(candidate)
+                break
+            except json.JSONDecodeError:
+                continue
+        
+        if isinstance(parsed, dict):
+            parsed = parsed.get('results') or parsed.get('items')
+        if not isinstance(parsed, list):
+            return {}
+        
+        expected = set(item_ids)
+        items: Dict[str, Dict[str, Any]] = {}
+        for entry in parsed:
+            if not isinstance(entry, dict):
+                continue
+            item_id = str(entry.get('id', '')).strip()
+            if item_id not in expected or item_id in items:
+                continue
+            summary = entry.get('summary')
+            lists = [entry.get(name) for name in ('strengths', 'weaknesses', 'suggestions')]
+            if not isinstance(summary, str) or not all(isinstance(value, list) for value in lists):
+                continue
+            if not any(lists):
+                continue
+            items[item_id] = {
+                'summary': summary,
+                'strengths': lists[0],
+                'weaknesses': lists[1],
+                'suggestions': lists[2]
+            }
+        return items
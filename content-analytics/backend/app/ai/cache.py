@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+
+class LLMResponseCache:
+    """LLM 响应缓存 - 以 (模型, 系统提示词, 用户提示词, 图片摘要, 温度) 的哈希为键存入 Redis
+
+    每条缓存是一个带 TTL 的 JSON 字符串；另用一个有序集合记录最近访问时间，
+    条数超过上限时按最近访问时间淘汰（LRU）。命中时同时续期 TTL，
+    使有序集合中的分数加 TTL 恰好是键的过期时间，过期成员可以按分数准确清理。Redis 不可用时缓存自动失效，
+    不影响正常调用，一段时间后再重试连接。
+    """
+
+    KEY_PREFIX = "llm:resp:"
+    LRU_KEY = "llm:resp:lru"
+    # Redis 连接失败后暂停使用缓存的秒数
+    RETRY_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        ttl_hours: Optional[int] = None,
+        max_entries: Optional[int] = None
+    ):
+        self.url = url or settings.REDIS_URL
+        self.ttl_seconds = int((ttl_hours if ttl_hours is not None else settings.AI_RESPONSE_CACHE_TTL_HOURS) * 3600)
+        self.max_entries = max_entries if max_entries is not None else settings.AI_RESPONSE_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self._disabled_until = 0.0
+        # redis.asyncio 的连接绑定在事件循环上，按循环各保留一个客户端
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aioredis.Redis]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.AI_RESPONSE_CACHE_ENABLED and time.monotonic() >= self._disabled_until
+
+    @staticmethod
+    def make_key(
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        image_digest: str = "",
+        temperature: float = 0.7
+    ) -> str:
+        """计算缓存键（各字段以 JSON 数组序列化后取 sha256，避免拼接歧义）"""
+        payload = json.dumps(
+            [model, system_prompt, user_prompt, image_digest, round(float(temperature), 4)],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _client(self) -> aioredis.Redis:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = aioredis.from_url(
+                    self.url,
+                    decode_responses=True,
+                    socket_connect_timeout=2,
+                    socket_timeout=2
+                )
+                self._clients[loop] = client
+            return client
+
+    def _disable(self, error: Exception) -> None:
+        print(f"[ai_cache] Redis unavailable, response cache disabled for {self.RETRY_INTERVAL:.0f}s: {error}")
+        self._disabled_until = time.monotonic() + self.RETRY_INTERVAL
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存，命中时刷新最近访问时间并续期"""
+        if not self.enabled:
+            return None
+        try:
+            client = self._client()
+            value = await client.get(self.KEY_PREFIX + key)
+            if value is None:
+                self.misses += 1
+                return None
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.zadd(self.LRU_KEY, {key: time.time()})
+                pipe.expire(self.KEY_PREFIX + key, self.ttl_seconds)
+                await pipe.execute()
+            self.hits += 1
+            return json.loads(value)
+        except Exception as e:
+            self._disable(e)
+            return None
+
+    async def set(self, key: str, data: Dict[str, Any]) -> None:
+        """写入缓存，并淘汰过期和超出上限的条目"""
+        if not self.enabled:
+            return
+        try:
+            client = self._client()
+            now = time.time()
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.set(self.KEY_PREFIX + key, json.dumps(data, ensure_ascii=False), ex=self.ttl_seconds)
+                pipe.zadd(self.LRU_KEY, {key: now})
+                # 已过期条目只需从访问记录中移除
+                pipe.zremrangebyscore(self.LRU_KEY, "-inf", now - self.ttl_seconds)
+                pipe.zcard(self.LRU_KEY)
+                results = await pipe.execute()
+            overflow = results[-1] - self.max_entries
+            if overflow > 0:
+                evicted = await client.zpopmin(self.LRU_KEY, overflow)
+                if evicted:
+                    await client.delete(*(self.KEY_PREFIX + member for member, _ in evicted))
+        except Exception as e:
+            self._disable(e)
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环上的 Redis 连接"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        with self._lock:
+            client = self._clients.pop(loop, None)
+        if client is not None:
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+
+    def summary(self) -> str:
+        """命中统计，用于日志输出"""
+        return f"cache hits={self.hits} misses={self.misses}"
+
+
+# 进程内共享的缓存实例
+response_cache = LLMResponseCache()
@@ -1,5 +1,10 @@
-from typing import Optional
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Set, Tuple
 from .base import BaseAIProvider
+from .cache import response_cache
 from .deepseek import DeepSeekProvider
 from .openai import OpenAIProvider
 from .iflow import IFlowProvider
@@ -15,18 +20,33 @@ class AIProviderFactory:
         'iflow': IFlowProvider
     }
     
+    # 按 (provider, api_key 的哈希, model) 缓存实例，Celery worker 和聊天请求复用已建立的连接；
+    # 按最近使用顺序最多保留 MAX_INSTANCES 个，密钥轮换或新用户密钥不会让实例无限增长
+    MAX_INSTANCES = 32
+    _instances: "OrderedDict[Tuple[str, str, Optional[str]], BaseAIProvider]" = OrderedDict()
+    _instances_lock = threading.Lock()
+    # 被淘汰但在其他事件循环上还有连接池的实例，由各循环结束前的 aclose_all 关闭
+    _retired: List[BaseAIProvider] = []
+    _closing: Set[asyncio.Task] = set()
+    
     @classmethod
     def register(cls, name: str, provider_class: type):
         """注册新的Provider"""
         cls._providers[name] = provider_class
     
     @classmethod
-    def create(cls, provider_name: Optional[str] = None, api_key: Optional[str] = None) -> BaseAIProvider:
-        """创建Provider实例
+    def create(
+        cls,
+        provider_name: Optional[str] = None,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> BaseAIProvider:
+        """获取Provider实例（同一配置复用缓存的实例）
         
         Args:
-            provider_name: AI服务商名称 (deepseek/openai)
+            provider_name: AI服务商名称 (deepseek/openai/iflow)
             api_key: 用户提供的API密钥，如果不提供则使用系统配置
+            model: 模型名称，不提供则使用Provider默认模型
         """
         name = provider_name or settings.AI_PROVIDER
         
@@ -39,34 +59,95 @@ class AIProviderFactory:
             key = api_key or settings.DEEPSEEK_API_KEY
             if not key:
                 raise ValueError("未配置DEEPSEEK_API_KEY")
-            return provider_class(
+            kwargs = dict(
                 api_key=key,
-                base_url=settings.DEEPSEEK_BASE_URL
+                base_url=settings.DEEPSEEK_BASE_URL,
+                model=model
             )
         elif name == 'openai':
             key = api_key or settings.OPENAI_API_KEY
             if not key:
                 raise ValueError("未配置OPENAI_API_KEY")
-            return provider_class(
-                api_key=key
+            kwargs = dict(
+                api_key=key,
+                model=model
             )
         elif name == 'iflow':
             key = api_key or getattr(settings, 'IFLOW_API_KEY', None)
             if not key:
                 raise ValueError("未配置IFLOW_API_KEY")
-            return provider_class(
+            kwargs = dict(
                 api_key=key,
-                base_url=getattr(settings, 'IFLOW_BASE_URL', None)
+                base_url=getattr(settings, 'IFLOW_BASE_URL', None),
+                model=model
             )
         else:
             raise ValueError(f"未配置 {name} Provider的初始化逻辑")
+        
+        # 批量分析的打包篇数，未配置时使用 Provider 的默认值
+        kwargs['batch_size'] = settings.AI_ANALYSIS_BATCH_SIZES.get(name)
+        
+        cache_key = (name, hashlib.sha256(key.encode("utf-8")).hexdigest(), model)
+        evicted: List[BaseAIProvider] = []
+        with cls._instances_lock:
+            provider = cls._instances.get(cache_key)
+            if provider is None:
+                provider = provider_class(**kwargs)
+                cls._instances[cache_key] = provider
+                while len(cls._instances) > cls.MAX_INSTANCES:
+                    evicted.append(cls._instances.popitem(last=False)[1])
+                cls._retired.extend(evicted)
+            else:
+                cls._instances.move_to_end(cache_key)
+        for old in evicted:
+            cls._close_evicted(old)
+        return provider
+    
+    @classmethod
+    def _close_evicted(cls, provider: BaseAIProvider) -> None:
+        """在当前事件循环上异步关闭被淘汰实例的连接池（没有运行中的循环时留给 aclose_all）"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(provider.aclose())
+        cls._closing.add(task)
+        task.add_done_callback(cls._closing.discard)
+    
+    @classmethod
+    async def aclose_all(cls):
+        """关闭所有缓存实例在当前事件循环上的连接池（事件循环结束前调用）"""
+        with cls._instances_lock:
+            providers = list(cls._instances.values()) + cls._retired
+        for provider in providers:
+            try:
+                await provider.aclose()
+            except Exception as e:
+                print(f"[ai] Failed to close http client for {provider.model_name}: {e}")
+        for provider_class in set(cls._providers.values()):
+            test_http = getattr(provider_class, '_test_http', None)
+            if test_http is not None:
+                await test_http.aclose()
+        with cls._instances_lock:
+            cls._retired = [provider for provider in cls._retired if provider._http.has_clients]
+        await response_cache.aclose()
 
 
-def get_ai_provider(provider_name: Optional[str] = None, api_key: Optional[str] = None) -> BaseAIProvider:
+def get_ai_provider(
+    provider_name: Optional[str] = None,
+    api_key: Optional[str] = None,
+    model: Optional[str] = None
+) -> BaseAIProvider:
     """获取AI Provider实例
     
     Args:
         provider_name: AI服务商名称
         api_key: 用户提供的API密钥
+        model: 模型名称
     """
-    return AIProviderFactory.create(provider_name, api_key)
+    return AIProviderFactory.create(provider_name, api_key, model)
+
+
+async def close_ai_providers():
+    """释放当前事件循环上所有 AI Provider 的 HTTP 连接"""
+    await AIProviderFactory.aclose_all()
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+import weakref
+from typing import AsyncIterator, Dict, Optional
+import httpx
+
+from app.core.config import settings
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class PooledAsyncClient:
+    """长连接复用的 httpx.AsyncClient 持有者
+
+    AsyncClient 的连接池绑定在创建它的事件循环上，而 Celery 任务每次都会新建事件循环，
+    因此按事件循环各保留一个客户端：同一循环内的所有请求复用 keep-alive 连接（可用时走 HTTP/2），
+    循环结束前调用 aclose() 释放。
+    """
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None, timeout: float = 60.0):
+        self.headers = headers or {}
+        self.timeout = timeout
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def get(self) -> httpx.AsyncClient:
+        """获取当前事件循环上的客户端（不存在或已关闭时创建）"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    headers=self.headers,
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.AI_HTTP_MAX_KEEPALIVE,
+                        keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY
+                    ),
+                    http2=HTTP2_AVAILABLE
+                )
+                self._clients[loop] = client
+            return client
+
+    @property
+    def has_clients(self) -> bool:
+        """是否还有未释放的客户端（所在事件循环被回收后自动移除）"""
+        with self._lock:
+            return len(self._clients) > 0
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环上的客户端"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        with self._lock:
+            client = self._clients.pop(loop, None)
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+
+async def iter_sse_deltas(response: httpx.Response) -> AsyncIterator[str]:
+    """解析 OpenAI 兼容接口的流式响应（stream=True），逐个产出 choices[0].delta.content
+
+    兼容 "data: {...}" 和 "data:{...}" 两种格式，忽略空行、注释行（如 ": keep-alive"）和 event 行；
+    aiter_lines 使用增量解码，多字节字符跨网络分片也不会被截断。收到 [DONE] 时结束，事件带 error 时抛出异常。
+    """
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data_str = line[5:].strip()
+        if not data_str:
+            continue
+        if data_str == "[DONE]":
+            return
+        try:
+            data = json.loads(data_str)
+        except json.JSONDecodeError:
+            continue
+        if data.get("error"):
+            raise RuntimeError(f"流式响应返回错误: {data['error']}")
+        choices = data.get("choices")
+        if choices:
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
@@ -136,3 +136,81 @@ def build_analysis_prompt(input_data: dict) -> str:
         problem_metrics='、'.join(problem_metrics) if problem_metrics else '无',
         compare_to_avg=', '.join([f"{k}: {v}" for k, v in compare_to_avg.items()]) if compare_to_avg else '无数据'
     )
+
+
+BATCH_ANALYSIS_PROMPT_TEMPLATE = """下面有 {count} 篇内容，请逐篇深度分析，找出问题并给出可落地的优化方案。
+每篇内容相互独立，分析时不要混用其他篇的信息。
+
+{items}
+
+---
+
+请输出一个 JSON 数组，按编号顺序每篇一个对象，共 {count} 个，id 与上面的编号一致：
+
+```json
+[
+    {{
+        "id": "1",
+        "summary": "用1句话概括这篇内容的核心问题或亮点（限30字）",
+        "strengths": ["具体优点1", "具体优点2"],
+        "weaknesses": ["具体问题1", "具体问题2"],
+        "suggestions": ["具体建议1（可操作）", "具体建议2（可操作）", "具体建议3（可操作）"]
+    }}
+]
+```
+
+要求：
+- 只输出这个 JSON 数组，不要输出其他内容
+- strengths/weaknesses 各1-3条，没有就输出空数组
+- suggestions 必须3-5条，每条都要具体可执行
+- 只提供了数据的内容，不要编造标题/正文/画面细节"""
+
+BATCH_ITEM_TEMPLATE = """## 内容 {item_id}
+- 内容形式：{content_type}
+- 发文类型：{post_type}
+- 款式/产品：{style_info}
+- 标题：{content_title}
+- 正文：{content_text}
+- 配图数量：{image_count}张
+- 整体评级：{performance}
+- 表现好的指标：{highlight_metrics}
+- 表现差的指标：{problem_metrics}
+- 具体对比：{compare_to_avg}"""
+
+
+def build_batch_analysis_prompt(items: list) -> str:
+    """构建多篇纯文本笔记的批量分析Prompt
+
+    Args:
+        items: [(编号, input_data), ...]，编号原样出现在提示词和响应的 id 字段中
+    """
+    sections = []
+    for item_id, input_data in items:
+        content_desc = input_data.get('content_description', {})
+        analysis_result = input_data.get('analysis_result', {})
+
+        highlight_metrics = analysis_result.get('highlight_metrics', [])
+        problem_metrics = analysis_result.get('problem_metrics', [])
+        compare_to_avg = analysis_result.get('compare_to_avg', {})
+
+        content_text = content_desc.get('content_text') or ''
+        if isinstance(content_text, str) and len(content_text) > 500:
+            content_text = content_text[:500] + '...'
+        image_urls = content_desc.get('image_urls') or []
+        image_count = len(image_urls) if image_urls else (1 if content_desc.get('cover_image') else 0)
+
+        sections.append(BATCH_ITEM_TEMPLATE.format(
+            item_id=item_id,
+            content_type=content_desc.get('content_type') or '未知',
+            post_type=content_desc.get('post_type') or '未知',
+            style_info=content_desc.get('style_info') or '无',
+            content_title=content_desc.get('content_title') or '无',
+            content_text=content_text.replace('\n', ' ') or '无',
+            image_count=image_count,
+            performance=analysis_result.get('performance', '未知'),
+            highlight_metrics='、'.join(highlight_metrics) if highlight_metrics else '无',
+            problem_metrics='、'.join(problem_metrics) if problem_metrics else '无',
+            compare_to_avg=', '.join([f"{k}: {v}" for k, v in compare_to_avg.items()]) if compare_to_avg else '无数据'
+        ))
+
+    return BATCH_ANALYSIS_PROMPT_TEMPLATE.format(count=len(items), items='\n\n'.join(sections))
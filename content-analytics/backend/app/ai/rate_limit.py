@@ -0,0 +1,37 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """令牌桶限流器 - 控制对同一 AI 服务的请求速率
+
+    令牌以 rate_per_minute / 60 的速度补充，最多积攒 burst 个；
+    令牌不足时预约下一个令牌并等待，多个协程按调用顺序依次放行。
+    预约过程不跨 await，且用线程锁保护，可在多个事件循环/线程间共享同一实例。
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """预约一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    async def acquire(self) -> float:
+        """获取一个令牌（必要时等待），返回实际等待的秒数"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
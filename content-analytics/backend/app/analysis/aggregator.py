@@ -1,8 +1,20 @@
+import hashlib
 import pandas as pd
 from typing import Dict, List, Any
 from .processor import DataProcessor
 from .calculator import MetricsCalculator
 from .anomaly import AnomalyDetector
+from .scorer import VectorizedScorer
+
+
+# 参与评分的笔记字段，任一字段变化都可能改变该笔记的分析结果
+ANALYSIS_INPUT_FIELDS = ('content_type', 'post_type', 'style_info', *MetricsCalculator.METRIC_NAMES)
+
+
+def metrics_hash(post: Any) -> str:
+    """笔记评分输入的摘要，写入 result_data['metrics_hash']，增量重分析据此判断笔记是否变化"""
+    values = [getattr(post, field, None) for field in ANALYSIS_INPUT_FIELDS]
+    return hashlib.blake2b(repr(values).encode('utf-8'), digest_size=16).hexdigest()
 
 
 class AnalysisAggregator:
@@ -14,6 +26,7 @@ class AnalysisAggregator:
         self.processed_df = None
         self.calculator = None
         self.detector = None
+        self.scorer = None
         self.stats = None
     
     def prepare(self) -> 'AnalysisAggregator':
@@ -22,6 +35,7 @@ class AnalysisAggregator:
         self.calculator = MetricsCalculator(self.processed_df)
         self.stats = self.calculator.calculate_basic_stats()
         self.detector = AnomalyDetector(self.stats)
+        self.scorer = VectorizedScorer(self.processed_df, self.calculator, self.detector)
         return self
     
     def analyze_single_post(self, row: pd.Series) -> Dict[str, Any]:
@@ -47,7 +61,14 @@ class AnalysisAggregator:
         }
     
     def analyze_all(self) -> List[Dict[str, Any]]:
-        """分析所有笔记"""
+        """分析所有笔记（向量化批量计算）"""
+        if self.processed_df is None:
+            self.prepare()
+        
+        return self.scorer.score_all()
+    
+    def analyze_all_rowwise(self) -> List[Dict[str, Any]]:
+        """逐行分析所有笔记（参考实现，用于校验向量化结果）"""
         if self.processed_df is None:
             self.prepare()
         
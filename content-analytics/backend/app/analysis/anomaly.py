@@ -17,6 +17,27 @@ class AnomalyDetector:
         'want_14d': '14天好物想要'
     }
     
+    # 综合考虑 7 天 + 14 天指标，按重要性加权
+    PRIMARY_METRICS = [
+        ('read_7d', 1.0),
+        ('read_14d', 1.0),
+        ('interact_7d', 1.0),
+        ('interact_14d', 1.0),
+        ('visit_7d', 0.8),
+        ('visit_14d', 0.8),
+        ('want_7d', 0.8),
+        ('want_14d', 0.8),
+    ]
+    
+    # 整体表现评级阈值（加权中位数比值下限, 评级），按从高到低排列
+    PERFORMANCE_LEVELS = [
+        (1.3, "优秀"),
+        (0.9, "正常"),
+        (0.5, "偏低"),
+    ]
+    DEFAULT_PERFORMANCE = "正常"
+    LOWEST_PERFORMANCE = "较差"
+    
     def __init__(
         self, 
         stats: Dict[str, Dict[str, float]],
@@ -73,17 +94,7 @@ class AnomalyDetector:
         综合考虑阅读、互动、转化指标
         """
         if primary_metrics is None:
-            # 综合考虑 7 天 + 14 天指标，按重要性加权
-            primary_metrics = [
-                ('read_7d', 1.0),
-                ('read_14d', 1.0),
-                ('interact_7d', 1.0),
-                ('interact_14d', 1.0),
-                ('visit_7d', 0.8),
-                ('visit_14d', 0.8),
-                ('want_7d', 0.8),
-                ('want_14d', 0.8),
-            ]
+            primary_metrics = self.PRIMARY_METRICS
         
         weighted_scores = []
         total_weight = 0
@@ -112,18 +123,14 @@ class AnomalyDetector:
             total_weight += weight
         
         if not weighted_scores or total_weight == 0:
-            return "正常"
+            return self.DEFAULT_PERFORMANCE
         
         avg_score = sum(weighted_scores) / total_weight
         
-        if avg_score >= 1.3:
-            return "优秀"
-        elif avg_score >= 0.9:
-            return "正常"
-        elif avg_score >= 0.5:
-            return "偏低"
-        else:
-            return "较差"
+        for threshold, level in self.PERFORMANCE_LEVELS:
+            if avg_score >= threshold:
+                return level
+        return self.LOWEST_PERFORMANCE
     
     def find_top_n(
         self, 
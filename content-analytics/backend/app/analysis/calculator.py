@@ -20,15 +20,18 @@ class MetricsCalculator:
     def __init__(self, df: pd.DataFrame):
         self.df = df
         self.stats = {}
+        # 各指标去空值后的升序数组，用于二分查找百分位排名
+        self.sorted_values: Dict[str, np.ndarray] = {}
     
     def calculate_basic_stats(self) -> Dict[str, Dict[str, float]]:
-        """计算基础统计量"""
+        """计算基础统计量（同时构建百分位排名的有序索引）"""
         metrics = list(self.METRIC_NAMES.keys())
         
         for metric in metrics:
             if metric in self.df.columns:
                 series = self.df[metric].dropna()
                 if len(series) > 0:
+                    self.sorted_values[metric] = np.sort(series.to_numpy(dtype=np.float64))
                     self.stats[metric] = {
                         'mean': float(series.mean()),
                         'median': float(series.median()),
@@ -98,9 +101,24 @@ class MetricsCalculator:
         
         for metric in self.stats.keys():
             if metric in row and pd.notna(row[metric]):
-                value = row[metric]
-                series = self.df[metric].dropna()
-                rank = (series < value).mean() * 100
+                sorted_values = self.sorted_values[metric]
+                below = np.searchsorted(sorted_values, row[metric], side='left')
+                rank = below / len(sorted_values) * 100
                 ranks[metric] = round(rank, 1)
         
         return ranks
+    
+    def get_percentile_ranks_batch(self, metric: str, values: Any) -> np.ndarray:
+        """批量获取一整列的百分位排名
+        
+        排名定义与 get_percentile_rank 相同（严格小于该值的占比），
+        空值或无统计数据的指标返回 NaN。
+        """
+        values = np.asarray(values, dtype=np.float64)
+        sorted_values = self.sorted_values.get(metric)
+        if sorted_values is None or len(sorted_values) == 0:
+            return np.full(values.shape, np.nan)
+        
+        below = np.searchsorted(sorted_values, values, side='left')
+        ranks = np.round(below / len(sorted_values) * 100, 1)
+        return np.where(np.isnan(values), np.nan, ranks)
@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator
 from datetime import datetime
+from pandas.io.parsers import TextParser
 
 
 class DataProcessor:
@@ -114,8 +115,43 @@ class DataProcessor:
         self.processed_df = self.df
         return self.processed_df
     
+    def to_columns(self) -> Dict[str, List[Any]]:
+        """按列导出原生 Python 值，NaN/NaT 按列统一转换为 None"""
+        if self.processed_df is None:
+            self.process()
+        
+        columns = {}
+        for col in self.processed_df.columns:
+            series = self.processed_df[col]
+            # tolist() 直接从底层数组得到原生 int/float/str/Timestamp
+            values = series.tolist()
+            missing = series.isna().to_numpy()
+            if missing.any():
+                values = [None if is_missing else val for val, is_missing in zip(values, missing)]
+            columns[col] = values
+        return columns
+    
+    def to_tuples(self, columns: Optional[List[str]] = None) -> List[tuple]:
+        """转换为元组列表（按 columns 顺序，缺失的列为 None），可直接用于批量插入"""
+        values = self.to_columns()
+        if columns is None:
+            columns = list(values.keys())
+        row_count = len(self.processed_df)
+        if not columns:
+            return [()] * row_count
+        empty = [None] * row_count
+        return list(zip(*(values.get(col, empty) for col in columns)))
+    
     def to_records(self) -> List[Dict[str, Any]]:
         """转换为记录列表"""
+        values = self.to_columns()
+        if not values:
+            return [{} for _ in range(len(self.processed_df))]
+        columns = list(values.keys())
+        return [dict(zip(columns, row)) for row in zip(*values.values())]
+    
+    def to_records_rowwise(self) -> List[Dict[str, Any]]:
+        """逐行转换为记录列表（参考实现，用于校验按列转换的结果）"""
         if self.processed_df is None:
             self.process()
         
@@ -133,3 +169,169 @@ class DataProcessor:
             records.append(record)
         
         return records
+
+
+class ExcelChunkReader:
+    """Excel 流式读取器 - 以 openpyxl 只读模式按行块产出 DataFrame
+
+    内存中只保留当前行块，而不是整张工作表。单元格转换、表头命名（空表头为
+    'Unnamed: N'，重复表头追加 '.1' 后缀）和空值识别都复用 pandas 的 Excel
+    读取逻辑，每个行块的结果与 pd.read_excel 读出的对应行一致；末尾的空行被忽略。
+    .xls 旧格式 openpyxl 无法读取，回退为 pd.read_excel 后按块切分。
+    """
+
+    def __init__(self, file_path: str, chunk_size: int = 2000):
+        self.file_path = str(file_path)
+        self.chunk_size = max(1, chunk_size)
+        self.columns: List[Any] = []
+        self.total_rows: Optional[int] = None  # 工作表声明的数据行数（估计值）
+        self._header: List[Any] = []
+        self._workbook = None
+        self._rows = None
+        self._df: Optional[pd.DataFrame] = None
+
+    def __enter__(self) -> 'ExcelChunkReader':
+        return self.open()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def open(self) -> 'ExcelChunkReader':
+        """打开文件并读取表头"""
+        if self.file_path.lower().endswith('.xls'):
+            self._df = pd.read_excel(self.file_path)
+            self.columns = list(self._df.columns)
+            self.total_rows = len(self._df)
+            return self
+
+        import openpyxl
+        self._workbook = openpyxl.load_workbook(
+            self.file_path, read_only=True, data_only=True, keep_links=False
+        )
+        # 与 pd.read_excel 默认的 sheet_name=0 一致，读取第一个工作表
+        sheet = self._workbook.worksheets[0]
+        self._rows = sheet.iter_rows()
+        self._header = self._convert_row(next(self._rows, ()))
+        if self._header:
+            self.columns = list(self._parse([]).columns)
+        if sheet.max_row:
+            self.total_rows = max(0, sheet.max_row - 1)
+        return self
+
+    def close(self) -> None:
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+        self._rows = None
+        self._df = None
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        if self._df is not None:
+            for start in range(0, len(self._df), self.chunk_size):
+                yield self._df.iloc[start:start + self.chunk_size]
+            return
+        if self._rows is None or not self._header:
+            return
+
+        chunk: List[List[Any]] = []
+        # 连续空行先暂存，后面还有数据时才输出（pandas 会丢弃末尾的空行）
+        blank_rows: List[List[Any]] = []
+        for row in self._rows:
+            values = self._convert_row(row)
+            if not values:
+                blank_rows.append(values)
+                continue
+            if blank_rows:
+                chunk.extend(blank_rows)
+                blank_rows = []
+            chunk.append(values)
+            if len(chunk) >= self.chunk_size:
+                yield self._parse(chunk)
+                chunk = []
+        if chunk:
+            yield self._parse(chunk)
+
+    def _parse(self, rows: List[List[Any]]) -> pd.DataFrame:
+        """用 pandas 的 TextParser 把原始行转换为 DataFrame（类型推断、空值识别同 read_excel）"""
+        width = len(self._header)
+        data = [self._header] + [
+            row[:width] + [''] * (width - len(row)) for row in rows
+        ]
+        return TextParser(data, header=0).read()
+
+    @staticmethod
+    def _convert_row(row) -> List[Any]:
+        """转换单元格取值（同 pandas 的 openpyxl 读取器），并去除行尾空单元格"""
+        from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+        values: List[Any] = []
+        for cell in row:
+            value = cell.value
+            if value is None:
+                values.append('')
+            elif cell.data_type == TYPE_ERROR:
+                values.append(np.nan)
+            elif cell.data_type == TYPE_NUMERIC:
+                as_int = int(value)
+                values.append(as_int if as_int == value else float(value))
+            else:
+                values.append(value)
+        while values and values[-1] == '':
+            values.pop()
+        return values
+
+
+class ChunkValidator:
+    """分块数据校验器 - 逐块累计 DataProcessor.validate 的检查结果
+
+    表头缺少必要列时在读取任何数据之前即可判定失败；
+    重复 data_id 与空值数量跨块累计，最终结果与整表校验一致。
+    """
+
+    def __init__(self, columns: List[Any]):
+        self.columns = list(columns)
+        self.errors: List[str] = []
+        if 'data_id' not in self.columns:
+            self.errors.append("缺少必要列: data_id")
+        self._seen_ids: set = set()
+        self._has_null_id = False
+        self.duplicates = 0
+        self.null_counts: Dict[str, int] = {
+            col: 0 for col in DataProcessor.NUMERIC_COLUMNS if col in self.columns
+        }
+        self.row_count = 0
+
+    @property
+    def valid(self) -> bool:
+        return len(self.errors) == 0
+
+    def update(self, df: pd.DataFrame) -> None:
+        """累计一个原始行块（重命名之前）的检查结果"""
+        self.row_count += len(df)
+        if 'data_id' in df.columns:
+            for value in df['data_id'].tolist():
+                # duplicated() 把所有空值视为同一个值
+                if pd.isna(value):
+                    if self._has_null_id:
+                        self.duplicates += 1
+                    self._has_null_id = True
+                elif value in self._seen_ids:
+                    self.duplicates += 1
+                else:
+                    self._seen_ids.add(value)
+        for col in self.null_counts:
+            self.null_counts[col] += int(df[col].isna().sum())
+
+    def result(self) -> Dict[str, Any]:
+        warnings = []
+        if self.duplicates > 0:
+            warnings.append(f"发现 {self.duplicates} 条重复的data_id")
+        for col, null_count in self.null_counts.items():
+            if null_count > 0:
+                warnings.append(f"列 {col} 有 {null_count} 个空值")
+        return {
+            "valid": self.valid,
+            "errors": list(self.errors),
+            "warnings": warnings,
+            "row_count": self.row_count
+        }
@@ -0,0 +1,161 @@
+import pandas as pd
+import numpy as np
+from typing import Dict, List, Any
+from .calculator import MetricsCalculator
+from .anomaly import AnomalyDetector
+
+
+class VectorizedScorer:
+    """向量化评分器 - 对整个数据集按列一次性计算分析结果
+
+    与 AnalysisAggregator.analyze_single_post 的逐行结果保持一致，
+    但亮点/问题判断、整体表现、均值对比和百分位排名都以 NumPy 数组运算完成，
+    避免 iterrows + 逐指标的 Python 循环。
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        calculator: MetricsCalculator,
+        detector: AnomalyDetector
+    ):
+        self.df = df
+        self.calculator = calculator
+        self.detector = detector
+        self.stats = calculator.stats
+        # 与逐行路径相同的指标顺序（即 stats 的插入顺序）
+        self.metrics = [m for m in self.stats.keys() if m in df.columns]
+        self._values = {
+            metric: df[metric].to_numpy(dtype=np.float64, na_value=np.nan)
+            for metric in self.metrics
+        }
+
+    def _valid(self, metric: str) -> np.ndarray:
+        return ~np.isnan(self._values[metric])
+
+    def score_anomalies(self) -> Dict[str, np.ndarray]:
+        """计算亮点/问题标记矩阵，形状为 (行数, 指标数)"""
+        n = len(self.df)
+        highlights = np.zeros((n, len(self.metrics)), dtype=bool)
+        problems = np.zeros((n, len(self.metrics)), dtype=bool)
+
+        for j, metric in enumerate(self.metrics):
+            values = self._values[metric]
+            valid = self._valid(metric)
+            stat = self.stats[metric]
+            median = stat.get('median', 0)
+            q75 = stat.get('q75', median)
+            q25 = stat.get('q25', median)
+
+            is_highlight = valid & (values > q75) & (q75 > 0)
+            is_problem = valid & ~is_highlight & (
+                ((values < q25) & (median >= 1)) | ((values == 0) & (median > 0))
+            )
+            highlights[:, j] = is_highlight
+            problems[:, j] = is_problem
+
+        return {'highlight': highlights, 'problem': problems}
+
+    def score_performance(self) -> np.ndarray:
+        """计算整体表现评级（加权中位数比值）"""
+        n = len(self.df)
+        weighted_sum = np.zeros(n, dtype=np.float64)
+        total_weight = np.zeros(n, dtype=np.float64)
+
+        # 按指标顺序逐列累加，保证浮点求和顺序与逐行路径一致
+        for metric, weight in self.detector.PRIMARY_METRICS:
+            if metric not in self.stats or metric not in self._values:
+                continue
+            median = self.stats[metric]['median']
+            if median == 0:
+                continue
+            values = self._values[metric]
+            valid = self._valid(metric)
+            weighted_sum += np.where(valid, (values / median) * weight, 0.0)
+            total_weight += np.where(valid, weight, 0.0)
+
+        has_score = total_weight > 0
+        avg_score = np.divide(
+            weighted_sum, total_weight,
+            out=np.zeros(n, dtype=np.float64),
+            where=has_score
+        )
+
+        conditions = [has_score & (avg_score >= threshold) for threshold, _ in self.detector.PERFORMANCE_LEVELS]
+        choices = [level for _, level in self.detector.PERFORMANCE_LEVELS]
+        performance = np.select(conditions, choices, default=self.detector.LOWEST_PERFORMANCE)
+        return np.where(has_score, performance, self.detector.DEFAULT_PERFORMANCE)
+
+    def score_compare(self, baseline: str = 'mean') -> Dict[str, np.ndarray]:
+        """计算各指标相对基准的百分比差异，无效位置为 NaN"""
+        diffs = {}
+        for metric in self.metrics:
+            base_value = self.stats[metric][baseline]
+            if base_value == 0:
+                continue
+            values = self._values[metric]
+            diffs[metric] = ((values - base_value) / base_value) * 100
+        return diffs
+
+    def score_percentile_ranks(self) -> Dict[str, np.ndarray]:
+        """计算各指标的百分位排名（严格小于当前值的占比），无效位置为 NaN"""
+        return {
+            metric: self.calculator.get_percentile_ranks_batch(metric, self._values[metric])
+            for metric in self.metrics
+            if metric in self.calculator.sorted_values
+        }
+
+    def score_all(self) -> List[Dict[str, Any]]:
+        """计算所有笔记的结构化分析结果"""
+        n = len(self.df)
+        if n == 0:
+            return []
+
+        anomalies = self.score_anomalies()
+        performance = self.score_performance().tolist()
+        compare = self.score_compare('mean')
+        percentile = self.score_percentile_ranks()
+
+        metric_names = [self.detector.METRIC_NAMES.get(m, m) for m in self.metrics]
+        highlight_rows = anomalies['highlight'].tolist()
+        problem_rows = anomalies['problem'].tolist()
+
+        compare_items = [
+            (self.calculator.METRIC_NAMES[m], self._format_diffs(compare[m]))
+            for m in self.metrics if m in compare
+        ]
+        rank_items = [
+            (m, percentile[m].tolist(), self._valid(m).tolist())
+            for m in self.metrics if m in percentile
+        ]
+
+        data_ids = self.df['data_id'].tolist() if 'data_id' in self.df.columns else [None] * n
+        row_indexes = self.df.index.tolist()
+
+        results = []
+        for i in range(n):
+            highlight_flags = highlight_rows[i]
+            problem_flags = problem_rows[i]
+            results.append({
+                'performance': performance[i],
+                'problem_metrics': [name for name, flag in zip(metric_names, problem_flags) if flag],
+                'highlight_metrics': [name for name, flag in zip(metric_names, highlight_flags) if flag],
+                'compare_to_avg': {
+                    name: texts[i] for name, texts in compare_items if texts[i] is not None
+                },
+                'percentile_ranks': {
+                    metric: ranks[i] for metric, ranks, valid in rank_items if valid[i]
+                },
+                'data_id': data_ids[i],
+                'row_index': row_indexes[i]
+            })
+
+        return results
+
+    @staticmethod
+    def _format_diffs(diffs: np.ndarray) -> List[Any]:
+        """格式化百分比差异（与 MetricsCalculator.compare_to_baseline 的文本一致）"""
+        return [
+            None if d != d else (f"+{d:.0f}%" if d > 0 else f"{d:.0f}%")
+            for d in diffs.tolist()
+        ]
@@ -0,0 +1,158 @@
+"""SSE 推送工具
+
+- 任务进度事件流（数据集 / 分析任务 / 导出共用）：连接建立时只做一次鉴权和归属查询，
+  之后的状态、进度、阶段变化全部来自 Redis 发布订阅，看板开着不会再产生任何数据库查询；
+  任务进入终态后推送最后一条事件并结束响应。Redis 不可用时退回为低频查询数据库。
+- 对话流式回复的分片合并：把上游的细碎 token 按时间窗口 / 字节数合并后再编码发送。
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional
+
+import anyio
+from fastapi.responses import StreamingResponse
+
+from app.services.progress_channel import progress_channel, progress_events
+from app.utils.fast_json import dumps
+
+# 没有事件时发送注释行保活的间隔（秒），同时从进度哈希补齐可能错过的事件
+HEARTBEAT_SECONDS = 15.0
+# Redis 不可用时查询数据库的间隔（秒）
+FALLBACK_POLL_SECONDS = 3.0
+# 对话回复分片合并：缓冲超过这个时间（秒）或字节数即发送
+COALESCE_INTERVAL_SECONDS = 0.03
+COALESCE_MAX_BYTES = 256
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"  # 禁用nginx缓冲
+}
+
+SnapshotLoader = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def sse_event(data: Dict[str, Any]) -> str:
+    """编码一条 SSE 消息"""
+    return f"data: {dumps(data)}\n\n"
+
+
+def _merge(state: Dict[str, Any], event: Dict[str, Any]) -> bool:
+    """把事件中的字段合并到当前状态（事件只包含本次变化的字段），有变化时返回 True"""
+    changed = False
+    for name, value in event.items():
+        if state.get(name) != value:
+            state[name] = value
+            changed = True
+    return changed
+
+
+def progress_event_response(
+    kind: str,
+    object_id,
+    snapshot: Dict[str, Any],
+    terminal_statuses: Iterable[str],
+    load_snapshot: SnapshotLoader
+) -> StreamingResponse:
+    """创建进度事件流
+
+    snapshot 为连接时从数据库读出的状态（id / status / progress / error_message），
+    load_snapshot 在 Redis 不可用时用独立会话重新读取同样结构的状态。
+    每条事件都是合并后的完整状态: data: {"type": "state", "id", "status", "progress", "phase", "error_message"}
+    """
+    terminal = set(terminal_statuses)
+
+    async def generate():
+        # 先订阅再读取进度哈希，读取之后发布的事件不会丢失
+        queue = progress_events.subscribe(kind, object_id)
+        try:
+            state = {"type": "state", "phase": None, **snapshot}
+            if state["status"] not in terminal:
+                # 数据库快照之后任务可能已经切换过状态，以进度哈希中的最新值为准
+                _merge(state, await progress_channel.get_state(kind, object_id))
+            yield sse_event(state)
+
+            while state["status"] not in terminal:
+                timeout = HEARTBEAT_SECONDS if progress_channel.enabled else FALLBACK_POLL_SECONDS
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    if progress_channel.enabled:
+                        event = await progress_channel.get_state(kind, object_id)
+                    else:
+                        event = await load_snapshot()
+                        if event is None:
+                            # 记录已被删除
+                            return
+                    if not _merge(state, event):
+                        yield ": keepalive\n\n"
+                        continue
+                else:
+                    if not _merge(state, event):
+                        continue
+                yield sse_event(state)
+        finally:
+            progress_events.unsubscribe(kind, object_id, queue)
+
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+async def coalesce_chunks(
+    source: AsyncIterator[str],
+    interval: float = COALESCE_INTERVAL_SECONDS,
+    max_bytes: int = COALESCE_MAX_BYTES
+) -> AsyncIterator[str]:
+    """合并上游的流式文本分片
+
+    第一个分片立即发出（不增加首字延迟），之后的分片缓冲到距缓冲开始超过 interval 秒
+    或累计超过 max_bytes 字节时合并发出，上游结束时发出剩余内容。
+    上游的下一个分片在独立任务中等待，这样即使上游停顿，缓冲也能按时发出。
+    本生成器被关闭或取消（如客户端断开）时会取消并关闭上游，上游的 HTTP 流随之关闭、不再继续生成。
+    """
+    loop = asyncio.get_running_loop()
+    iterator = source.__aiter__()
+    pending: Optional[asyncio.Future] = None
+    buffer: list = []
+    size = 0
+    deadline = 0.0
+    first = True
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            if buffer:
+                done, _ = await asyncio.wait({pending}, timeout=max(0.0, deadline - loop.time()))
+                if not done:
+                    yield "".join(buffer)
+                    buffer, size = [], 0
+                    continue
+            else:
+                await asyncio.wait({pending})
+            try:
+                chunk = pending.result()
+            except StopAsyncIteration:
+                pending = None
+                break
+            pending = None
+            if first:
+                first = False
+                yield chunk
+                continue
+            if not buffer:
+                deadline = loop.time() + interval
+            buffer.append(chunk)
+            size += len(chunk.encode("utf-8"))
+            if size >= max_bytes:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        # 客户端断开时 Starlette 会取消整个响应任务组，清理过程需屏蔽取消，否则每次 await 都会被再次打断
+        with anyio.CancelScope(shield=True):
+            if pending is not None and not pending.done():
+                # 上游正在等待下一个分片：取消后 CancelledError 沿上游生成器传播，HTTP 流在其中关闭
+                pending.cancel()
+                await asyncio.wait({pending})
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
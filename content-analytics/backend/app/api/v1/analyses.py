@@ -7,9 +7,9 @@ from sqlalchemy import select, func
 from sqlalchemy.orm import selectinload
 from typing import List, Optional
 
-from app.db.session import get_db
+from app.db.session import get_db, async_session_maker
 from app.models.user import User
-from app.models.dataset import Dataset
+from app.models.dataset import Dataset, DatasetStatus
 from app.models.analysis import Analysis, AnalysisStatus, AnalysisResult, AIOutput
 from app.schemas.analysis import (
     AnalysisCreate,
@@ -19,12 +19,20 @@ from app.schemas.analysis import (
 )
 from app.schemas.common import ResponseModel
 from app.api.deps import get_current_user
+from app.api.sse import progress_event_response
 from app.tasks.analysis_tasks import run_analysis_task, _run_analysis, run_async
 from app.tasks.ai_tasks import run_ai_analysis_task, _run_ai_analysis
 from app.tasks.celery_app import is_celery_available
+from app.services.progress_channel import progress_channel
+from app.tasks.progress import report_state
 
 router = APIRouter()
 
+# 运行中的状态：进度以 Redis 进度通道中的实时值为准
+RUNNING_STATUSES = (AnalysisStatus.ANALYZING, AnalysisStatus.AI_PROCESSING)
+# 进度事件流在这些状态下结束
+TERMINAL_STATUSES = (AnalysisStatus.COMPLETED.value, AnalysisStatus.FAILED.value)
+
 
 def _resolve_ai_status(analysis: Analysis, total_results: int, ai_outputs: int) -> Optional[str]:
     if analysis.status == AnalysisStatus.AI_PROCESSING:
@@ -63,10 +71,17 @@ async def _get_ai_counts(db: AsyncSession, analysis_ids: List[uuid.UUID]):
     return total_map, ai_map
 
 
+async def _get_live_progress(analyses: List[Analysis]) -> dict:
+    """运行中分析任务的实时进度 {str(id): progress}"""
+    running_ids = [a.id for a in analyses if a.status in RUNNING_STATUSES]
+    return await progress_channel.get_many("analysis", running_ids)
+
+
 def _to_analysis_response(
     analysis: Analysis,
     total_map: dict,
-    ai_map: dict
+    ai_map: dict,
+    live_progress: Optional[dict] = None
 ) -> AnalysisResponse:
     total = total_map.get(analysis.id, 0)
     ai_count = ai_map.get(analysis.id, 0)
@@ -75,7 +90,7 @@ def _to_analysis_response(
         dataset_id=analysis.dataset_id,
         name=analysis.name,
         status=analysis.status,
-        progress=analysis.progress,
+        progress=(live_progress or {}).get(str(analysis.id), analysis.progress),
         ai_status=_resolve_ai_status(analysis, total, ai_count),
         error_message=analysis.error_message,
         created_at=analysis.created_at,
@@ -161,7 +176,8 @@ async def list_analyses(
     analyses = result.scalars().all()
     analysis_ids = [a.id for a in analyses]
     total_map, ai_map = await _get_ai_counts(db, analysis_ids)
-    response_data = [_to_analysis_response(a, total_map, ai_map) for a in analyses]
+    live_progress = await _get_live_progress(analyses)
+    response_data = [_to_analysis_response(a, total_map, ai_map, live_progress) for a in analyses]
     return ResponseModel(data=response_data)
 
 
@@ -186,7 +202,8 @@ async def get_analysis(
         )
     
     total_map, ai_map = await _get_ai_counts(db, [analysis.id])
-    return ResponseModel(data=_to_analysis_response(analysis, total_map, ai_map))
+    live_progress = await _get_live_progress([analysis])
+    return ResponseModel(data=_to_analysis_response(analysis, total_map, ai_map, live_progress))
 
 
 @router.get("/{analysis_id}/results", response_model=ResponseModel[List[AnalysisResultResponse]])
@@ -256,6 +273,7 @@ async def get_analysis_results(
 @router.post("/{analysis_id}/ai", response_model=ResponseModel)
 async def trigger_ai_analysis(
     analysis_id: uuid.UUID,
+    force_refresh: bool = False,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -283,7 +301,10 @@ async def trigger_ai_analysis(
     analysis.status = AnalysisStatus.AI_PROCESSING
     analysis.progress = "0%"
     analysis.error_message = None
+    # force_refresh=true 时本次分析跳过AI响应缓存，重新请求模型
+    analysis.config = {**(analysis.config or {}), "ai_force_refresh": force_refresh}
     await db.commit()
+    await report_state(analysis, "analysis", reset=True)
     
     # 触发AI分析异步任务
     if is_celery_available():
@@ -306,6 +327,80 @@ async def trigger_ai_analysis(
     return ResponseModel(message="AI分析任务已触发")
 
 
+@router.post("/{analysis_id}/reanalyze", response_model=ResponseModel)
+async def reanalyze(
+    analysis_id: uuid.UUID,
+    dataset_id: Optional[uuid.UUID] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """增量重分析：只重写评分输入或等级/指标标记变化的结果
+
+    dataset_id 为重新上传后的数据集时，分析改为指向该数据集，新笔记按 data_id 与原分析结果对比；
+    不传时按原数据集当前数据重新评分。
+    """
+    result = await db.execute(
+        select(Analysis).where(
+            Analysis.id == analysis_id,
+            Analysis.user_id == current_user.id
+        )
+    )
+    analysis = result.scalar_one_or_none()
+    
+    if not analysis:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="分析任务不存在"
+        )
+    
+    if analysis.status in [AnalysisStatus.PENDING, AnalysisStatus.ANALYZING, AnalysisStatus.AI_PROCESSING]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="分析任务正在运行，无法重新分析"
+        )
+    
+    if dataset_id and dataset_id != analysis.dataset_id:
+        result = await db.execute(
+            select(Dataset).where(
+                Dataset.id == dataset_id,
+                Dataset.user_id == current_user.id
+            )
+        )
+        dataset = result.scalar_one_or_none()
+        if not dataset:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="数据集不存在"
+            )
+        if dataset.status != DatasetStatus.COMPLETED:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="数据集尚未解析完成，无法重新分析"
+            )
+        analysis.dataset_id = dataset.id
+    
+    analysis.status = AnalysisStatus.PENDING
+    analysis.progress = "0%"
+    analysis.error_message = None
+    await db.commit()
+    await report_state(analysis, "analysis", reset=True)
+    
+    if is_celery_available():
+        run_analysis_task.delay(str(analysis.id), incremental=True)
+        print(f"[analyses] Celery incremental task triggered for analysis {analysis.id}")
+    else:
+        print(f"[analyses] Celery not available, using background thread for incremental analysis {analysis.id}")
+        def run_analysis_thread(analysis_id):
+            try:
+                run_async(_run_analysis(analysis_id, use_thread_session=True, incremental=True))
+                print(f"[analyses] Background incremental analysis completed for {analysis_id}")
+            except Exception as ex:
+                print(f"[analyses] Background incremental analysis failed for {analysis_id}: {ex}")
+        Thread(target=run_analysis_thread, args=(str(analysis.id),), daemon=True).start()
+    
+    return ResponseModel(message="增量重分析任务已触发")
+
+
 @router.post("/{analysis_id}/stop", response_model=ResponseModel)
 async def stop_analysis(
     analysis_id: uuid.UUID,
@@ -338,10 +433,54 @@ async def stop_analysis(
     analysis.status = AnalysisStatus.FAILED
     analysis.error_message = "用户手动停止"
     await db.commit()
+    await report_state(analysis, "analysis")
     
     return ResponseModel(message="分析任务已停止")
 
 
+def _analysis_state(analysis: Analysis) -> dict:
+    return {
+        "id": str(analysis.id),
+        "status": analysis.status.value,
+        "progress": analysis.progress,
+        "error_message": analysis.error_message
+    }
+
+
+@router.get("/{analysis_id}/events")
+async def analysis_events(
+    analysis_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """分析任务进度事件流（SSE），推送状态 / 进度 / 阶段（scoring、saving、ai），完成或失败后结束
+
+    只在连接时查询一次数据库，不计算 AI 统计；收到终态事件后再调用详情接口刷新即可。
+    """
+    result = await db.execute(
+        select(Analysis).where(
+            Analysis.id == analysis_id,
+            Analysis.user_id == current_user.id
+        )
+    )
+    analysis = result.scalar_one_or_none()
+    
+    if not analysis:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="分析任务不存在"
+        )
+    
+    async def load_snapshot():
+        async with async_session_maker() as session:
+            current = await session.get(Analysis, analysis_id)
+            return _analysis_state(current) if current else None
+    
+    return progress_event_response(
+        "analysis", analysis.id, _analysis_state(analysis), TERMINAL_STATUSES, load_snapshot
+    )
+
+
 @router.delete("/{analysis_id}", response_model=ResponseModel)
 async def delete_analysis(
     analysis_id: uuid.UUID,
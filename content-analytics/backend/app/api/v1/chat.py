@@ -1,5 +1,5 @@
+import asyncio
 import uuid
-import json
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
@@ -10,6 +10,7 @@ from typing import Optional, List
 
 from app.db.session import get_db
 from app.api.deps import get_current_user
+from app.api.sse import SSE_HEADERS, coalesce_chunks, sse_event
 from app.models.user import User
 from app.models.user_settings import UserSettings
 from app.models.conversation import Conversation, ConversationMessage
@@ -257,26 +258,27 @@ async def send_message(
     
     async def generate_response():
         full_response = ""
+        chunk_count = 0
         
         try:
-            yield f"data: {json.dumps({'type': 'start'})}\n\n"
+            yield sse_event({'type': 'start'})
             
             print(f"[DEBUG] Starting chat_stream")
             print(f"[DEBUG] Messages count: {len(_messages_history)}")
             print(f"[DEBUG] Provider: {provider_model_name}")
             
-            chunk_count = 0
-            async for chunk in _ai_provider.chat_stream(
+            # 上游的细碎分片（原生流式为 token，逐字符回退时为单个字符）按时间窗口 / 字节数合并后再发送
+            async for chunk in coalesce_chunks(_ai_provider.chat_stream(
                 messages=_messages_history,
                 system_prompt=_system_prompt,
                 temperature=0.7,
                 max_tokens=2000
-            ):
+            )):
                 chunk_count += 1
                 full_response += chunk
-                yield f"data: {json.dumps({'type': 'chunk', 'content': chunk})}\n\n"
+                yield sse_event({'type': 'chunk', 'content': chunk})
             
-            print(f"[DEBUG] Received {chunk_count} chunks, total length: {len(full_response)}")
+            print(f"[DEBUG] Sent {chunk_count} chunks, total length: {len(full_response)}")
             
             # 在生成器中创建新的数据库会话来保存响应
             from app.db.session import async_session_maker
@@ -300,23 +302,24 @@ async def send_message(
                 
                 await save_db.commit()
             
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
+            yield sse_event({'type': 'done'})
             
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开：上游流已在 coalesce_chunks 中关闭，不再继续生成，未完成的回复不保存
+            print(f"[chat] Client disconnected after {chunk_count} chunks ({len(full_response)} chars), "
+                  f"upstream stream cancelled")
+            raise
         except Exception as e:
             import traceback
             error_msg = str(e)
             print(f"生成响应失败: {error_msg}")
             print(traceback.format_exc())
-            yield f"data: {json.dumps({'type': 'error', 'message': error_msg})}\n\n"
+            yield sse_event({'type': 'error', 'message': error_msg})
     
     return StreamingResponse(
         generate_response(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
-        }
+        headers=SSE_HEADERS
     )
 
 
@@ -7,18 +7,35 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from typing import List
 
-from app.db.session import get_db
+from app.db.session import get_db, async_session_maker
 from app.models.user import User
 from app.models.dataset import Dataset, DatasetStatus
 from app.schemas.dataset import DatasetResponse, DatasetList
 from app.schemas.common import ResponseModel
 from app.api.deps import get_current_user
+from app.api.sse import progress_event_response
 from app.core.config import settings
 from app.tasks.dataset_tasks import parse_dataset_task, _parse_dataset_impl, run_async_in_thread
 from app.tasks.celery_app import is_celery_available
+from app.services.progress_channel import progress_channel
 
 router = APIRouter()
 
+# 进度事件流在这些状态下结束
+TERMINAL_STATUSES = (DatasetStatus.COMPLETED.value, DatasetStatus.FAILED.value)
+
+
+async def _with_live_progress(datasets: List[Dataset]) -> List[DatasetResponse]:
+    """解析中的数据集改用 Redis 进度通道中的实时进度，其余直接使用数据库中的值"""
+    running_ids = [d.id for d in datasets if d.status == DatasetStatus.PROCESSING]
+    live_progress = await progress_channel.get_many("dataset", running_ids)
+    responses = []
+    for dataset in datasets:
+        response = DatasetResponse.model_validate(dataset)
+        response.progress = live_progress.get(str(dataset.id), response.progress)
+        responses.append(response)
+    return responses
+
 
 @router.post("/upload", response_model=ResponseModel[DatasetResponse])
 async def upload_dataset(
@@ -116,7 +133,7 @@ async def list_datasets(
     )
     datasets = result.scalars().all()
     
-    return ResponseModel(data=DatasetList(items=datasets, total=total))
+    return ResponseModel(data=DatasetList(items=await _with_live_progress(datasets), total=total))
 
 
 @router.get("/{dataset_id}", response_model=ResponseModel[DatasetResponse])
@@ -139,7 +156,47 @@ async def get_dataset(
             detail="数据集不存在"
         )
     
-    return ResponseModel(data=dataset)
+    return ResponseModel(data=(await _with_live_progress([dataset]))[0])
+
+
+def _dataset_state(dataset: Dataset) -> dict:
+    return {
+        "id": str(dataset.id),
+        "status": dataset.status.value,
+        "progress": dataset.progress,
+        "error_message": dataset.error_message
+    }
+
+
+@router.get("/{dataset_id}/events")
+async def dataset_events(
+    dataset_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """数据集解析进度事件流（SSE），解析完成或失败后结束"""
+    result = await db.execute(
+        select(Dataset).where(
+            Dataset.id == dataset_id,
+            Dataset.user_id == current_user.id
+        )
+    )
+    dataset = result.scalar_one_or_none()
+    
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="数据集不存在"
+        )
+    
+    async def load_snapshot():
+        async with async_session_maker() as session:
+            current = await session.get(Dataset, dataset_id)
+            return _dataset_state(current) if current else None
+    
+    return progress_event_response(
+        "dataset", dataset.id, _dataset_state(dataset), TERMINAL_STATUSES, load_snapshot
+    )
 
 
 @router.delete("/{dataset_id}", response_model=ResponseModel)
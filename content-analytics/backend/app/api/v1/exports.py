@@ -8,17 +8,21 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 
-from app.db.session import get_db
+from app.db.session import get_db, async_session_maker
 from app.models.user import User
 from app.models.analysis import Analysis, AnalysisStatus
 from app.models.export import Export, ExportStatus, ExportFormat
 from app.schemas.common import ResponseModel
 from app.api.deps import get_current_user
+from app.api.sse import progress_event_response
 from app.tasks.export_tasks import run_export_task
 from app.tasks.celery_app import is_celery_available
 
 router = APIRouter()
 
+# 进度事件流在这些状态下结束
+TERMINAL_STATUSES = (ExportStatus.COMPLETED.value, ExportStatus.FAILED.value)
+
 
 @router.post("/{analysis_id}/export", response_model=ResponseModel)
 async def create_export(
@@ -123,6 +127,9 @@ async def download_export(
     ext_map = {
         "excel": "xlsx",
         "json": "json",
+        "ndjson": "ndjson",
+        "parquet": "parquet",
+        "arrow": "arrow",
         "pdf": "pdf",
     }
     filename = f"analysis_report.{ext_map.get(format_value, format_value)}"
@@ -194,3 +201,43 @@ async def get_export_status(
         "error_message": export.error_message,
         "completed_at": export.completed_at.isoformat() if export.completed_at else None
     })
+
+
+def _export_state(export: Export) -> dict:
+    return {
+        "id": str(export.id),
+        "status": getattr(export.status, "value", export.status),
+        "progress": None,
+        "error_message": export.error_message
+    }
+
+
+@router.get("/{export_id}/events")
+async def export_events(
+    export_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """导出任务进度事件流（SSE），progress 为已写出的行数，phase 为 querying / writing / saving，完成或失败后结束"""
+    result = await db.execute(
+        select(Export).where(
+            Export.id == export_id,
+            Export.user_id == current_user.id
+        )
+    )
+    export = result.scalar_one_or_none()
+    
+    if not export:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="导出记录不存在"
+        )
+    
+    async def load_snapshot():
+        async with async_session_maker() as session:
+            current = await session.get(Export, export_id)
+            return _export_state(current) if current else None
+    
+    return progress_event_response(
+        "export", export.id, _export_state(export), TERMINAL_STATUSES, load_snapshot
+    )
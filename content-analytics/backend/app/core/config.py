@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 from functools import lru_cache
 from urllib.parse import urlsplit, urlunsplit
 
@@ -45,9 +45,38 @@ class Settings(BaseSettings):
     DEEPSEEK_BASE_URL: str = "https://api.deepseek.com/v1"
     OPENAI_API_KEY: Optional[str] = None
     
+    # AI 服务 HTTP 连接池
+    AI_HTTP_MAX_CONNECTIONS: int = 20  # 每个 Provider 实例的最大连接数
+    AI_HTTP_MAX_KEEPALIVE: int = 10  # 保持空闲的长连接数
+    AI_HTTP_KEEPALIVE_EXPIRY: float = 60.0  # 空闲连接保持时间（秒）
+    
+    # AI 批量分析：每次请求打包的纯文本笔记数，按 Provider 覆盖默认值，如 {"deepseek": 8}；1 表示关闭批量
+    AI_ANALYSIS_BATCH_SIZES: Dict[str, int] = {}
+    
+    # AI 响应缓存（Redis）
+    AI_RESPONSE_CACHE_ENABLED: bool = True
+    AI_RESPONSE_CACHE_TTL_HOURS: int = 24 * 30  # 缓存有效期（小时）
+    AI_RESPONSE_CACHE_MAX_ENTRIES: int = 100000  # 缓存条数上限，超出按最近访问时间淘汰
+    
     # File Upload
     UPLOAD_DIR: str = "./uploads"
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
+    DATASET_PARSE_CHUNK_SIZE: int = 2000  # 流式解析 Excel 时每批读取并入库的行数
+    EXPORT_IMAGE_CONCURRENCY: int = 8  # 导出 Excel 时并发下载封面的数量
+    EXPORT_STREAM_CHUNK_SIZE: int = 1000  # 导出时服务端游标每批读取的分析结果条数
+    EXPORT_ROW_GROUP_SIZE: int = 50000  # Parquet/Arrow 导出每个行组（记录批）的行数
+    EXPORT_EXCEL_STREAMING: bool = True  # 导出 Excel 使用 xlsxwriter 常量内存模式；False 时回退到 openpyxl 内存工作簿
+    IMAGE_CACHE_MAX_MB: int = 1024  # 图片磁盘缓存（UPLOAD_DIR/image_cache）的容量上限，超出按 LRU 淘汰
+    
+    # Poizon/得物 链接抓取
+    POIZON_FETCH_CONCURRENCY: int = 8  # 全局并发抓取数
+    POIZON_FETCH_PER_HOST: int = 4  # 单个域名的并发上限
+    POIZON_FETCH_HOST_INTERVAL: float = 0.2  # 同一域名两次请求之间的最小间隔（秒）
+    POIZON_FETCH_TIMEOUT: int = 20  # 单个链接的超时（秒）
+    POIZON_BROWSER_POOL_SIZE: int = 2  # 常驻 Playwright 浏览器上下文数量
+    POIZON_BROWSER_MAX_PAGES: int = 50  # 每个上下文服务多少页面后重建
+    POIZON_CACHE_TTL_HOURS: int = 24 * 7  # 元数据缓存有效期（小时）
+    POIZON_CACHE_MAX_ENTRIES: int = 50000  # 缓存条数上限，超出按最近访问时间淘汰
 
     @field_validator("DATABASE_URL", "REDIS_URL", mode="before")
     @classmethod
@@ -1,9 +1,14 @@
 import httpx
 from bs4 import BeautifulSoup
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Callable, Awaitable
+from urllib.parse import urlparse
 import asyncio
+import threading
+import time
+import weakref
 from contextlib import asynccontextmanager
 from playwright.async_api import async_playwright
+from app.core.config import settings
 
 USER_AGENT = (
     "Mozilla/5.0 (Linux; Android 11; Pixel 5) "
@@ -12,14 +17,195 @@ USER_AGENT = (
 )
 
 
-@asynccontextmanager
-async def _playwright_context():
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
+class _BrowserSlot:
+    """浏览器池中的一个上下文槽位"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.context = None
+        self.context_pages = 0   # 当前上下文已服务的页面数
+        self.pages_served = 0    # 累计服务的页面数
+        self.total_latency = 0.0
+        self.recycles = 0
+
+
+class BrowserPool:
+    """Playwright 浏览器池
+
+    启动一个常驻的 headless Chromium，并维护 size 个预热的 BrowserContext，
+    在多次抓取之间复用；每个上下文服务 max_pages 个页面后、或页面/浏览器崩溃时重建。
+    Playwright 对象绑定创建它的事件循环，因此池也只在该循环内有效。
+    启动失败（如未安装 Chromium）时立即停止 Playwright 驱动进程并记住错误，之后的调用直接抛出，不再反复拉起驱动。
+    """
+
+    def __init__(self, size: int = 2, max_pages: int = 50):
+        self.size = max(1, size)
+        self.max_pages = max(1, max_pages)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._playwright = None
+        self._browser = None
+        self._slots: List[_BrowserSlot] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._browser_lock: Optional[asyncio.Lock] = None
+        self._start_error: Optional[Exception] = None
+
+    async def start(self) -> 'BrowserPool':
+        if self._queue is not None:
+            return self
+        if self._start_error is not None:
+            raise self._start_error
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._queue is not None:
+                return self
+            if self._start_error is not None:
+                raise self._start_error
+            self.loop = asyncio.get_running_loop()
+            self._browser_lock = asyncio.Lock()
+            try:
+                self._playwright = await async_playwright().start()
+                await self._ensure_browser()
+            except Exception as e:
+                print(f"[poizon] failed to start browser pool: {e}")
+                self._start_error = e
+                await self._stop_playwright()
+                raise
+            queue: asyncio.Queue = asyncio.Queue()
+            for index in range(self.size):
+                slot = _BrowserSlot(index)
+                self._slots.append(slot)
+                queue.put_nowait(slot)
+            self._queue = queue
+        return self
+
+    async def _ensure_browser(self):
+        async with self._browser_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return
+            if self._browser is not None:
+                print("[poizon] browser disconnected, relaunching")
+                for slot in self._slots:
+                    slot.context = None
+            self._browser = await self._playwright.chromium.launch(headless=True)
+
+    async def _recycle(self, slot: _BrowserSlot):
+        if slot.context is not None:
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+        slot.context = None
+        slot.context_pages = 0
+        slot.recycles += 1
+
+    @asynccontextmanager
+    async def page(self):
+        """借用一个页面，用完自动归还所在上下文"""
+        await self.start()
+        slot = await self._queue.get()
+        started = time.perf_counter()
+        page = None
+        crashed = False
         try:
-            yield browser
+            await self._ensure_browser()
+            if slot.context is None:
+                slot.context = await self._browser.new_context()
+            page = await slot.context.new_page()
+
+            def on_crash(_):
+                nonlocal crashed
+                crashed = True
+
+            page.on("crash", on_crash)
+            yield page
+        except Exception:
+            if page is None or page.is_closed() or not self._browser.is_connected():
+                crashed = True
+            raise
         finally:
-            await browser.close()
+            if page is not None and not page.is_closed():
+                try:
+                    await page.close()
+                except Exception:
+                    crashed = True
+            if page is not None:
+                slot.context_pages += 1
+                slot.pages_served += 1
+                slot.total_latency += time.perf_counter() - started
+            if crashed or slot.context_pages >= self.max_pages:
+                await self._recycle(slot)
+            self._queue.put_nowait(slot)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """每个上下文槽位服务的页面数与平均页面耗时"""
+        return [
+            {
+                "slot": slot.index,
+                "pages_served": slot.pages_served,
+                "recycles": slot.recycles,
+                "avg_latency_ms": round(slot.total_latency / slot.pages_served * 1000, 1)
+                if slot.pages_served else 0.0,
+            }
+            for slot in self._slots
+        ]
+
+    async def _stop_playwright(self):
+        """关闭浏览器并停止 Playwright 驱动进程"""
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+        self._browser = None
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+        self._playwright = None
+
+    async def close(self):
+        if self._queue is not None:
+            print(f"[poizon] closing browser pool: {self.stats()}")
+            for slot in self._slots:
+                await self._recycle(slot)
+        # 启动中途失败时 _queue 为空，驱动进程仍可能存在
+        await self._stop_playwright()
+        self._queue = None
+        self._slots = []
+
+
+# Playwright 对象绑定在事件循环上，按循环各保留一个浏览器池（如 FastAPI 回退路径中并发的多个解析线程）
+_browser_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, BrowserPool]" = weakref.WeakKeyDictionary()
+_browser_pools_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """获取当前事件循环的共享浏览器池（不存在时按配置创建，首次使用时启动）"""
+    loop = asyncio.get_running_loop()
+    with _browser_pools_lock:
+        pool = _browser_pools.get(loop)
+        if pool is None:
+            pool = BrowserPool(
+                size=settings.POIZON_BROWSER_POOL_SIZE,
+                max_pages=settings.POIZON_BROWSER_MAX_PAGES
+            )
+            _browser_pools[loop] = pool
+        return pool
+
+
+async def shutdown_browser_pool():
+    """关闭当前事件循环的浏览器池（FastAPI lifespan / 任务事件循环结束前调用）"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    with _browser_pools_lock:
+        pool = _browser_pools.pop(loop, None)
+    if pool is not None:
+        await pool.close()
 
 
 def _normalize_image_url(url: Optional[str], remove_resize: bool = True) -> Optional[str]:
@@ -156,21 +342,47 @@ def _extract_content_from_payload(payload: Any) -> Dict[str, Optional[str]]:
     return result
 
 
-async def fetch_poizon_meta(url: str, timeout: int = 10, use_playwright_fallback: bool = True) -> Dict[str, Optional[object]]:
+DEFAULT_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Referer": "https://m.poizon.com/",
+}
+
+
+def create_http_client(timeout: float = 10, max_connections: int = 20) -> httpx.AsyncClient:
+    """创建可在多次抓取间共享的 httpx 客户端（复用连接池）"""
+    return httpx.AsyncClient(
+        headers=DEFAULT_HEADERS,
+        timeout=timeout,
+        follow_redirects=True,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        ),
+    )
+
+
+async def fetch_poizon_meta(
+    url: str,
+    timeout: int = 10,
+    use_playwright_fallback: bool = True,
+    client: Optional[httpx.AsyncClient] = None
+) -> Dict[str, Optional[object]]:
     """
     抓取得物分享页的 og 信息（标题/描述/封面）
     先尝试 httpx 静态提取，若失败可选用 Playwright 渲染获取 meta。
+    传入 client 时复用该客户端的连接池，否则为本次请求临时创建。
     """
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Referer": "https://m.poizon.com/",
-    }
     html = None
     try:
-        async with httpx.AsyncClient(headers=headers, timeout=timeout, follow_redirects=True) as client:
-            resp = await client.get(url)
+        if client is not None:
+            resp = await client.get(url, timeout=timeout)
             resp.raise_for_status()
             html = resp.text
+        else:
+            async with create_http_client(timeout=timeout) as own_client:
+                resp = await own_client.get(url)
+                resp.raise_for_status()
+                html = resp.text
     except Exception:
         html = None
 
@@ -199,8 +411,7 @@ async def fetch_poizon_meta(url: str, timeout: int = 10, use_playwright_fallback
     # 得物链接总是使用 Playwright 获取API响应中的真实标题（og:title通常是账号名，不准确）
     if use_playwright_fallback:
         try:
-            async with _playwright_context() as browser:
-                page = await browser.new_page()
+            async with get_browser_pool().page() as page:
                 detail_payloads: List[Any] = []
 
                 async def handle_response(response):
@@ -260,5 +471,92 @@ async def fetch_poizon_meta(url: str, timeout: int = 10, use_playwright_fallback
     }
 
 
+class _HostRateLimiter:
+    """按域名限制并发数与请求间隔"""
+
+    def __init__(self, per_host: int, min_interval: float):
+        self.per_host = max(1, per_host)
+        self.min_interval = max(0.0, min_interval)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last_start: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def limit(self, host: str):
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.per_host))
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with semaphore:
+            if self.min_interval > 0:
+                async with lock:
+                    loop = asyncio.get_running_loop()
+                    wait = self._last_start.get(host, 0.0) + self.min_interval - loop.time()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    self._last_start[host] = loop.time()
+            yield
+
+
+async def fetch_poizon_meta_many(
+    urls: List[Optional[str]],
+    concurrency: int = 8,
+    per_host: int = 4,
+    host_interval: float = 0.2,
+    timeout: int = 20,
+    use_playwright_fallback: bool = True,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+) -> List[Optional[Dict[str, Optional[object]]]]:
+    """并发抓取多个得物链接，返回结果与 urls 按位置一一对应
+
+    - 全局并发受 concurrency 限制，单域名并发受 per_host 限制，
+      同一域名两次请求的开始时间至少间隔 host_interval 秒
+    - 所有请求共享同一个 httpx.AsyncClient
+    - 相同链接只抓取一次；空链接或抓取失败的位置为 None
+    - on_progress(done, total) 在每个链接完成后被串行调用
+    """
+    results: List[Optional[Dict[str, Optional[object]]]] = [None] * len(urls)
+    positions: Dict[str, List[int]] = {}
+    for idx, url in enumerate(urls):
+        if url:
+            positions.setdefault(url, []).append(idx)
+    if not positions:
+        return results
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    host_limiter = _HostRateLimiter(per_host, host_interval)
+    progress_lock = asyncio.Lock()
+    total = len(positions)
+    done = 0
+
+    async with create_http_client(timeout=timeout, max_connections=max(1, concurrency)) as client:
+        async def worker(url: str):
+            nonlocal done
+            try:
+                host = urlparse(url).netloc.lower()
+            except Exception:
+                host = ""
+            meta = None
+            async with semaphore:
+                async with host_limiter.limit(host):
+                    try:
+                        meta = await fetch_poizon_meta(
+                            url,
+                            timeout=timeout,
+                            use_playwright_fallback=use_playwright_fallback,
+                            client=client
+                        )
+                    except Exception as exc:
+                        print(f"[poizon] fetch failed ({url[:50]}): {exc}")
+            for idx in positions[url]:
+                results[idx] = meta
+            async with progress_lock:
+                done += 1
+                if on_progress is not None:
+                    await on_progress(done, total)
+
+        await asyncio.gather(*(worker(url) for url in positions))
+
+    return results
+
+
 def fetch_poizon_meta_sync(url: str, timeout: int = 10, use_playwright_fallback: bool = True) -> Dict[str, Optional[str]]:
     return asyncio.run(fetch_poizon_meta(url, timeout=timeout, use_playwright_fallback=use_playwright_fallback))
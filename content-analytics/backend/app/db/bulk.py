@@ -0,0 +1,58 @@
+import time
+from typing import Any, Dict, Iterable, List
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class BulkInserter:
+    """批量插入器 - 累积行数据，按批次以单条 INSERT ... VALUES 写入
+
+    用于替代逐条 db.add() 的 ORM 写入路径（posts / analysis_results 等大表）。
+    每一行必须是包含相同键的字典；主键等列应由调用方显式给出。
+    """
+
+    # PostgreSQL/asyncpg 单条语句最多 32767 个绑定参数，留出余量
+    MAX_BIND_PARAMS = 30000
+
+    def __init__(self, db: AsyncSession, model: Any, batch_size: int = 1000):
+        self.db = db
+        self.table = model.__table__
+        max_rows = max(1, self.MAX_BIND_PARAMS // len(self.table.columns))
+        self.batch_size = max(1, min(batch_size, max_rows))
+        self._buffer: List[Dict[str, Any]] = []
+        self.total_rows = 0
+        self.elapsed = 0.0
+
+    async def add(self, row: Dict[str, Any]) -> None:
+        """添加一行，缓冲区满时自动写入"""
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def add_all(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """添加多行"""
+        for row in rows:
+            await self.add(row)
+
+    async def flush(self) -> None:
+        """将缓冲区写入数据库（不提交事务）"""
+        if not self._buffer:
+            return
+        start = time.perf_counter()
+        await self.db.execute(insert(self.table).values(self._buffer))
+        self.elapsed += time.perf_counter() - start
+        self.total_rows += len(self._buffer)
+        self._buffer = []
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.elapsed <= 0:
+            return 0.0
+        return self.total_rows / self.elapsed
+
+    def summary(self) -> str:
+        """写入统计，用于日志输出"""
+        return (
+            f"{self.total_rows} rows into {self.table.name} "
+            f"in {self.elapsed:.2f}s ({self.rows_per_second:.0f} rows/s)"
+        )
@@ -6,6 +6,9 @@ import os
 
 from app.core.config import settings
 from app.api.v1 import api_router
+from app.crawlers.poizon_fetcher import shutdown_browser_pool
+from app.ai.factory import close_ai_providers
+from app.services.progress_channel import progress_channel, progress_events
 
 
 @asynccontextmanager
@@ -14,6 +17,10 @@ async def lifespan(app: FastAPI):
     os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
     yield
     # 关闭时清理资源
+    await shutdown_browser_pool()
+    await close_ai_providers()
+    await progress_events.aclose()
+    await progress_channel.aclose()
 
 
 app = FastAPI(
@@ -6,6 +6,7 @@ from .export import Export
 from .user_settings import UserSettings
 from .screenshot import ScreenshotAnalysis
 from .conversation import Conversation, ConversationMessage
+from .poizon_cache import PoizonMetaCache
 
 __all__ = [
     "User",
@@ -19,5 +20,6 @@ __all__ = [
     "UserSettings",
     "ScreenshotAnalysis",
     "Conversation",
-    "ConversationMessage"
+    "ConversationMessage",
+    "PoizonMetaCache"
 ]
@@ -11,6 +11,9 @@ class ExportFormat(str, PyEnum):
     EXCEL = "excel"
     PDF = "pdf"
     JSON = "json"
+    NDJSON = "ndjson"
+    PARQUET = "parquet"
+    ARROW = "arrow"
 
 
 class ExportStatus(str, PyEnum):
@@ -0,0 +1,21 @@
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, Text, Index, JSON
+from app.db.base import Base
+
+
+class PoizonMetaCache(Base):
+    """得物分享页元数据缓存（按规范化 URL 的哈希寻址）"""
+    __tablename__ = "poizon_meta_cache"
+
+    __table_args__ = (
+        Index("ix_poizon_meta_cache_last_accessed_at", "last_accessed_at"),
+    )
+
+    url_hash = Column(String(64), primary_key=True)  # sha256(规范化URL)
+    url = Column(Text, nullable=False)
+    title = Column(Text, nullable=True)
+    description = Column(Text, nullable=True)
+    image = Column(String(1000), nullable=True)
+    image_urls = Column(JSON, nullable=True)
+    fetched_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_accessed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
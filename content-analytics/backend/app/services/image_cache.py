@@ -0,0 +1,313 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+
+
+class ImageCache:
+    """图片磁盘缓存 - 按 URL 缓存原图及派生版本，供 AI 多模态分析和 Excel 导出共用
+
+    目录结构: {UPLOAD_DIR}/image_cache/{key[:2]}/{key}.*（key 为 URL 的 sha256）
+        {key}.json        元数据（url、content_type、LLM 版本的 mime）
+        {key}.orig        原图字节
+        {key}.llm         发给 LLM 的版本（webp 转为 JPEG，其余保持原样）
+        {key}.thumb{W}.png 导出用的宽度为 W 像素的缩略图
+
+    每次命中都会刷新元数据文件的修改时间；总大小超过上限时按修改时间淘汰最久未用的整组文件（LRU）。
+    写入先落临时文件再原子替换，多个进程共用同一目录也不会读到半截文件。
+    磁盘读写和淘汰扫描都在线程池中执行（_load / _store），不阻塞导出和 AI 任务的事件循环。
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or os.path.join(settings.UPLOAD_DIR, "image_cache")
+        self.max_bytes = max_bytes if max_bytes is not None else settings.IMAGE_CACHE_MAX_MB * 1024 * 1024
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def url_key(url: str) -> str:
+        return hashlib.sha256(url.strip().encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.{suffix}")
+
+    # ---------- 文件读写 ----------
+
+    def _read(self, key: str, suffix: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key, suffix), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, key: str, suffix: str, data: bytes) -> None:
+        path = self._path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        # 覆盖已有文件（如重新生成缩略图）时只计入大小差值
+        try:
+            previous = os.stat(path).st_size
+        except OSError:
+            previous = 0
+        os.replace(tmp_path, path)
+        self._add_bytes(len(data) - previous)
+
+    def _read_meta(self, key: str) -> Optional[Dict[str, str]]:
+        data = self._read(key, "json")
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def _write_meta(self, key: str, meta: Dict[str, str]) -> None:
+        self._write(key, "json", json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+    def _touch(self, key: str) -> None:
+        """刷新最近使用时间（以元数据文件的修改时间记录）"""
+        try:
+            os.utime(self._path(key, "json"))
+        except OSError:
+            pass
+
+    def _load(
+        self,
+        key: str,
+        suffix: str,
+        meta_field: Optional[str] = None
+    ) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        """读取缓存的文件和元数据并刷新使用时间（在线程池中执行），未命中返回 None
+
+        meta_field 不为空时要求元数据中有该字段（如 LLM 版本的 mime）。
+        """
+        meta = self._read_meta(key)
+        if meta is None or (meta_field and not meta.get(meta_field)):
+            return None
+        data = self._read(key, suffix)
+        if data is None:
+            return None
+        self._touch(key)
+        return data, meta
+
+    def _store(self, key: str, suffix: str, data: bytes, meta: Optional[Dict[str, str]] = None) -> None:
+        """写入文件（以及元数据），超出容量时淘汰（在线程池中执行）"""
+        self._write(key, suffix, data)
+        if meta is not None:
+            self._write_meta(key, meta)
+        self._evict_if_needed()
+
+    # ---------- 原图 ----------
+
+    async def get_original(
+        self,
+        url: str,
+        timeout: float = 15.0,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        """获取原图字节和元数据，未缓存时下载；url 为空返回 None，下载失败抛出异常（失败不缓存）"""
+        if not url:
+            return None
+        key = self.url_key(url)
+        cached = await asyncio.to_thread(self._load, key, "orig")
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        if client is not None:
+            response = await client.get(url, timeout=timeout)
+        else:
+            async with httpx.AsyncClient(timeout=timeout) as own_client:
+                response = await own_client.get(url)
+        response.raise_for_status()
+        data = response.content
+        meta = {
+            "url": url,
+            "content_type": response.headers.get("content-type", "").lower()
+        }
+        await asyncio.to_thread(self._store, key, "orig", data, meta)
+        return data, meta
+
+    # ---------- 派生版本 ----------
+
+    async def get_llm_image(
+        self,
+        url: str,
+        timeout: float = 15.0,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> Optional[Tuple[str, str]]:
+        """获取发给 LLM 的图片，返回 (base64_data, mime_type)
+
+        注意：iflow API不支持webp格式，会自动转换为jpeg
+        """
+        key = self.url_key(url) if url else None
+        if key:
+            cached = await asyncio.to_thread(self._load, key, "llm", "llm_mime")
+            if cached is not None:
+                self.hits += 1
+                data, meta = cached
+                return base64.b64encode(data).decode("utf-8"), meta["llm_mime"]
+
+        original = await self.get_original(url, timeout=timeout, client=client)
+        if original is None:
+            return None
+        data, meta = original
+        image_data, mime_type = await asyncio.to_thread(
+            self._to_llm_image, url, data, meta.get("content_type", "")
+        )
+        await asyncio.to_thread(self._store, key, "llm", image_data, {**meta, "llm_mime": mime_type})
+        return base64.b64encode(image_data).decode("utf-8"), mime_type
+
+    async def get_thumbnail(
+        self,
+        url: str,
+        width: int = 200,
+        timeout: float = 10.0,
+        client: Optional[httpx.AsyncClient] = None
+    ) -> Optional[Tuple[bytes, Tuple[int, int]]]:
+        """获取导出用的 PNG 缩略图，返回 (png_bytes, (宽, 高))"""
+        if not url:
+            return None
+        key = self.url_key(url)
+        suffix = f"thumb{width}.png"
+        cached = await asyncio.to_thread(self._load, key, suffix)
+        if cached is not None:
+            self.hits += 1
+            data = cached[0]
+            return data, self._png_size(data)
+
+        original = await self.get_original(url, timeout=timeout, client=client)
+        if original is None:
+            return None
+        # 缩放是 CPU 密集操作，放到线程池执行，避免阻塞事件循环
+        thumbnail, size = await asyncio.to_thread(self.make_thumbnail, original[0], width)
+        await asyncio.to_thread(self._store, key, suffix, thumbnail)
+        return thumbnail, size
+
+    @staticmethod
+    def _to_llm_image(url: str, data: bytes, content_type: str) -> Tuple[bytes, str]:
+        """按格式决定发给 LLM 的字节和 mime；webp 转为 JPEG"""
+        is_webp = 'webp' in content_type or url.endswith('.webp') or '?x-oss-process' in url
+        if is_webp:
+            from PIL import Image
+            print("[image_cache] Converting webp to jpeg...")
+            img = Image.open(io.BytesIO(data))
+            # 转换为RGB（去除alpha通道）
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGB')
+            output = io.BytesIO()
+            img.save(output, format='JPEG', quality=85)
+            return output.getvalue(), 'image/jpeg'
+        if 'png' in content_type or url.endswith('.png'):
+            return data, 'image/png'
+        if 'gif' in content_type or url.endswith('.gif'):
+            return data, 'image/gif'
+        return data, 'image/jpeg'
+
+    @staticmethod
+    def make_thumbnail(data: bytes, width: int = 200) -> Tuple[bytes, Tuple[int, int]]:
+        """缩放为指定宽度的 PNG（CPU 密集，在线程池中执行）"""
+        from PIL import Image
+        pil_img = Image.open(io.BytesIO(data))
+        # 转换为RGB（处理webp等格式）
+        if pil_img.mode in ('RGBA', 'P'):
+            pil_img = pil_img.convert('RGB')
+        ratio = width / pil_img.width
+        new_size = (width, int(pil_img.height * ratio))
+        pil_img = pil_img.resize(new_size, Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        pil_img.save(output, format='PNG')
+        return output.getvalue(), new_size
+
+    @staticmethod
+    def _png_size(data: bytes) -> Tuple[int, int]:
+        # PNG 的 IHDR 块固定位于第 16~24 字节
+        return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+
+    # ---------- 淘汰 ----------
+
+    def _add_bytes(self, size: int) -> None:
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size
+
+    def _scan(self) -> List[Tuple[float, int, List[str]]]:
+        """扫描缓存目录，返回 [(最近使用时间, 总字节数, 文件列表)]"""
+        groups: Dict[str, List] = {}
+        if not os.path.isdir(self.root):
+            return []
+        for bucket in os.scandir(self.root):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                # 其他线程 / 进程正在写入的临时文件不计入，也不能被淘汰删除（否则对方的 os.replace 会失败）
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                key = entry.name.split(".", 1)[0]
+                group = groups.setdefault(key, [0.0, 0, []])
+                group[1] += stat.st_size
+                group[2].append(entry.path)
+                if entry.name.endswith(".json"):
+                    group[0] = stat.st_mtime
+        return [tuple(group) for group in groups.values()]
+
+    def _evict_if_needed(self) -> int:
+        """总大小超过上限时按最近使用时间淘汰，返回删除的组数（会扫描目录，只在线程池中调用）"""
+        with self._lock:
+            groups = None
+            if self._total_bytes is None:
+                groups = self._scan()
+                self._total_bytes = sum(size for _, size, _ in groups)
+            if self._total_bytes <= self.max_bytes:
+                return 0
+
+            groups = sorted(groups if groups is not None else self._scan(), key=lambda group: group[0])
+            total = sum(size for _, size, _ in groups)
+            # 淘汰到上限的 90%，避免每次写入都触发扫描
+            target = int(self.max_bytes * 0.9)
+            removed = 0
+            for _, size, paths in groups:
+                if total <= target:
+                    break
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+                removed += 1
+            self._total_bytes = total
+            if removed:
+                print(f"[image_cache] Evicted {removed} images, cache size {total / 1024 / 1024:.1f}MB")
+            return removed
+
+    def summary(self) -> str:
+        return f"image cache hits={self.hits} misses={self.misses}"
+
+
+_image_cache: Optional[ImageCache] = None
+
+
+def get_image_cache() -> ImageCache:
+    """进程内共享的图片缓存实例"""
+    global _image_cache
+    if _image_cache is None:
+        _image_cache = ImageCache()
+    return _image_cache
@@ -0,0 +1,179 @@
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete, func, text
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models.poizon_cache import PoizonMetaCache
+from app.core.config import settings
+
+
+class PoizonMetaCacheService:
+    """得物页面元数据缓存服务
+
+    以规范化 URL 的 sha256 作为键，命中时直接返回 title/description/image/image_urls，
+    不再发起网络请求。超过 TTL 的条目视为未命中；条数超过上限时按最近访问时间淘汰（LRU）。
+    淘汰需要扫描整表，因此不在每次写入后执行，而是本进程累计写入 EVICT_EVERY_ROWS 行后执行一次。
+    """
+
+    # 不影响页面内容的追踪参数，规范化时去除
+    TRACKING_PARAMS_PREFIX = ("utm_",)
+    WRITE_BATCH_SIZE = 1000
+    # 累计写入多少行后执行一次淘汰（上限是软限制，最多超出这么多行）
+    EVICT_EVERY_ROWS = 5000
+    # 进程内自上次淘汰以来写入的行数
+    _rows_since_evict = 0
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        ttl_hours: Optional[int] = None,
+        max_entries: Optional[int] = None
+    ):
+        self.db = db
+        self.ttl = timedelta(hours=ttl_hours if ttl_hours is not None else settings.POIZON_CACHE_TTL_HOURS)
+        self.max_entries = max_entries if max_entries is not None else settings.POIZON_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def normalize_url(cls, url: str) -> str:
+        """规范化URL：协议/域名小写、去除片段和追踪参数、查询参数排序"""
+        parts = urlsplit(url.strip())
+        query = sorted(
+            (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if not k.startswith(cls.TRACKING_PARAMS_PREFIX)
+        )
+        path = parts.path or "/"
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ""))
+
+    @classmethod
+    def url_key(cls, url: str) -> str:
+        return hashlib.sha256(cls.normalize_url(url).encode("utf-8")).hexdigest()
+
+    async def get_many(self, urls: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """批量查询缓存，返回 {原始url: meta}，并刷新命中条目的访问时间"""
+        keys: Dict[str, str] = {}
+        for url in urls:
+            if url and url not in keys:
+                keys[url] = self.url_key(url)
+        if not keys:
+            return {}
+
+        now = datetime.utcnow()
+        result = await self.db.execute(
+            select(PoizonMetaCache).where(
+                PoizonMetaCache.url_hash.in_(set(keys.values())),
+                PoizonMetaCache.fetched_at >= now - self.ttl
+            )
+        )
+        entries = {entry.url_hash: entry for entry in result.scalars().all()}
+
+        found: Dict[str, Dict[str, Any]] = {}
+        for url, key in keys.items():
+            entry = entries.get(key)
+            if entry is None:
+                continue
+            found[url] = {
+                "title": entry.title,
+                "description": entry.description,
+                "image": entry.image,
+                "image_urls": entry.image_urls,
+            }
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+
+        if entries:
+            await self.db.execute(
+                update(PoizonMetaCache)
+                .where(PoizonMetaCache.url_hash.in_(list(entries.keys())))
+                .values(last_accessed_at=now)
+            )
+        return found
+
+    async def put_many(self, metas: Dict[str, Dict[str, Any]]) -> None:
+        """批量写入缓存（已存在则覆盖），只缓存抓到内容的结果"""
+        now = datetime.utcnow()
+        rows = {}
+        for url, meta in metas.items():
+            if not url or not meta:
+                continue
+            if not (meta.get("title") or meta.get("description") or meta.get("image")):
+                continue
+            key = self.url_key(url)
+            rows[key] = {
+                "url_hash": key,
+                "url": self.normalize_url(url),
+                "title": meta.get("title"),
+                "description": meta.get("description"),
+                "image": meta.get("image"),
+                "image_urls": meta.get("image_urls"),
+                "fetched_at": now,
+                "last_accessed_at": now,
+            }
+        if not rows:
+            return
+
+        values = list(rows.values())
+        for start in range(0, len(values), self.WRITE_BATCH_SIZE):
+            stmt = insert(PoizonMetaCache).values(values[start:start + self.WRITE_BATCH_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[PoizonMetaCache.url_hash],
+                set_={
+                    "url": stmt.excluded.url,
+                    "title": stmt.excluded.title,
+                    "description": stmt.excluded.description,
+                    "image": stmt.excluded.image,
+                    "image_urls": stmt.excluded.image_urls,
+                    "fetched_at": stmt.excluded.fetched_at,
+                    "last_accessed_at": stmt.excluded.last_accessed_at,
+                }
+            )
+            await self.db.execute(stmt)
+
+        cls = type(self)
+        cls._rows_since_evict += len(values)
+        if cls._rows_since_evict >= self.EVICT_EVERY_ROWS:
+            cls._rows_since_evict = 0
+            await self.evict()
+
+    async def evict(self) -> int:
+        """删除过期条目，并在超出上限时淘汰最久未访问的条目"""
+        now = datetime.utcnow()
+        expired = await self.db.execute(
+            delete(PoizonMetaCache).where(PoizonMetaCache.fetched_at < now - self.ttl)
+        )
+        removed = expired.rowcount or 0
+
+        count = await self._count_entries()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            oldest = (
+                select(PoizonMetaCache.url_hash)
+                .order_by(PoizonMetaCache.last_accessed_at.asc())
+                .limit(overflow)
+            )
+            evicted = await self.db.execute(
+                delete(PoizonMetaCache).where(PoizonMetaCache.url_hash.in_(oldest))
+            )
+            removed += evicted.rowcount or 0
+        return removed
+
+    async def _count_entries(self) -> int:
+        """缓存条数：先用 Postgres 统计信息估算，接近上限时才精确计数（count(*) 需要扫描整表）"""
+        if self.db.get_bind().dialect.name == "postgresql":
+            estimate = (await self.db.execute(
+                text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)"),
+                {"table": PoizonMetaCache.__tablename__}
+            )).scalar()
+            # 从未 ANALYZE 过的表 reltuples 为 -1（旧版本为 0），此时退回精确计数
+            if estimate is not None and estimate > 0 and estimate < self.max_entries * 0.9:
+                return int(estimate)
+        return (await self.db.execute(select(func.count()).select_from(PoizonMetaCache))).scalar() or 0
+
+    def summary(self) -> str:
+        """命中统计，用于进度与日志"""
+        return f"缓存命中{self.hits}/未命中{self.misses}"
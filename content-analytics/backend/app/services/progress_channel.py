@@ -0,0 +1,281 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+import weakref
+from typing import Any, Dict, Iterable, Optional, Set, Union
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+from app.utils.fast_json import dumps
+
+
+ObjectId = Union[str, uuid.UUID]
+
+
+class ProgressChannel:
+    """任务实时进度通道 - 进度计数写入 Redis（与 Celery broker 同一实例），数据库只在状态切换时更新
+
+    键: progress:state:{kind}:{id}，哈希，字段 progress 与数据库 progress 字段格式相同（如 "32/68"、"45%"），
+    另有 status / phase / error_message 记录最近一次状态切换；带 TTL，任务异常退出也不会残留。
+    kind 取 "dataset" / "analysis" / "export"。
+    每次写入同时向 progress:events:{kind}:{id} 发布一条 JSON 事件（只含本次变化的字段），供 SSE 推送。
+    Redis 不可用时 publish 返回 False，由调用方回退为写数据库字段；一段时间后再重试连接。
+    """
+
+    # 旧版本的字符串键在 progress:{kind}:{id}，改用新前缀避免升级时类型冲突
+    KEY_PREFIX = "progress:state:"
+    EVENTS_PREFIX = "progress:events:"
+    # 进度键的过期时间（秒），长任务每次上报都会续期
+    TTL_SECONDS = 24 * 3600
+    # Redis 连接失败后暂停使用的秒数
+    RETRY_INTERVAL = 30.0
+
+    def __init__(self, url: Optional[str] = None):
+        self.url = url or settings.REDIS_URL
+        self._disabled_until = 0.0
+        # redis.asyncio 的连接绑定在事件循环上，按循环各保留一个客户端
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aioredis.Redis]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return time.monotonic() >= self._disabled_until
+
+    def _key(self, kind: str, object_id: ObjectId) -> str:
+        return f"{self.KEY_PREFIX}{kind}:{object_id}"
+
+    def events_channel(self, kind: str, object_id: ObjectId) -> str:
+        return f"{self.EVENTS_PREFIX}{kind}:{object_id}"
+
+    def _client(self) -> aioredis.Redis:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = aioredis.from_url(
+                    self.url,
+                    decode_responses=True,
+                    socket_connect_timeout=2,
+                    socket_timeout=2
+                )
+                self._clients[loop] = client
+            return client
+
+    def _disable(self, error: Exception) -> None:
+        print(f"[progress] Redis unavailable, falling back to database progress for "
+              f"{self.RETRY_INTERVAL:.0f}s: {error}")
+        self._disabled_until = time.monotonic() + self.RETRY_INTERVAL
+
+    async def _write(self, kind: str, object_id: ObjectId, fields: Dict[str, Any], reset: bool = False) -> bool:
+        """写入进度哈希并发布变化事件（同一个事务管道，一次往返），值为 None 的字段从哈希中删除"""
+        if not self.enabled:
+            return False
+        key = self._key(kind, object_id)
+        values = {name: str(value) for name, value in fields.items() if value is not None}
+        removed = [name for name, value in fields.items() if value is None]
+        try:
+            async with self._client().pipeline(transaction=True) as pipe:
+                if reset:
+                    pipe.delete(key)
+                elif removed:
+                    pipe.hdel(key, *removed)
+                if values:
+                    pipe.hset(key, mapping=values)
+                    pipe.expire(key, self.TTL_SECONDS)
+                pipe.publish(self.events_channel(kind, object_id), dumps(fields))
+                await pipe.execute()
+            return True
+        except Exception as e:
+            self._disable(e)
+            return False
+
+    async def publish(
+        self,
+        kind: str,
+        object_id: ObjectId,
+        progress: str,
+        phase: Optional[str] = None
+    ) -> bool:
+        """上报实时进度，成功返回 True"""
+        fields = {"progress": progress}
+        if phase is not None:
+            fields["phase"] = phase
+        return await self._write(kind, object_id, fields)
+
+    async def publish_state(
+        self,
+        kind: str,
+        object_id: ObjectId,
+        status: str,
+        progress: Optional[str] = None,
+        phase: Optional[str] = None,
+        error_message: Optional[str] = None,
+        reset: bool = False
+    ) -> bool:
+        """上报状态切换（数据库提交之后调用）
+
+        phase / error_message 按传入值覆盖（None 表示清除），progress 为 None 时保持不变；
+        reset 为真时先清除上一轮残留的全部字段。
+        """
+        fields = {"status": status, "phase": phase, "error_message": error_message}
+        if progress is not None:
+            fields["progress"] = progress
+        return await self._write(kind, object_id, fields, reset=reset)
+
+    async def get(self, kind: str, object_id: ObjectId) -> Optional[str]:
+        """读取实时进度，没有记录或 Redis 不可用时返回 None"""
+        if not self.enabled:
+            return None
+        try:
+            return await self._client().hget(self._key(kind, object_id), "progress")
+        except Exception as e:
+            self._disable(e)
+            return None
+
+    async def get_state(self, kind: str, object_id: ObjectId) -> Dict[str, str]:
+        """读取最近一次上报的全部字段（status / progress / phase / error_message），没有记录时为空字典"""
+        if not self.enabled:
+            return {}
+        try:
+            return await self._client().hgetall(self._key(kind, object_id))
+        except Exception as e:
+            self._disable(e)
+            return {}
+
+    async def get_many(self, kind: str, object_ids: Iterable[ObjectId]) -> Dict[str, str]:
+        """批量读取实时进度，返回 {str(id): progress}（只包含有记录的）"""
+        object_ids = [str(object_id) for object_id in object_ids]
+        if not object_ids or not self.enabled:
+            return {}
+        try:
+            async with self._client().pipeline(transaction=False) as pipe:
+                for object_id in object_ids:
+                    pipe.hget(self._key(kind, object_id), "progress")
+                values = await pipe.execute()
+        except Exception as e:
+            self._disable(e)
+            return {}
+        return {object_id: value for object_id, value in zip(object_ids, values) if value is not None}
+
+    async def clear(self, kind: str, object_id: ObjectId) -> None:
+        """清除实时进度（任务开始或重新排队时调用，避免读到上一轮的残留值）"""
+        if not self.enabled:
+            return
+        try:
+            await self._client().delete(self._key(kind, object_id))
+        except Exception as e:
+            self._disable(e)
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环上的 Redis 连接"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        with self._lock:
+            client = self._clients.pop(loop, None)
+        if client is not None:
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+
+
+class ProgressEventHub:
+    """进度事件订阅中心（API 进程内使用）
+
+    整个进程只用一条 Redis 连接 PSUBSCRIBE progress:events:*，再按 {kind}:{id} 分发到各个 SSE 连接的队列，
+    打开多少个看板都不会增加 Redis 连接数，也不会查询数据库。
+    连接断开时 connected 为 False，SSE 端点据此退回为低频查询数据库；后台任务会每隔 RETRY_INTERVAL 秒重连。
+    """
+
+    # 单个 SSE 连接最多积压的事件数，超出后丢弃（SSE 端点定期从进度哈希补齐最新状态）
+    QUEUE_SIZE = 100
+    RETRY_INTERVAL = 5.0
+
+    def __init__(self, channel: ProgressChannel):
+        self.channel = channel
+        self.connected = False
+        self._listeners: Dict[str, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, kind: str, object_id: ObjectId) -> asyncio.Queue:
+        """登记一个监听队列，首次调用时在当前事件循环上启动订阅任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._listeners.setdefault(f"{kind}:{object_id}", set()).add(queue)
+        return queue
+
+    def unsubscribe(self, kind: str, object_id: ObjectId, queue: asyncio.Queue) -> None:
+        name = f"{kind}:{object_id}"
+        queues = self._listeners.get(name)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._listeners[name]
+
+    def _dispatch(self, channel_name: str, data: str) -> None:
+        queues = self._listeners.get(channel_name[len(self.channel.EVENTS_PREFIX):])
+        if not queues:
+            return
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return
+        for queue in list(queues):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            # 订阅连接会长时间阻塞读取，不能设置 socket_timeout；由 health_check_interval 发现断线
+            client = aioredis.from_url(
+                self.channel.url,
+                decode_responses=True,
+                socket_connect_timeout=2,
+                health_check_interval=30
+            )
+            pubsub = client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{self.channel.EVENTS_PREFIX}*")
+                self.connected = True
+                async for message in pubsub.listen():
+                    if message.get("type") == "pmessage":
+                        self._dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[progress] Event subscription lost, retrying in {self.RETRY_INTERVAL:.0f}s: {e}")
+            finally:
+                self.connected = False
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(self.RETRY_INTERVAL)
+
+    async def aclose(self) -> None:
+        """停止订阅任务（应用关闭时调用）"""
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+# 进程内共享的进度通道
+progress_channel = ProgressChannel()
+# API 进程内共享的进度事件订阅
+progress_events = ProgressEventHub(progress_channel)
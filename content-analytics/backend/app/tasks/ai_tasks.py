@@ -1,58 +1,31 @@
-from sqlalchemy import select
+from sqlalchemy import select, func, exists
 from sqlalchemy.orm import selectinload
 from app.tasks.celery_app import celery_app
 from app.db.session import async_session_maker, create_thread_session_maker
 from app.models.analysis import Analysis, AnalysisStatus, AnalysisResult, AIOutput
 from app.models.post import Post
 from app.models.user_settings import UserSettings
-from app.ai.factory import get_ai_provider
+from app.ai.factory import get_ai_provider, close_ai_providers
+from app.ai.cache import response_cache
 from app.analysis.aggregator import AnalysisAggregator
+from app.tasks.progress import ProgressThrottle, report_progress, report_state
+from app.services.progress_channel import progress_channel
+from app.services.image_cache import get_image_cache
 import asyncio
+import time
 import pandas as pd
-import httpx
-import base64
 
 
 async def download_image_as_base64(url: str, timeout: float = 15.0) -> tuple[str, str] | None:
     """下载图片并转换为base64，返回 (base64_data, mime_type)
     
-    注意：iflow API不支持webp格式，会自动转换为jpeg
+    注意：iflow API不支持webp格式，会自动转换为jpeg；
+    原图和转换结果缓存在本地磁盘（与导出缩略图共用），重复分析不再下载和转码
     """
     if not url:
         return None
     try:
-        from PIL import Image
-        import io
-        
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            image_data = response.content
-            
-            # 检测图片格式
-            content_type = response.headers.get('content-type', '').lower()
-            is_webp = 'webp' in content_type or url.endswith('.webp') or '?x-oss-process' in url
-            
-            # webp格式需要转换为jpeg（iflow不支持webp多模态）
-            if is_webp:
-                print(f"[ai_tasks] Converting webp to jpeg...")
-                img = Image.open(io.BytesIO(image_data))
-                # 转换为RGB（去除alpha通道）
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                output = io.BytesIO()
-                img.save(output, format='JPEG', quality=85)
-                image_data = output.getvalue()
-                mime_type = 'image/jpeg'
-            elif 'png' in content_type or url.endswith('.png'):
-                mime_type = 'image/png'
-            elif 'gif' in content_type or url.endswith('.gif'):
-                mime_type = 'image/gif'
-            else:
-                mime_type = 'image/jpeg'
-            
-            base64_data = base64.b64encode(image_data).decode('utf-8')
-            return (base64_data, mime_type)
+        return await get_image_cache().get_llm_image(url, timeout=timeout)
     except Exception as e:
         print(f"[ai_tasks] Failed to download/convert image {url[:50]}...: {e}")
         return None
@@ -65,6 +38,9 @@ def run_async(coro):
     try:
         return loop.run_until_complete(coro)
     finally:
+        # 连接池绑定在本事件循环上，必须在循环关闭前释放
+        loop.run_until_complete(close_ai_providers())
+        loop.run_until_complete(progress_channel.aclose())
         loop.close()
 
 
@@ -92,19 +68,21 @@ async def _run_ai_analysis(analysis_id: str, use_thread_session: bool = False):
                 # 更新状态
                 analysis.status = AnalysisStatus.AI_PROCESSING
                 await db.commit()
+                await report_state(analysis, "analysis", phase="ai", reset=True)
                 
-                # 获取分析结果
-                result = await db.execute(
-                    select(AnalysisResult)
-                    .options(selectinload(AnalysisResult.post))
+                # 统计分析结果总数
+                total_result = await db.execute(
+                    select(func.count())
+                    .select_from(AnalysisResult)
                     .where(AnalysisResult.analysis_id == analysis_id)
                 )
-                analysis_results = result.scalars().all()
+                total = total_result.scalar() or 0
                 
-                if not analysis_results:
+                if total == 0:
                     analysis.status = AnalysisStatus.FAILED
                     analysis.error_message = "没有分析结果"
                     await db.commit()
+                    await report_state(analysis, "analysis")
                     return {"error": "没有分析结果"}
                 
                 # 获取用户的AI配置
@@ -117,6 +95,7 @@ async def _run_ai_analysis(analysis_id: str, use_thread_session: bool = False):
                     analysis.status = AnalysisStatus.FAILED
                     analysis.error_message = "请先在设置页面配置AI API密钥"
                     await db.commit()
+                    await report_state(analysis, "analysis")
                     return {"error": "未配置AI API密钥"}
                 
                 # 获取对应的API密钥
@@ -135,31 +114,57 @@ async def _run_ai_analysis(analysis_id: str, use_thread_session: bool = False):
                     analysis.status = AnalysisStatus.FAILED
                     analysis.error_message = f"请先在设置页面配置{provider_name}的API密钥"
                     await db.commit()
+                    await report_state(analysis, "analysis")
                     return {"error": f"未配置{provider_name} API密钥"}
                 
-                # 获取AI Provider（使用用户的配置）
-                if provider_name == "iflow":
-                    from app.ai.iflow import IFlowProvider
-                    ai_provider = IFlowProvider(api_key=api_key, model=model)
-                else:
-                    ai_provider = get_ai_provider(provider_name, api_key)
-                
-                # 对每个分析结果调用AI
-                total = len(analysis_results)
-                processed = 0
-                
-                for ar in analysis_results:
-                    # 检查是否已有AI输出
-                    existing = await db.execute(
-                        select(AIOutput).where(AIOutput.analysis_result_id == ar.id)
+                # 获取AI Provider（使用用户的配置，同一配置复用缓存的实例和连接池）
+                ai_provider = get_ai_provider(provider_name, api_key, model)
+                
+                # 分析配置中的 ai_force_refresh 为真时跳过响应缓存，重新请求
+                force_refresh = bool((analysis.config or {}).get("ai_force_refresh"))
+                cache_hits, cache_misses = response_cache.hits, response_cache.misses
+                
+                # 可续跑的工作队列：用反连接一次查出尚无AI输出的结果，已完成的不再逐条检查
+                result = await db.execute(
+                    select(AnalysisResult)
+                    .options(selectinload(AnalysisResult.post))
+                    .where(
+                        AnalysisResult.analysis_id == analysis_id,
+                        ~exists().where(AIOutput.analysis_result_id == AnalysisResult.id)
                     )
-                    if existing.scalar_one_or_none():
-                        processed += 1
-                        continue
-                    
+                )
+                pending_results = result.scalars().all()
+                completed = total - len(pending_results)
+                if completed:
+                    print(f"[ai_tasks] Resuming analysis {analysis_id}: "
+                          f"{completed}/{total} posts already have AI output")
+                
+                # 有界并发的工作池：图片下载、构建提示词和调用AI在多个 worker 间重叠进行，
+                # 会话不支持并发使用，所有数据库操作通过 db_lock 串行执行
+                processed = completed
+                succeeded = 0
+                concurrency = max(1, ai_provider.MAX_CONCURRENCY)
+                db_lock = asyncio.Lock()
+                progress = ProgressThrottle(total, min_interval=2.0, min_rows=concurrency)
+                # 工作单元：带图片的笔记逐篇走多模态分析，其余纯文本笔记每 batch_size 篇打包成一次请求
+                batch_size = ai_provider.batch_size
+
+                def uses_image(ar) -> bool:
+                    return provider_name == "iflow" and bool(ar.post.cover_image)
+
+                text_results = [ar for ar in pending_results if not uses_image(ar)]
+                units = [[ar] for ar in pending_results if uses_image(ar)] + [
+                    text_results[i:i + batch_size] for i in range(0, len(text_results), batch_size)
+                ]
+                queue: asyncio.Queue = asyncio.Queue()
+                for unit in units:
+                    queue.put_nowait(unit)
+                started = time.perf_counter()
+                
+                def build_input(ar: AnalysisResult) -> dict:
                     # 构建AI输入
                     post = ar.post
-                    input_data = {
+                    return {
                         'content_description': {
                             'content_type': post.content_type or '',
                             'post_type': post.post_type or '',
@@ -171,6 +176,22 @@ async def _run_ai_analysis(analysis_id: str, use_thread_session: bool = False):
                         },
                         'analysis_result': ar.result_data or {}
                     }
+                
+                def to_output(ar: AnalysisResult, ai_response) -> AIOutput:
+                    return AIOutput(
+                        analysis_result_id=ar.id,
+                        summary=ai_response.summary,
+                        strengths=ai_response.strengths,
+                        weaknesses=ai_response.weaknesses,
+                        suggestions=ai_response.suggestions,
+                        raw_response=ai_response.raw_response,
+                        model_name=ai_response.model_name,
+                        tokens_used=ai_response.tokens_used
+                    )
+                
+                async def analyze_one(ar: AnalysisResult) -> AIOutput | None:
+                    post = ar.post
+                    input_data = build_input(ar)
                     
                     # 下载封面图片用于多模态分析
                     image_data = None
@@ -178,50 +199,94 @@ async def _run_ai_analysis(analysis_id: str, use_thread_session: bool = False):
                         print(f"[ai_tasks] Downloading cover image for post {post.data_id}...")
                         image_data = await download_image_as_base64(post.cover_image)
                     
-                    # 调用AI（添加请求间隔避免限流）
+                    # 调用AI（先查响应缓存；未命中时按令牌桶限流，多模态请求使用更严格的速率）
                     try:
-                        if provider_name == "iflow":
-                            ai_response = await ai_provider.analyze_post(input_data, image_data=image_data)
-                            # qwen3-vl-plus多模态模型限流严格，每次请求后等待3秒
-                            if image_data:
-                                await asyncio.sleep(3)
-                        else:
-                            ai_response = await ai_provider.analyze_post(input_data)
-                        
-                        # 保存AI输出
-                        ai_output = AIOutput(
-                            analysis_result_id=ar.id,
-                            summary=ai_response.summary,
-                            strengths=ai_response.strengths,
-                            weaknesses=ai_response.weaknesses,
-                            suggestions=ai_response.suggestions,
-                            raw_response=ai_response.raw_response,
-                            model_name=ai_response.model_name,
-                            tokens_used=ai_response.tokens_used
+                        ai_response = await ai_provider.analyze_post_cached(
+                            input_data,
+                            image_data=image_data,
+                            force_refresh=force_refresh
                         )
-                        db.add(ai_output)
-                        
+                        return to_output(ar, ai_response)
                     except Exception as e:
                         # 单个失败不影响整体
                         import traceback
                         print(f"AI分析失败 (result_id={ar.id}): {str(e)}")
                         print(f"详细错误: {traceback.format_exc()}")
-                    
-                    processed += 1
-                    analysis.progress = f"{int(processed / total * 100)}%"
-                    await db.commit()
+                        return None
+                
+                async def analyze_unit(unit: list) -> list:
+                    if len(unit) == 1:
+                        return [await analyze_one(unit[0])]
+                    # 多篇打包请求；响应中缺失或解析失败的笔记由 Provider 回退为单篇调用，仍失败的为 None
+                    responses = await ai_provider.analyze_posts_cached(
+                        [build_input(ar) for ar in unit],
+                        force_refresh=force_refresh
+                    )
+                    return [
+                        to_output(ar, ai_response) if ai_response is not None else None
+                        for ar, ai_response in zip(unit, responses)
+                    ]
+                
+                async def worker():
+                    nonlocal processed, succeeded
+                    while True:
+                        try:
+                            unit = queue.get_nowait()
+                        except asyncio.QueueEmpty:
+                            return
+                        ai_outputs = await analyze_unit(unit)
+                        
+                        # 保存AI输出：按时间/条数节流提交（已完成的输出落库，中断后可续跑），
+                        # 实时进度写入 Redis，Redis 不可用时随本次提交写入数据库
+                        async with db_lock:
+                            for ai_output in ai_outputs:
+                                if ai_output is not None:
+                                    db.add(ai_output)
+                                    succeeded += 1
+                            processed += len(unit)
+                            if progress.should_report(processed):
+                                await report_progress(
+                                    analysis, "analysis", ProgressThrottle.percent(processed, total), phase="ai"
+                                )
+                                await db.commit()
+                
+                print(f"[ai_tasks] Analyzing {len(pending_results)} posts with {provider_name} "
+                      f"(concurrency={concurrency}, {len(units)} requests, batch_size={batch_size})...")
+                workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(units)))]
+                try:
+                    await asyncio.gather(*workers)
+                except BaseException:
+                    # 一个 worker 出错（如提交失败）时先取消并等待其余 worker 退出，
+                    # 之后才能在同一个会话上标记失败，避免会话被并发使用
+                    for task in workers:
+                        task.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+                    raise
+                
+                elapsed = time.perf_counter() - started
+                posts_per_minute = succeeded / elapsed * 60 if elapsed > 0 else 0.0
+                print(f"[ai_tasks] Analysis {analysis_id}: {succeeded}/{len(pending_results)} posts analyzed "
+                      f"in {elapsed:.1f}s ({posts_per_minute:.1f} posts/min, "
+                      f"cache hits={response_cache.hits - cache_hits} misses={response_cache.misses - cache_misses}"
+                      f"{', force refresh' if force_refresh else ''})")
                 
                 # 完成
                 analysis.status = AnalysisStatus.COMPLETED
                 analysis.progress = "100%"
                 await db.commit()
+                await report_state(analysis, "analysis")
                 
-                return {"success": True, "processed_count": processed}
+                return {
+                    "success": True,
+                    "processed_count": processed,
+                    "posts_per_minute": round(posts_per_minute, 1)
+                }
                 
             except Exception as e:
                 analysis.status = AnalysisStatus.FAILED
                 analysis.error_message = str(e)
                 await db.commit()
+                await report_state(analysis, "analysis")
                 return {"error": str(e)}
     finally:
         # 清理后台线程创建的引擎
@@ -1,12 +1,17 @@
+import uuid
 import pandas as pd
-from sqlalchemy import select
+from datetime import datetime
+from sqlalchemy import select, update, delete
 from sqlalchemy.orm import selectinload
 from app.tasks.celery_app import celery_app
 from app.db.session import async_session_maker, create_thread_session_maker
+from app.db.bulk import BulkInserter
 from app.models.dataset import Dataset
 from app.models.post import Post
-from app.models.analysis import Analysis, AnalysisStatus, AnalysisResult
-from app.analysis.aggregator import AnalysisAggregator
+from app.models.analysis import Analysis, AnalysisStatus, AnalysisResult, AIOutput, AIOutputHistory
+from app.analysis.aggregator import AnalysisAggregator, metrics_hash
+from app.tasks.progress import ProgressThrottle, report_progress, report_state
+from app.services.progress_channel import progress_channel
 import asyncio
 
 
@@ -17,11 +22,160 @@ def run_async(coro):
     try:
         return loop.run_until_complete(coro)
     finally:
+        # Redis 连接绑定在本事件循环上，必须在循环关闭前释放
+        loop.run_until_complete(progress_channel.aclose())
         loop.close()
 
 
-async def _run_analysis(analysis_id: str, use_thread_session: bool = False):
-    """执行分析"""
+# 评分需要的笔记列（第一列为主键，其余列与 DataFrame 列名一致）
+POST_ANALYSIS_COLUMNS = (
+    Post.id,
+    Post.data_id,
+    Post.content_type,
+    Post.post_type,
+    Post.style_info,
+    Post.read_7d,
+    Post.interact_7d,
+    Post.visit_7d,
+    Post.want_7d,
+    Post.read_14d,
+    Post.interact_14d,
+    Post.visit_14d,
+    Post.want_14d,
+)
+
+# 增量重分析时每条 UPDATE 语句批量更新的结果数
+UPDATE_BATCH_SIZE = 1000
+
+
+def _result_changed(old_performance, old_data: dict, new_data: dict) -> bool:
+    """笔记评分输入变化，或等级/问题指标/亮点指标变化时才需要重写结果"""
+    return (
+        old_data.get('metrics_hash') != new_data.get('metrics_hash')
+        or old_performance != new_data.get('performance')
+        or old_data.get('problem_metrics') != new_data.get('problem_metrics')
+        or old_data.get('highlight_metrics') != new_data.get('highlight_metrics')
+    )
+
+
+def _match_existing(rows: list, matched: list) -> dict:
+    """已有结果与本次笔记对应：先按 post_id，对不上的再按 data_id（重新上传的数据集笔记 id 全部变化）
+
+    返回 post_id -> 已有结果行，每条已有结果最多对应一条笔记。
+    """
+    by_post_id = {row.post_id: row for row in rows}
+    by_data_id = {}
+    for row in rows:
+        by_data_id.setdefault(row.data_id, []).append(row)
+
+    pairs = {}
+    used = set()
+    posts = [post for post, _ in matched if post]
+    for post in posts:
+        row = by_post_id.get(post.id)
+        if row is not None:
+            pairs[post.id] = row
+            used.add(row.id)
+    for post in posts:
+        if post.id in pairs:
+            continue
+        row = next((r for r in by_data_id.get(post.data_id, ()) if r.id not in used), None)
+        if row is not None:
+            pairs[post.id] = row
+            used.add(row.id)
+    return pairs
+
+
+async def _delete_ai_outputs(db, result_ids: list):
+    """删除结果关联的 AI 输出及其修改历史，AI 分析会为这些结果重新生成"""
+    for start in range(0, len(result_ids), UPDATE_BATCH_SIZE):
+        batch = result_ids[start:start + UPDATE_BATCH_SIZE]
+        await db.execute(delete(AIOutputHistory).where(AIOutputHistory.analysis_result_id.in_(batch)))
+        await db.execute(delete(AIOutput).where(AIOutput.analysis_result_id.in_(batch)))
+
+
+async def _save_results_incremental(db, analysis: Analysis, matched: list) -> dict:
+    """增量保存：与该分析已有结果对比，只重写发生变化的结果，新增笔记插入新结果，其余跳过
+
+    对上的已有结果保持原 id 并改指向本次的笔记；重写的结果评分输入或结论已变，原 AI 输出随之删除；
+    本次数据中已没有的笔记，其结果一并删除。跳过的结果保留上次写入的 compare_to_avg/percentile_ranks。
+    """
+    result = await db.execute(
+        select(
+            AnalysisResult.id,
+            AnalysisResult.post_id,
+            AnalysisResult.performance,
+            AnalysisResult.result_data,
+            Post.data_id
+        )
+        .join(Post, Post.id == AnalysisResult.post_id)
+        .where(AnalysisResult.analysis_id == analysis.id)
+    )
+    rows = result.all()
+    pairs = _match_existing(rows, matched)
+
+    inserter = BulkInserter(db, AnalysisResult)
+    updates = []
+    relinks = []
+    skipped = 0
+    for post, result_data in matched:
+        if not post:
+            continue
+        row = pairs.get(post.id)
+        if row is None:
+            await inserter.add(dict(
+                id=uuid.uuid4(),
+                analysis_id=analysis.id,
+                post_id=post.id,
+                performance=result_data.get('performance'),
+                result_data=result_data,
+                created_at=datetime.utcnow()
+            ))
+        elif _result_changed(row.performance, row.result_data or {}, result_data):
+            updates.append({
+                "id": row.id,
+                "post_id": post.id,
+                "performance": result_data.get('performance'),
+                "result_data": result_data
+            })
+        else:
+            skipped += 1
+            if row.post_id != post.id:
+                relinks.append({"id": row.id, "post_id": post.id})
+    await inserter.flush()
+
+    kept = {row.id for row in pairs.values()}
+    removed = [row.id for row in rows if row.id not in kept]
+    await _delete_ai_outputs(db, [item["id"] for item in updates] + removed)
+    for start in range(0, len(removed), UPDATE_BATCH_SIZE):
+        await db.execute(
+            delete(AnalysisResult).where(AnalysisResult.id.in_(removed[start:start + UPDATE_BATCH_SIZE]))
+        )
+    for start in range(0, len(relinks), UPDATE_BATCH_SIZE):
+        await db.execute(update(AnalysisResult), relinks[start:start + UPDATE_BATCH_SIZE])
+
+    # 按主键批量更新（executemany），进度按批次提交
+    progress = ProgressThrottle(len(updates))
+    for start in range(0, len(updates), UPDATE_BATCH_SIZE):
+        batch = updates[start:start + UPDATE_BATCH_SIZE]
+        await db.execute(update(AnalysisResult), batch)
+        done = start + len(batch)
+        if progress.should_report(done):
+            if not await report_progress(
+                analysis, "analysis", ProgressThrottle.percent(done, len(updates)), phase="saving"
+            ):
+                await db.commit()
+
+    return {
+        "inserted": inserter.total_rows,
+        "updated": len(updates),
+        "removed": len(removed),
+        "skipped": skipped
+    }
+
+
+async def _run_analysis(analysis_id: str, use_thread_session: bool = False, incremental: bool = False):
+    """执行分析，incremental 为真时与该分析已有结果对比，只重写变化的结果"""
     if use_thread_session:
         session_maker, thread_engine = create_thread_session_maker()
     else:
@@ -45,49 +199,40 @@ async def _run_analysis(analysis_id: str, use_thread_session: bool = False):
                 # 更新状态
                 analysis.status = AnalysisStatus.ANALYZING
                 await db.commit()
+                await report_state(analysis, "analysis", phase="scoring", reset=True)
 
-                # 获取所有笔记
+                # 获取所有笔记（只取评分需要的列，不构造 ORM 对象）
                 result = await db.execute(
-                    select(Post).where(Post.dataset_id == analysis.dataset_id)
+                    select(*POST_ANALYSIS_COLUMNS).where(Post.dataset_id == analysis.dataset_id)
                 )
-                posts = result.scalars().all()
+                posts = result.all()
 
                 if not posts:
                     analysis.status = AnalysisStatus.FAILED
                     analysis.error_message = "数据集中没有笔记数据"
                     await db.commit()
+                    await report_state(analysis, "analysis")
                     return {"error": "数据集中没有笔记数据"}
 
                 # 构建DataFrame
-                data = []
-                posts_by_index = []
-                for post in posts:
-                    posts_by_index.append(post)
-                    data.append({
-                        'data_id': post.data_id,
-                        'content_type': post.content_type,
-                        'post_type': post.post_type,
-                        'style_info': post.style_info,
-                        'read_7d': post.read_7d,
-                        'interact_7d': post.interact_7d,
-                        'visit_7d': post.visit_7d,
-                        'want_7d': post.want_7d,
-                        'read_14d': post.read_14d,
-                        'interact_14d': post.interact_14d,
-                        'visit_14d': post.visit_14d,
-                        'want_14d': post.want_14d
-                    })
-
-                df = pd.DataFrame(data)
-
-                # 执行分析
+                posts_by_index = list(posts)
+                df = pd.DataFrame(
+                    [tuple(post)[1:] for post in posts_by_index],
+                    columns=[column.key for column in POST_ANALYSIS_COLUMNS[1:]]
+                )
+
+                # 执行分析（数据集级统计量和评分均为向量化计算，全量重算的开销很小）
                 aggregator = AnalysisAggregator(df)
                 aggregator.prepare()
                 analysis_results = aggregator.analyze_all()
 
-                # 保存分析结果
-                total = len(analysis_results)
-                for idx, result_data in enumerate(analysis_results):
+                # data_id -> post 的索引（重复 data_id 以首次出现的为准），仅在行号无法对应时兜底使用
+                posts_by_data_id = {}
+                for post in posts_by_index:
+                    posts_by_data_id.setdefault(post.data_id, post)
+
+                matched = []
+                for result_data in analysis_results:
                     post = None
                     row_index = result_data.get('row_index')
                     if isinstance(row_index, int) and 0 <= row_index < len(posts_by_index):
@@ -95,35 +240,61 @@ async def _run_analysis(analysis_id: str, use_thread_session: bool = False):
                     if not post:
                         data_id = result_data.get('data_id')
                         if data_id:
-                            post = next((p for p in posts_by_index if p.data_id == data_id), None)
-
+                            post = posts_by_data_id.get(data_id)
                     if post:
-                        analysis_result = AnalysisResult(
-                            analysis_id=analysis.id,
-                            post_id=post.id,
-                            performance=result_data.get('performance'),
-                            result_data=result_data
-                        )
-                        db.add(analysis_result)
-
-                    # 更新进度
-                    progress = int((idx + 1) / total * 100)
-                    analysis.progress = f"{progress}%"
-                    await db.commit()
+                        result_data['metrics_hash'] = metrics_hash(post)
+                    matched.append((post, result_data))
+
+                total = len(analysis_results)
+                if incremental:
+                    counts = await _save_results_incremental(db, analysis, matched)
+                    analysis.config = {**(analysis.config or {}), "last_incremental": counts}
+                    print(f"[analysis] Incremental analysis {analysis_id}: {total} posts, "
+                          f"inserted={counts['inserted']} updated={counts['updated']} "
+                          f"removed={counts['removed']} skipped={counts['skipped']}")
+                else:
+                    counts = None
+                    # 保存分析结果（批量插入，进度按时间/行数节流提交）
+                    inserter = BulkInserter(db, AnalysisResult)
+                    progress = ProgressThrottle(total)
+                    for idx, (post, result_data) in enumerate(matched):
+                        if post:
+                            await inserter.add(dict(
+                                id=uuid.uuid4(),
+                                analysis_id=analysis.id,
+                                post_id=post.id,
+                                performance=result_data.get('performance'),
+                                result_data=result_data,
+                                created_at=datetime.utcnow()
+                            ))
+
+                        # 更新进度
+                        if progress.should_report(idx + 1):
+                            if not await report_progress(
+                                analysis, "analysis", ProgressThrottle.percent(idx + 1, total), phase="saving"
+                            ):
+                                await inserter.flush()
+                                await db.commit()
+
+                    await inserter.flush()
+                    print(f"[analysis] Inserted {inserter.summary()}")
 
                 # 完成
                 analysis.status = AnalysisStatus.COMPLETED
                 analysis.progress = "100%"
-                from datetime import datetime
                 analysis.completed_at = datetime.utcnow()
                 await db.commit()
+                await report_state(analysis, "analysis")
 
+                if counts is not None:
+                    return {"success": True, "analyzed_count": total, **{f"{k}_count": v for k, v in counts.items()}}
                 return {"success": True, "analyzed_count": total}
 
             except Exception as e:
                 analysis.status = AnalysisStatus.FAILED
                 analysis.error_message = str(e)
                 await db.commit()
+                await report_state(analysis, "analysis")
                 return {"error": str(e)}
     finally:
         if thread_engine:
@@ -131,6 +302,6 @@ async def _run_analysis(analysis_id: str, use_thread_session: bool = False):
 
 
 @celery_app.task(bind=True, name="run_analysis")
-def run_analysis_task(self, analysis_id: str):
+def run_analysis_task(self, analysis_id: str, incremental: bool = False):
     """Celery任务: 执行数据分析"""
-    return run_async(_run_analysis(analysis_id, use_thread_session=True))
+    return run_async(_run_analysis(analysis_id, use_thread_session=True, incremental=incremental))
@@ -1,13 +1,20 @@
+import uuid
 import pandas as pd
+from datetime import datetime, timedelta
 from sqlalchemy import select
 from urllib.parse import urlparse
 from app.tasks.celery_app import celery_app
 from app.db.session import async_session_maker, create_thread_session_maker
+from app.db.bulk import BulkInserter
 from app.models.dataset import Dataset, DatasetStatus
 from app.models.post import Post
 from app.models.analysis import Analysis, AnalysisStatus, AnalysisResult
-from app.analysis.processor import DataProcessor
-from app.crawlers.poizon_fetcher import fetch_poizon_meta
+from app.analysis.processor import DataProcessor, ExcelChunkReader, ChunkValidator
+from app.crawlers.poizon_fetcher import fetch_poizon_meta_many, shutdown_browser_pool
+from app.core.config import settings
+from app.tasks.progress import ProgressThrottle, report_progress, report_state
+from app.services.progress_channel import progress_channel
+from app.services.poizon_cache_service import PoizonMetaCacheService
 import asyncio
 
 
@@ -27,6 +34,8 @@ def run_async_in_thread(coro_func, *args, **kwargs):
         traceback.print_exc()
         raise
     finally:
+        loop.run_until_complete(shutdown_browser_pool())
+        loop.run_until_complete(progress_channel.aclose())
         loop.run_until_complete(thread_engine.dispose())
         loop.close()
 
@@ -43,9 +52,50 @@ def run_async(coro):
         traceback.print_exc()
         raise
     finally:
+        # 浏览器池和 Redis 连接绑定在本事件循环上，必须在循环关闭前释放
+        loop.run_until_complete(shutdown_browser_pool())
+        loop.run_until_complete(progress_channel.aclose())
         loop.close()
 
 
+def _normalize_url(url: str) -> str:
+    if not url:
+        return ""
+    url = str(url).strip()
+    if not url:
+        return ""
+    if not url.startswith(("http://", "https://")):
+        return f"https://{url}"
+    return url
+
+
+def _is_poizon(url: str) -> bool:
+    try:
+        host = urlparse(url).netloc.lower()
+    except Exception:
+        return False
+    return "poizon.com" in host or "dewu.com" in host
+
+
+def _should_fetch(source: str | None, url: str) -> bool:
+    if not url or not _is_poizon(url):
+        return False
+    # 只要链接域名属于得物/Poizon，就视为需要抓取
+    return True
+
+
+def _format_data_id(value) -> str:
+    """data_id 转为字符串；分块读取时同一列可能被推断为整数或浮点，整数值统一去掉 '.0'"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _format_progress(done: int, estimated_total: int, meta_cache: PoizonMetaCacheService) -> str:
+    total = max(done, estimated_total)
+    return f"{done}/{total} {meta_cache.summary()}"
+
+
 async def _parse_dataset_impl(db, dataset_id: str):
     """解析数据集的实际实现"""
     result = await db.execute(select(Dataset).where(Dataset.id == dataset_id))
@@ -57,103 +107,134 @@ async def _parse_dataset_impl(db, dataset_id: str):
     try:
         dataset.status = DatasetStatus.PROCESSING
         await db.commit()
+        await report_state(dataset, "dataset", phase="parsing", reset=True)
+
+        # 流式读取：按行块读取、处理并入库，内存中只保留当前块
+        reader = ExcelChunkReader(dataset.file_path, settings.DATASET_PARSE_CHUNK_SIZE).open()
+        try:
+            validation = ChunkValidator(reader.columns)
 
-        df = pd.read_excel(dataset.file_path)
-
-        processor = DataProcessor(df)
-        validation = processor.validate()
-
-        if not validation['valid']:
-            dataset.status = DatasetStatus.FAILED
-            dataset.error_message = '; '.join(validation['errors'])
-            await db.commit()
-            return {"error": validation['errors']}
-
-        processor.process()
-        records = processor.to_records()
-
-        def _normalize_url(url: str) -> str:
-            if not url:
-                return ""
-            url = str(url).strip()
-            if not url:
-                return ""
-            if not url.startswith(("http://", "https://")):
-                return f"https://{url}"
-            return url
-
-        def _is_poizon(url: str) -> bool:
-            try:
-                host = urlparse(url).netloc.lower()
-            except Exception:
-                return False
-            return "poizon.com" in host or "dewu.com" in host
-
-        def _should_fetch(source: str | None, url: str) -> bool:
-            if not url or not _is_poizon(url):
-                return False
-            # 只要链接域名属于得物/Poizon，就视为需要抓取
-            return True
-
-        total_records = len(records)
-        for idx, record in enumerate(records):
-            # 更新进度
-            dataset.progress = f"{idx+1}/{total_records}"
-            if idx % 5 == 0:  # 每5条提交一次进度
+            if not validation.valid:
+                dataset.status = DatasetStatus.FAILED
+                dataset.error_message = '; '.join(validation.errors)
                 await db.commit()
-            
-            print(f"[dataset] Processing record {idx+1}/{total_records}")
-            content_title = record.get('content_title')
-            content_text = None
-            cover_image = None
-            image_urls = None
-
-            publish_link = record.get('publish_link')
-            if publish_link:
-                publish_link = _normalize_url(publish_link)
-            if publish_link:
-                try:
-                    if _should_fetch(record.get('source'), publish_link):
-                        print(f"[dataset] Fetching poizon link: {publish_link[:50]}...")
-                        meta = await fetch_poizon_meta(publish_link, timeout=20, use_playwright_fallback=True)
-                        # 得物链接：优先使用抓取的标题和描述（比Excel中的更准确）
+                await report_state(dataset, "dataset")
+                return {"error": validation.errors}
+
+            meta_cache = PoizonMetaCacheService(db)
+            post_inserter = BulkInserter(db, Post)
+            # 工作表声明的行数只是估计值，实际行数超出时以实际为准；未声明时不按“已完成”强制上报
+            estimated_total = reader.total_rows or 0
+            progress = ProgressThrottle(estimated_total or float("inf"))
+            # 批量插入时 created_at 按行号递增，保证“按原始数据集顺序”的排序稳定
+            base_created_at = datetime.utcnow()
+            total_records = 0
+
+            for chunk_df in reader:
+                validation.update(chunk_df)
+                processor = DataProcessor(chunk_df)
+                processor.process()
+                records = processor.to_records()
+                chunk_start = total_records
+
+                # 第一阶段：规范化链接，先查缓存，再并发抓取未命中的得物链接（结果与 records 按位置对应）
+                publish_links = [_normalize_url(record.get('publish_link')) for record in records]
+                fetch_urls = [
+                    link if _should_fetch(record.get('source'), link) else None
+                    for record, link in zip(records, publish_links)
+                ]
+                cached_metas = await meta_cache.get_many(fetch_urls)
+                miss_urls = [url if url and url not in cached_metas else None for url in fetch_urls]
+                skipped = len(records) - len(set(url for url in miss_urls if url))
+
+                async def report_fetch_progress(done: int, total: int):
+                    # 进度按时间/行数节流上报到 Redis，不写库
+                    done_rows = chunk_start + skipped + done
+                    if progress.should_report(done_rows):
+                        if not await report_progress(
+                            dataset, "dataset", _format_progress(done_rows, estimated_total, meta_cache),
+                            phase="fetching"
+                        ):
+                            await db.commit()
+
+                print(f"[dataset] Fetching {len(records) - skipped} poizon links for rows "
+                      f"{chunk_start + 1}-{chunk_start + len(records)} "
+                      f"(concurrency={settings.POIZON_FETCH_CONCURRENCY}, {meta_cache.summary()})...")
+                fetched_metas = await fetch_poizon_meta_many(
+                    miss_urls,
+                    concurrency=settings.POIZON_FETCH_CONCURRENCY,
+                    per_host=settings.POIZON_FETCH_PER_HOST,
+                    host_interval=settings.POIZON_FETCH_HOST_INTERVAL,
+                    timeout=settings.POIZON_FETCH_TIMEOUT,
+                    use_playwright_fallback=True,
+                    on_progress=report_fetch_progress
+                )
+                await meta_cache.put_many({
+                    url: meta for url, meta in zip(miss_urls, fetched_metas) if url and meta
+                })
+                metas = [
+                    cached_metas.get(url) if url in cached_metas else meta
+                    for url, meta in zip(fetch_urls, fetched_metas)
+                ]
+
+                # 第二阶段：按原始顺序批量入库，本块写入并提交后再读取下一块
+                for offset, (record, publish_link, meta) in enumerate(zip(records, publish_links, metas)):
+                    content_title = record.get('content_title')
+                    content_text = None
+                    cover_image = None
+                    image_urls = None
+
+                    # 得物链接：优先使用抓取的标题和描述（比Excel中的更准确）
+                    # 外链抓取失败时 meta 为 None，仅跳过补充信息，继续入库
+                    if meta:
                         if meta.get("title"):
                             content_title = meta.get("title")
                         if meta.get("description"):
                             content_text = meta.get("description")
                         cover_image = meta.get("image") or cover_image
                         image_urls = meta.get("image_urls") or image_urls
-                except Exception as e:
-                    print(f"[dataset] fetch link failed ({publish_link}): {e}")
-            # 外链抓取失败时仅跳过本条，继续入库
-
-            post = Post(
-                dataset_id=dataset.id,
-                data_id=str(record.get('data_id', '')),
-                publish_time=record.get('publish_time'),
-                publish_link=publish_link or record.get('publish_link'),
-                content_type=record.get('content_type'),
-                post_type=record.get('post_type'),
-                source=record.get('source'),
-                style_info=record.get('style_info'),
-                read_7d=record.get('read_7d'),
-                interact_7d=record.get('interact_7d'),
-                visit_7d=record.get('visit_7d'),
-                want_7d=record.get('want_7d'),
-                read_14d=record.get('read_14d'),
-                interact_14d=record.get('interact_14d'),
-                visit_14d=record.get('visit_14d'),
-                want_14d=record.get('want_14d'),
-                content_title=content_title,
-                content_text=content_text,
-                cover_image=cover_image,
-                image_urls=image_urls
-            )
-            db.add(post)
 
+                    await post_inserter.add(dict(
+                        id=uuid.uuid4(),
+                        dataset_id=dataset.id,
+                        data_id=_format_data_id(record.get('data_id', '')),
+                        publish_time=record.get('publish_time'),
+                        publish_link=publish_link or record.get('publish_link'),
+                        content_type=record.get('content_type'),
+                        post_type=record.get('post_type'),
+                        source=record.get('source'),
+                        style_info=record.get('style_info'),
+                        read_7d=record.get('read_7d'),
+                        interact_7d=record.get('interact_7d'),
+                        visit_7d=record.get('visit_7d'),
+                        want_7d=record.get('want_7d'),
+                        read_14d=record.get('read_14d'),
+                        interact_14d=record.get('interact_14d'),
+                        visit_14d=record.get('visit_14d'),
+                        want_14d=record.get('want_14d'),
+                        content_title=content_title,
+                        content_text=content_text,
+                        cover_image=cover_image,
+                        image_urls=image_urls,
+                        created_at=base_created_at + timedelta(microseconds=chunk_start + offset)
+                    ))
+
+                await post_inserter.flush()
+                total_records += len(records)
+                await report_progress(
+                    dataset, "dataset", _format_progress(total_records, estimated_total, meta_cache), phase="saving"
+                )
+                await db.commit()
+        finally:
+            reader.close()
+
+        print(f"[dataset] Inserted {post_inserter.summary()}")
+
+        dataset.progress = _format_progress(total_records, total_records, meta_cache)
         dataset.status = DatasetStatus.COMPLETED
-        dataset.row_count = len(records)
+        dataset.row_count = total_records
         await db.commit()
+        await report_state(dataset, "dataset")
         
         # 自动创建分析任务
         print(f"[dataset] Auto-creating analysis for dataset {dataset.id}...")
@@ -166,15 +247,18 @@ async def _parse_dataset_impl(db, dataset_id: str):
         db.add(analysis)
         await db.commit()
         await db.refresh(analysis)
+        await report_state(analysis, "analysis", phase="scoring", reset=True)
         
         # 获取所有posts并创建分析结果
         posts_result = await db.execute(
-            select(Post).where(Post.dataset_id == dataset.id)
+            select(Post)
+            .where(Post.dataset_id == dataset.id)
+            .order_by(Post.created_at.asc(), Post.id.asc())
         )
         posts = posts_result.scalars().all()
         
         # 构建DataFrame用于初始化聚合器
-        from app.analysis.aggregator import AnalysisAggregator
+        from app.analysis.aggregator import AnalysisAggregator, metrics_hash
         
         posts_data = []
         for post in posts:
@@ -196,49 +280,60 @@ async def _parse_dataset_impl(db, dataset_id: str):
         df = pd.DataFrame(posts_data)
         aggregator = AnalysisAggregator(df).prepare()
         
+        # 一次性批量评分；DataFrame 与 posts 按位置一一对应，
+        # 重复的 data_id 各自使用自己那一行的指标，不会互相覆盖
+        analysis_results = aggregator.analyze_all() if posts else []
+        
         total_posts = len(posts)
-        for idx, post in enumerate(posts):
-            # 获取对应的DataFrame行
-            row = df[df['data_id'] == post.data_id].iloc[0] if not df[df['data_id'] == post.data_id].empty else None
-            if row is None:
-                continue
-            result_data = aggregator.analyze_single_post(row)
-            
-            analysis_result = AnalysisResult(
+        result_inserter = BulkInserter(db, AnalysisResult)
+        progress = ProgressThrottle(total_posts)
+        for idx, (post, result_data) in enumerate(zip(posts, analysis_results)):
+            result_data['metrics_hash'] = metrics_hash(post)
+            await result_inserter.add(dict(
+                id=uuid.uuid4(),
                 analysis_id=analysis.id,
                 post_id=post.id,
                 performance=result_data.get('performance'),
-                result_data=result_data
-            )
-            db.add(analysis_result)
+                result_data=result_data,
+                created_at=datetime.utcnow()
+            ))
             
-            if idx % 10 == 0:
-                analysis.progress = f"{int((idx+1)/total_posts*100)}%"
-                await db.commit()
+            if progress.should_report(idx + 1):
+                if not await report_progress(analysis, "analysis", ProgressThrottle.percent(idx + 1, total_posts)):
+                    await result_inserter.flush()
+                    await db.commit()
+        
+        await result_inserter.flush()
+        print(f"[dataset] Inserted {result_inserter.summary()}")
         
         analysis.status = AnalysisStatus.COMPLETED
         analysis.progress = "100%"
         await db.commit()
+        await report_state(analysis, "analysis")
         print(f"[dataset] Analysis {analysis.id} created and completed")
 
         return {
             "success": True,
-            "row_count": len(records),
+            "row_count": total_records,
             "analysis_id": str(analysis.id),
-            "warnings": validation.get('warnings', [])
+            "warnings": validation.result().get('warnings', [])
         }
 
     except Exception as e:
         dataset.status = DatasetStatus.FAILED
         dataset.error_message = str(e)
         await db.commit()
+        await report_state(dataset, "dataset")
         return {"error": str(e)}
 
 
 async def _parse_dataset(dataset_id: str):
     """解析数据集（使用共享会话，用于Celery）"""
-    async with async_session_maker() as db:
-        return await _parse_dataset_impl(db, dataset_id)
+    try:
+        async with async_session_maker() as db:
+            return await _parse_dataset_impl(db, dataset_id)
+    finally:
+        await shutdown_browser_pool()
 
 
 @celery_app.task(bind=True, name="parse_dataset")
@@ -2,23 +2,28 @@
 import os
 import uuid
 import asyncio
+import time
 from datetime import datetime
-from typing import Optional
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.drawing.image import Image as XLImage
+from sqlalchemy.orm import selectinload, contains_eager
 import httpx
-from io import BytesIO
-from PIL import Image as PILImage
 
 from app.tasks.celery_app import celery_app
 from app.db.session import async_session_maker, create_thread_session_maker
 from app.models.export import Export, ExportStatus, ExportFormat
 from app.models.analysis import Analysis, AnalysisResult, AIOutput
+from app.models.post import Post
 from app.core.config import settings
+from app.services.image_cache import get_image_cache
+from app.tasks.export_writers import (
+    ExcelStreamWriter, OpenpyxlExcelWriter, JsonStreamWriter, NdjsonWriter, ArrowTableWriter
+)
+from app.utils.fast_json import ORJSON_AVAILABLE
+from app.services.progress_channel import progress_channel
+from app.tasks.progress import report_state
 
 
 def run_async(coro):
@@ -28,6 +33,8 @@ def run_async(coro):
     try:
         return loop.run_until_complete(coro)
     finally:
+        # Redis 连接绑定在本事件循环上，必须在循环关闭前释放
+        loop.run_until_complete(progress_channel.aclose())
         loop.close()
 
 
@@ -59,6 +66,7 @@ async def _run_export(export_id: str, use_thread_session: bool = False):
             # 更新状态为处理中
             export.status = ExportStatus.PROCESSING
             await db.commit()
+            await report_state(export, "export", phase="querying", reset=True)
             
             try:
                 # 获取分析数据
@@ -72,34 +80,27 @@ async def _run_export(export_id: str, use_thread_session: bool = False):
                 if not analysis:
                     raise Exception("分析任务不存在")
                 
-                # 获取分析结果（按原始数据集顺序排序）
-                from app.models.post import Post
-                results = await db.execute(
-                    select(AnalysisResult)
-                    .options(
-                        selectinload(AnalysisResult.post),
-                        selectinload(AnalysisResult.ai_output)
-                    )
-                    .join(Post, AnalysisResult.post_id == Post.id)
-                    .where(AnalysisResult.analysis_id == analysis.id)
-                    .order_by(Post.created_at.asc())
-                )
-                analysis_results = results.scalars().all()
-                
-                # 根据格式导出
-                if export.format == ExportFormat.EXCEL:
-                    file_path = await _export_to_excel(analysis, analysis_results, export_id)
-                elif export.format == ExportFormat.JSON:
-                    file_path = await _export_to_json(analysis, analysis_results, export_id)
-                else:
-                    format_value = getattr(export.format, "value", export.format)
-                    raise Exception(f"暂不支持 {format_value} 格式导出")
+                # 按原始数据集顺序分批流式读取分析结果，边读边写入文件
+                async with aclosing(_iter_result_chunks(db, analysis.id)) as results, \
+                        aclosing(_report_export_progress(results, export_id)) as chunks:
+                    if export.format == ExportFormat.EXCEL:
+                        file_path = await _export_to_excel(analysis, chunks, export_id)
+                    elif export.format == ExportFormat.JSON:
+                        file_path = await _export_to_json(analysis, chunks, export_id)
+                    elif export.format == ExportFormat.NDJSON:
+                        file_path = await _export_to_json(analysis, chunks, export_id, line_delimited=True)
+                    elif export.format in (ExportFormat.PARQUET, ExportFormat.ARROW):
+                        file_path = await _export_to_arrow(analysis, chunks, export_id, export.format.value)
+                    else:
+                        format_value = getattr(export.format, "value", export.format)
+                        raise Exception(f"暂不支持 {format_value} 格式导出")
                 
                 # 更新导出记录
                 export.file_path = file_path
                 export.status = ExportStatus.COMPLETED
                 export.completed_at = datetime.utcnow()
                 await db.commit()
+                await report_state(export, "export")
                 
                 return {"success": True, "file_path": file_path}
                 
@@ -107,238 +108,169 @@ async def _run_export(export_id: str, use_thread_session: bool = False):
                 export.status = ExportStatus.FAILED
                 export.error_message = str(e)[:1000]
                 await db.commit()
+                await report_state(export, "export")
                 return {"error": str(e)}
     finally:
         if thread_engine:
             await thread_engine.dispose()
 
 
-async def _export_to_excel(analysis: Analysis, results: list, export_id: str) -> str:
-    """导出为Excel格式"""
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "分析报告"
-    
-    # 样式定义
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    header_fill = PatternFill(start_color="FF2442", end_color="FF2442", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    
-    cell_alignment = Alignment(horizontal="left", vertical="top", wrap_text=True)
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+async def _iter_result_chunks(db, analysis_id) -> AsyncIterator[List[AnalysisResult]]:
+    """按原始数据集顺序分批读取分析结果（服务端游标，每批 EXPORT_STREAM_CHUNK_SIZE 条）
+
+    笔记和 AI 输出都是一对一关系，直接在同一条查询里连接并填充，不再额外发起 selectin 查询；
+    已写出的批次不再被引用，会话的弱引用标识映射会自动释放它们，内存占用与总行数无关。
+    调用期间不能提交会话，否则游标会被关闭。
+    """
+    result = await db.stream_scalars(
+        select(AnalysisResult)
+        .join(Post, AnalysisResult.post_id == Post.id)
+        .outerjoin(AIOutput, AIOutput.analysis_result_id == AnalysisResult.id)
+        .options(
+            contains_eager(AnalysisResult.post),
+            contains_eager(AnalysisResult.ai_output)
+        )
+        .where(AnalysisResult.analysis_id == analysis_id)
+        .order_by(Post.created_at.asc(), AnalysisResult.id.asc())
+        .execution_options(yield_per=settings.EXPORT_STREAM_CHUNK_SIZE)
     )
+    try:
+        async for chunk in result.partitions():
+            yield chunk
+    finally:
+        await result.close()
+
+
+async def _report_export_progress(chunks: AsyncIterator[list], export_id: str) -> AsyncIterator[list]:
+    """逐批转发分析结果，每写完一批向进度通道上报已写出的行数（只写 Redis，不写库）"""
+    rows = 0
+    async for chunk in chunks:
+        yield chunk
+        rows += len(chunk)
+        await progress_channel.publish("export", export_id, str(rows), phase="writing")
+    # 全部行已写出，接下来是保存文件
+    await progress_channel.publish("export", export_id, str(rows), phase="saving")
+
+
+async def _prefetch_thumbnails(urls: List[str], width: int = 200) -> Dict[str, Optional[Tuple[bytes, Tuple[int, int]]]]:
+    """有界并发地预取所有封面缩略图，返回 {url: (png_bytes, (宽, 高))}，失败为 None"""
+    image_cache = get_image_cache()
+    semaphore = asyncio.Semaphore(settings.EXPORT_IMAGE_CONCURRENCY)
+    thumbnails: Dict[str, Optional[Tuple[bytes, Tuple[int, int]]]] = {}
+    if not urls:
+        return thumbnails
     
-    # 写入标题行（与笔记详情页面一致）
-    headers = [
-        "序号",
-        "笔记ID",
-        "笔记链接",
-        "发文时间",
-        "内容形式",
-        "发文类型",
-        "素材来源",
-        "款式信息",
-        "标题",
-        "正文",
-        "封面图片",
-        "表现",
-        "问题指标",
-        "亮点指标",
-        "7天阅读",
-        "14天阅读",
-        "7天互动",
-        "14天互动",
-        "7天好物访问",
-        "14天好物访问",
-        "7天好物想要",
-        "14天好物想要",
-        "AI一句话总结",
-        "优点",
-        "问题",
-        "优化建议"
-    ]
-    
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = thin_border
-    
-    # 写入数据
-    for row_idx, ar in enumerate(results, 2):
-        post = getattr(ar, "post", None)
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        async def fetch(url: str):
+            async with semaphore:
+                try:
+                    thumbnails[url] = await image_cache.get_thumbnail(url, width=width, timeout=10.0, client=client)
+                except Exception as e:
+                    print(f"[export] Failed to fetch cover {url[:50]}...: {e}")
+                    thumbnails[url] = None
         
-        # 序号
-        ws.cell(row=row_idx, column=1, value=row_idx - 1).border = thin_border
-        # 笔记ID
-        ws.cell(row=row_idx, column=2, value=(post.data_id if post else "")).border = thin_border
-        # 笔记链接
-        ws.cell(row=row_idx, column=3, value=(post.publish_link if post else "")).border = thin_border
-        # 发文时间
-        ws.cell(row=row_idx, column=4, value=(str(post.publish_time) if post and post.publish_time else "")).border = thin_border
-        # 内容形式
-        ws.cell(row=row_idx, column=5, value=(post.content_type if post else "")).border = thin_border
-        # 发文类型
-        ws.cell(row=row_idx, column=6, value=(post.post_type if post else "")).border = thin_border
-        # 素材来源
-        ws.cell(row=row_idx, column=7, value=(post.source if post else "")).border = thin_border
-        # 款式信息
-        ws.cell(row=row_idx, column=8, value=(post.style_info if post else "")).border = thin_border
-        # 标题
-        ws.cell(row=row_idx, column=9, value=(post.content_title if post else "")).border = thin_border
-        # 正文
-        ws.cell(row=row_idx, column=10, value=(post.content_text if post else "")).border = thin_border
-        
-        # 封面图片（嵌入缩略图）
-        ws.cell(row=row_idx, column=11, value="").border = thin_border
-        if post and post.cover_image:
-            try:
-                # 下载图片
-                with httpx.Client(timeout=10.0) as client:
-                    resp = client.get(post.cover_image)
-                    if resp.status_code == 200:
-                        img_data = BytesIO(resp.content)
-                        pil_img = PILImage.open(img_data)
-                        # 转换为RGB（处理webp等格式）
-                        if pil_img.mode in ('RGBA', 'P'):
-                            pil_img = pil_img.convert('RGB')
-                        # 缩放到合适大小（宽度200像素，更清晰）
-                        ratio = 200 / pil_img.width
-                        new_size = (200, int(pil_img.height * ratio))
-                        pil_img = pil_img.resize(new_size, PILImage.Resampling.LANCZOS)
-                        # 保存到内存
-                        img_buffer = BytesIO()
-                        pil_img.save(img_buffer, format='PNG')
-                        img_buffer.seek(0)
-                        # 插入到Excel
-                        xl_img = XLImage(img_buffer)
-                        ws.add_image(xl_img, f"K{row_idx}")
-                        # 设置行高以适应图片
-                        ws.row_dimensions[row_idx].height = new_size[1] * 0.75
-            except Exception as e:
-                # 图片下载失败，写入URL
-                ws.cell(row=row_idx, column=11, value=post.cover_image)
-        
-        # 表现、问题指标、亮点指标
-        result_data = ar.result_data or {}
-        ws.cell(row=row_idx, column=12, value=(ar.performance or "")).border = thin_border
-        ws.cell(row=row_idx, column=13, value="、".join(result_data.get('problem_metrics', []))).border = thin_border
-        ws.cell(row=row_idx, column=14, value="、".join(result_data.get('highlight_metrics', []))).border = thin_border
-        
-        # 数据指标
-        ws.cell(row=row_idx, column=15, value=(post.read_7d if post else None)).border = thin_border
-        ws.cell(row=row_idx, column=16, value=(post.read_14d if post else None)).border = thin_border
-        ws.cell(row=row_idx, column=17, value=(post.interact_7d if post else None)).border = thin_border
-        ws.cell(row=row_idx, column=18, value=(post.interact_14d if post else None)).border = thin_border
-        ws.cell(row=row_idx, column=19, value=(post.visit_7d if post else None)).border = thin_border
-        ws.cell(row=row_idx, column=20, value=(post.visit_14d if post else None)).border = thin_border
-        ws.cell(row=row_idx, column=21, value=(post.want_7d if post else None)).border = thin_border
-        ws.cell(row=row_idx, column=22, value=(post.want_14d if post else None)).border = thin_border
-        
-        # AI分析结果
-        if ar.ai_output:
-            ws.cell(row=row_idx, column=23, value=ar.ai_output.summary or "").border = thin_border
-            ws.cell(row=row_idx, column=24, value="\n".join(ar.ai_output.strengths or [])).border = thin_border
-            ws.cell(row=row_idx, column=25, value="\n".join(ar.ai_output.weaknesses or [])).border = thin_border
-            ws.cell(row=row_idx, column=26, value="\n".join(ar.ai_output.suggestions or [])).border = thin_border
-        else:
-            for col in range(23, 27):
-                ws.cell(row=row_idx, column=col, value="").border = thin_border
-        
-        # 设置对齐方式
-        for col in range(1, 27):
-            ws.cell(row=row_idx, column=col).alignment = cell_alignment
-    
-    # 设置列宽（封面图片列加宽到30适应200px图片，新增表现/问题指标/亮点指标列）
-    column_widths = [6, 24, 40, 18, 10, 10, 12, 20, 40, 50, 30, 10, 25, 25, 10, 10, 10, 10, 12, 12, 12, 12, 40, 30, 30, 40]
-    for col, width in enumerate(column_widths, 1):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = width
-    
-    # 冻结首行
-    ws.freeze_panes = "A2"
-    
-    # 保存文件
+        await asyncio.gather(*(fetch(url) for url in urls))
+    return thumbnails
+
+
+async def _export_to_excel(analysis: Analysis, chunks: AsyncIterator[list], export_id: str) -> str:
+    """导出为Excel格式"""
     export_dir = os.path.join(settings.UPLOAD_DIR, "exports")
     os.makedirs(export_dir, exist_ok=True)
     
     filename = f"analysis_report_{export_id}.xlsx"
     file_path = os.path.join(export_dir, filename)
-    wb.save(file_path)
+    
+    writer_class = ExcelStreamWriter if settings.EXPORT_EXCEL_STREAMING else OpenpyxlExcelWriter
+    writer = writer_class(file_path)
+    fetch_seconds = write_seconds = 0.0
+    fetched = cover_count = 0
+    
+    try:
+        async for chunk in chunks:
+            # 并发下载并缩放本批封面（缩放在线程池中执行），之后写表不再等待网络
+            started = time.perf_counter()
+            cover_urls = list(dict.fromkeys(
+                ar.post.cover_image for ar in chunk
+                if getattr(ar, "post", None) and ar.post.cover_image
+            ))
+            # 先释放上一批的缩略图，内存中只保留当前一批
+            writer.thumbnails = {}
+            writer.thumbnails = await _prefetch_thumbnails(cover_urls, width=200)
+            fetch_seconds += time.perf_counter() - started
+            fetched += sum(1 for t in writer.thumbnails.values() if t)
+            cover_count += len(cover_urls)
+            
+            # 逐行写入工作表（流式模式下每行写完即刷到临时文件，内存占用不随行数增长）
+            started = time.perf_counter()
+            for ar in chunk:
+                writer.write_result(ar)
+            write_seconds += time.perf_counter() - started
+    finally:
+        # 保存文件（序列化 XML 为 CPU 密集操作，放到线程池执行）；出错时也关闭，释放缩略图临时目录
+        started = time.perf_counter()
+        await asyncio.to_thread(writer.close)
+        save_seconds = time.perf_counter() - started
+    print(f"[export] Excel export {export_id}: {writer.rows} rows ({writer_class.__name__}), "
+          f"{fetched}/{cover_count} thumbnails (concurrency={settings.EXPORT_IMAGE_CONCURRENCY}), "
+          f"fetch={fetch_seconds:.2f}s write={write_seconds:.2f}s save={save_seconds:.2f}s")
     
     return file_path
 
 
-async def _export_to_json(analysis: Analysis, results: list, export_id: str) -> str:
-    """导出为JSON格式"""
-    import json
+async def _export_to_json(
+    analysis: Analysis,
+    chunks: AsyncIterator[list],
+    export_id: str,
+    line_delimited: bool = False
+) -> str:
+    """导出为JSON格式（line_delimited 为真时导出 NDJSON，每行一条结果）
+
+    结果逐批序列化并写入文件，报告不会整体驻留内存。
+    """
+    export_dir = os.path.join(settings.UPLOAD_DIR, "exports")
+    os.makedirs(export_dir, exist_ok=True)
+    
+    extension = "ndjson" if line_delimited else "json"
+    filename = f"analysis_report_{export_id}.{extension}"
+    file_path = os.path.join(export_dir, filename)
     
-    data = {
-        "analysis": {
-            "id": str(analysis.id),
-            "name": analysis.name,
-            "created_at": str(analysis.created_at),
-            "status": getattr(analysis.status, "value", analysis.status)
-        },
-        "results": []
-    }
+    started = time.perf_counter()
+    writer_class = NdjsonWriter if line_delimited else JsonStreamWriter
+    writer = writer_class(file_path, analysis)
+    try:
+        async for chunk in chunks:
+            for ar in chunk:
+                writer.write_result(ar)
+    finally:
+        writer.close()
+    print(f"[export] {extension.upper()} export {export_id}: {writer.rows} rows in "
+          f"{time.perf_counter() - started:.2f}s (orjson={ORJSON_AVAILABLE})")
     
-    for ar in results:
-        post = getattr(ar, "post", None)
-        item = {
-            "analysis_result": {
-                "id": str(ar.id),
-                "performance": ar.performance,
-                "result_data": ar.result_data,
-                "created_at": str(ar.created_at)
-            },
-            "post": {
-                "id": str(post.id) if post else None,
-                "data_id": post.data_id if post else None,
-                "publish_time": str(post.publish_time) if post and post.publish_time else None,
-                "publish_link": post.publish_link if post else None,
-                "content_type": post.content_type if post else None,
-                "post_type": post.post_type if post else None,
-                "source": post.source if post else None,
-                "style_info": post.style_info if post else None,
-                "metrics": {
-                    "read_7d": post.read_7d if post else None,
-                    "interact_7d": post.interact_7d if post else None,
-                    "visit_7d": post.visit_7d if post else None,
-                    "want_7d": post.want_7d if post else None,
-                    "read_14d": post.read_14d if post else None,
-                    "interact_14d": post.interact_14d if post else None,
-                    "visit_14d": post.visit_14d if post else None,
-                    "want_14d": post.want_14d if post else None
-                }
-            },
-            "ai_analysis": None
-        }
+    return file_path
 
-        if ar.ai_output:
-            item["ai_analysis"] = {
-                "summary": ar.ai_output.summary,
-                "strengths": ar.ai_output.strengths,
-                "weaknesses": ar.ai_output.weaknesses,
-                "suggestions": ar.ai_output.suggestions,
-                "model_name": ar.ai_output.model_name,
-                "created_at": str(ar.ai_output.created_at)
-            }
 
-        data["results"].append(item)
-    
-    # 保存文件
+async def _export_to_arrow(analysis: Analysis, chunks: AsyncIterator[list], export_id: str, file_format: str) -> str:
+    """导出为列式格式（parquet / arrow），指标、结构化结果和 AI 输出均展开为带类型的列"""
     export_dir = os.path.join(settings.UPLOAD_DIR, "exports")
     os.makedirs(export_dir, exist_ok=True)
     
-    filename = f"analysis_report_{export_id}.json"
+    filename = f"analysis_report_{export_id}.{file_format}"
     file_path = os.path.join(export_dir, filename)
     
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    started = time.perf_counter()
+    writer = ArrowTableWriter(
+        file_path, analysis,
+        file_format=file_format,
+        row_group_size=settings.EXPORT_ROW_GROUP_SIZE
+    )
+    try:
+        async for chunk in chunks:
+            for ar in chunk:
+                writer.write_result(ar)
+    finally:
+        writer.close()
+    print(f"[export] {file_format} export {export_id}: {writer.rows} rows, {writer.row_groups} row groups "
+          f"in {time.perf_counter() - started:.2f}s")
     
     return file_path
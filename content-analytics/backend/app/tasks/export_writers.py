@@ -0,0 +1,567 @@
+"""导出文件写入器
+
+所有写入器接口相同（write_result 逐行写入，close 落盘）：
+    ExcelStreamWriter   xlsxwriter 的 constant_memory 模式，每写完一行即刷到临时文件，封面缩略图也先落到临时目录，
+                        内存占用与行数无关
+    OpenpyxlExcelWriter openpyxl 普通工作簿，整张表驻留内存直到保存（原实现，保留作对照和回退）
+    JsonStreamWriter    逐条写出 results 数组的 JSON 文档
+    NdjsonWriter        每行一条结果的 NDJSON，便于按行切分并行加载
+    ArrowTableWriter    带类型的扁平列，按行组写出 Parquet 或 Arrow IPC 文件，供数仓直接加载
+"""
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+import openpyxl
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.drawing.image import Image as XLImage
+import xlsxwriter
+from xlsxwriter.worksheet import Worksheet
+
+from app.analysis.calculator import MetricsCalculator
+from app.utils.fast_json import dumps, dumps_bytes
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    PYARROW_AVAILABLE = False
+
+
+# 标题行（与笔记详情页面一致）
+EXCEL_HEADERS = [
+    "序号",
+    "笔记ID",
+    "笔记链接",
+    "发文时间",
+    "内容形式",
+    "发文类型",
+    "素材来源",
+    "款式信息",
+    "标题",
+    "正文",
+    "封面图片",
+    "表现",
+    "问题指标",
+    "亮点指标",
+    "7天阅读",
+    "14天阅读",
+    "7天互动",
+    "14天互动",
+    "7天好物访问",
+    "14天好物访问",
+    "7天好物想要",
+    "14天好物想要",
+    "AI一句话总结",
+    "优点",
+    "问题",
+    "优化建议"
+]
+
+# 列宽（封面图片列加宽到30适应200px图片）
+EXCEL_COLUMN_WIDTHS = [6, 24, 40, 18, 10, 10, 12, 20, 40, 50, 30, 10, 25, 25, 10, 10, 10, 10, 12, 12, 12, 12, 40, 30, 30, 40]
+
+# 封面图片所在列（从 0 开始）
+COVER_COLUMN = 10
+
+SHEET_TITLE = "分析报告"
+
+Thumbnails = Dict[str, Optional[Tuple[bytes, Tuple[int, int]]]]
+
+
+def excel_row_values(index: int, ar) -> List[Any]:
+    """一条分析结果对应的整行单元格值（封面列留空，由写入器嵌图或写入 URL）"""
+    post = getattr(ar, "post", None)
+    result_data = ar.result_data or {}
+    ai_output = ar.ai_output
+    return [
+        index,
+        post.data_id if post else "",
+        post.publish_link if post else "",
+        str(post.publish_time) if post and post.publish_time else "",
+        post.content_type if post else "",
+        post.post_type if post else "",
+        post.source if post else "",
+        post.style_info if post else "",
+        post.content_title if post else "",
+        post.content_text if post else "",
+        "",
+        ar.performance or "",
+        "、".join(result_data.get('problem_metrics', [])),
+        "、".join(result_data.get('highlight_metrics', [])),
+        post.read_7d if post else None,
+        post.read_14d if post else None,
+        post.interact_7d if post else None,
+        post.interact_14d if post else None,
+        post.visit_7d if post else None,
+        post.visit_14d if post else None,
+        post.want_7d if post else None,
+        post.want_14d if post else None,
+        (ai_output.summary or "") if ai_output else "",
+        "\n".join(ai_output.strengths or []) if ai_output else "",
+        "\n".join(ai_output.weaknesses or []) if ai_output else "",
+        "\n".join(ai_output.suggestions or []) if ai_output else ""
+    ]
+
+
+class _StreamWorksheet(Worksheet):
+    """缓存行高前缀和的工作表
+
+    xlsxwriter 在行高被修改过时，每张图片都要从第 0 行累加行高求绝对位置，
+    每行一张封面时总耗时为 O(行数²)。这里按行号缓存累计像素高度，保存时逐张计算只需 O(1)。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._row_offsets = [0]
+
+    def _row_offset(self, row: int) -> int:
+        offsets = self._row_offsets
+        while len(offsets) <= row:
+            offsets.append(offsets[-1] + self._size_row(len(offsets) - 1))
+        return offsets[row]
+
+    def _position_object_pixels(self, col_start, row_start, x1, y1, width, height, anchor):
+        if not self.row_size_changed or y1 < 0:
+            return super()._position_object_pixels(col_start, row_start, x1, y1, width, height, anchor)
+        # 先按默认行高计算（跳过逐行累加），再把纵向绝对位置换成缓存的真实值
+        self.row_size_changed = False
+        try:
+            dimensions = super()._position_object_pixels(col_start, row_start, x1, y1, width, height, anchor)
+        finally:
+            self.row_size_changed = True
+        dimensions[9] += self._row_offset(row_start) - self.default_row_pixels * row_start
+        return dimensions
+
+
+class ExcelStreamWriter:
+    """流式 Excel 写入器（xlsxwriter constant_memory）
+
+    行必须按顺序写入，写过的行不能再修改；标题、列宽、冻结窗格在写数据前一次设好。
+    单元格格式在工作簿级别只创建一次，所有单元格共享同一个格式对象，不会为每个单元格复制样式。
+    xlsxwriter 会保留每张插入图片的数据直到保存，因此缩略图按 URL 去重后写入临时目录、以文件名插入，
+    工作表只记录路径，保存时逐张从磁盘读取。
+    """
+
+    def __init__(self, file_path: str, thumbnails: Optional[Thumbnails] = None):
+        self.file_path = file_path
+        self.thumbnails = thumbnails or {}
+        self.rows = 0
+        self._image_dir = tempfile.mkdtemp(prefix="xlsx_images_")
+        self._image_paths: Dict[str, str] = {}
+        self.workbook = xlsxwriter.Workbook(file_path, {
+            "constant_memory": True,
+            # 与 openpyxl 保持一致：字符串原样写入，不自动转换为链接、公式或数字
+            "strings_to_urls": False,
+            "strings_to_formulas": False,
+            "strings_to_numbers": False
+        })
+        self.worksheet = self.workbook.add_worksheet(SHEET_TITLE, worksheet_class=_StreamWorksheet)
+
+        # 共享的命名格式
+        self.header_format = self.workbook.add_format({
+            "bold": True,
+            "font_color": "#FFFFFF",
+            "font_size": 12,
+            "bg_color": "#FF2442",
+            "pattern": 1,
+            "align": "center",
+            "valign": "vcenter",
+            "text_wrap": True,
+            "border": 1
+        })
+        self.cell_format = self.workbook.add_format({
+            "align": "left",
+            "valign": "top",
+            "text_wrap": True,
+            "border": 1
+        })
+
+        for col, width in enumerate(EXCEL_COLUMN_WIDTHS):
+            self.worksheet.set_column(col, col, width)
+        self.worksheet.freeze_panes(1, 0)
+        self.worksheet.write_row(0, 0, EXCEL_HEADERS, self.header_format)
+
+    def write_result(self, ar) -> None:
+        self.rows += 1
+        row = self.rows
+        values = excel_row_values(row, ar)
+
+        # 封面图片（嵌入缩略图，行高需在写入该行单元格前设置）
+        post = getattr(ar, "post", None)
+        if post and post.cover_image:
+            thumbnail = self.thumbnails.get(post.cover_image)
+            if thumbnail:
+                png_data, size = thumbnail
+                self.worksheet.set_row(row, size[1] * 0.75)
+                self.worksheet.insert_image(row, COVER_COLUMN, self._spool_image(post.cover_image, png_data), {
+                    "description": "cover.png",
+                    "object_position": 1
+                })
+            else:
+                # 图片下载失败，写入URL
+                values[COVER_COLUMN] = post.cover_image
+
+        for col, value in enumerate(values):
+            self.worksheet.write(row, col, value, self.cell_format)
+
+    def _spool_image(self, url: str, png_data: bytes) -> str:
+        """把缩略图写入临时目录（同一 URL 只写一次），返回文件路径"""
+        path = self._image_paths.get(url)
+        if path is None:
+            path = os.path.join(self._image_dir, f"{len(self._image_paths)}.png")
+            with open(path, "wb") as f:
+                f.write(png_data)
+            self._image_paths[url] = path
+        return path
+
+    def close(self) -> None:
+        """写出剩余的行并打包 xlsx（CPU 密集，调用方应放到线程池执行）"""
+        try:
+            self.workbook.close()
+        finally:
+            shutil.rmtree(self._image_dir, ignore_errors=True)
+
+
+class OpenpyxlExcelWriter:
+    """openpyxl 内存工作簿写入器（所有单元格驻留内存，保存时一次性序列化）"""
+
+    def __init__(self, file_path: str, thumbnails: Optional[Thumbnails] = None):
+        self.file_path = file_path
+        self.thumbnails = thumbnails or {}
+        self.rows = 0
+        self.workbook = openpyxl.Workbook()
+        self.worksheet = self.workbook.active
+        self.worksheet.title = SHEET_TITLE
+
+        # 样式定义
+        header_font = Font(bold=True, color="FFFFFF", size=12)
+        header_fill = PatternFill(start_color="FF2442", end_color="FF2442", fill_type="solid")
+        header_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+        self.cell_alignment = Alignment(horizontal="left", vertical="top", wrap_text=True)
+        self.thin_border = Border(
+            left=Side(style='thin'),
+            right=Side(style='thin'),
+            top=Side(style='thin'),
+            bottom=Side(style='thin')
+        )
+
+        for col, header in enumerate(EXCEL_HEADERS, 1):
+            cell = self.worksheet.cell(row=1, column=col, value=header)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = header_alignment
+            cell.border = self.thin_border
+
+        for col, width in enumerate(EXCEL_COLUMN_WIDTHS, 1):
+            self.worksheet.column_dimensions[openpyxl.utils.get_column_letter(col)].width = width
+
+        # 冻结首行
+        self.worksheet.freeze_panes = "A2"
+
+    def write_result(self, ar) -> None:
+        self.rows += 1
+        row_idx = self.rows + 1
+        values = excel_row_values(self.rows, ar)
+
+        # 封面图片（嵌入缩略图）
+        post = getattr(ar, "post", None)
+        if post and post.cover_image:
+            thumbnail = self.thumbnails.get(post.cover_image)
+            if thumbnail:
+                png_data, size = thumbnail
+                self.worksheet.add_image(XLImage(BytesIO(png_data)), f"K{row_idx}")
+                # 设置行高以适应图片
+                self.worksheet.row_dimensions[row_idx].height = size[1] * 0.75
+            else:
+                # 图片下载失败，写入URL
+                values[COVER_COLUMN] = post.cover_image
+
+        for col, value in enumerate(values, 1):
+            cell = self.worksheet.cell(row=row_idx, column=col, value=value)
+            cell.border = self.thin_border
+            cell.alignment = self.cell_alignment
+
+    def close(self) -> None:
+        """保存文件（序列化 XML 为 CPU 密集操作，调用方应放到线程池执行）"""
+        self.workbook.save(self.file_path)
+
+
+# 写文件的缓冲区大小，逐条写入的小块数据合并后再落盘
+JSON_WRITE_BUFFER = 1024 * 1024
+
+
+def json_analysis_info(analysis) -> Dict[str, Any]:
+    return {
+        "id": str(analysis.id),
+        "name": analysis.name,
+        "created_at": str(analysis.created_at),
+        "status": getattr(analysis.status, "value", analysis.status)
+    }
+
+
+def json_result_item(ar) -> Dict[str, Any]:
+    """一条分析结果的 JSON 结构"""
+    post = getattr(ar, "post", None)
+    item = {
+        "analysis_result": {
+            "id": str(ar.id),
+            "performance": ar.performance,
+            "result_data": ar.result_data,
+            "created_at": str(ar.created_at)
+        },
+        "post": {
+            "id": str(post.id) if post else None,
+            "data_id": post.data_id if post else None,
+            "publish_time": str(post.publish_time) if post and post.publish_time else None,
+            "publish_link": post.publish_link if post else None,
+            "content_type": post.content_type if post else None,
+            "post_type": post.post_type if post else None,
+            "source": post.source if post else None,
+            "style_info": post.style_info if post else None,
+            "metrics": {
+                "read_7d": post.read_7d if post else None,
+                "interact_7d": post.interact_7d if post else None,
+                "visit_7d": post.visit_7d if post else None,
+                "want_7d": post.want_7d if post else None,
+                "read_14d": post.read_14d if post else None,
+                "interact_14d": post.interact_14d if post else None,
+                "visit_14d": post.visit_14d if post else None,
+                "want_14d": post.want_14d if post else None
+            }
+        },
+        "ai_analysis": None
+    }
+
+    if ar.ai_output:
+        item["ai_analysis"] = {
+            "summary": ar.ai_output.summary,
+            "strengths": ar.ai_output.strengths,
+            "weaknesses": ar.ai_output.weaknesses,
+            "suggestions": ar.ai_output.suggestions,
+            "model_name": ar.ai_output.model_name,
+            "created_at": str(ar.ai_output.created_at)
+        }
+    return item
+
+
+class JsonStreamWriter:
+    """流式 JSON 写入器
+
+    输出结构与原来一次性 json.dump 的文档相同（{"analysis": {...}, "results": [...]}），
+    但 results 逐条序列化后直接写入文件，每条结果占一行，整份报告不会在内存中成形。
+    """
+
+    def __init__(self, file_path: str, analysis):
+        self.file_path = file_path
+        self.rows = 0
+        self.file = open(file_path, "wb", buffering=JSON_WRITE_BUFFER)
+        self.file.write(b'{"analysis":' + dumps_bytes(json_analysis_info(analysis)) + b',\n"results":[')
+
+    def write_result(self, ar) -> None:
+        self.file.write(b"\n" if self.rows == 0 else b",\n")
+        self.file.write(dumps_bytes(json_result_item(ar)))
+        self.rows += 1
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+        self.file.write(b"\n]}\n" if self.rows else b"]}\n")
+        self.file.close()
+
+
+class NdjsonWriter:
+    """NDJSON 写入器 - 每行一条完整结果，并带上 analysis_id，单行即可独立加载"""
+
+    def __init__(self, file_path: str, analysis):
+        self.file_path = file_path
+        self.rows = 0
+        self.analysis_id = str(analysis.id)
+        self.file = open(file_path, "wb", buffering=JSON_WRITE_BUFFER)
+
+    def write_result(self, ar) -> None:
+        self.file.write(dumps_bytes({"analysis_id": self.analysis_id, **json_result_item(ar)}))
+        self.file.write(b"\n")
+        self.rows += 1
+
+    def close(self) -> None:
+        self.file.close()
+
+
+# 八个数据指标（与 Post 字段同名），列顺序与 MetricsCalculator 一致
+METRIC_FIELDS = list(MetricsCalculator.METRIC_NAMES.keys())
+# compare_to_avg 以中文指标名为键，转换回字段名
+METRIC_FIELDS_BY_NAME = {name: field for field, name in MetricsCalculator.METRIC_NAMES.items()}
+
+
+def _parse_percent(value) -> Optional[float]:
+    """把 compare_to_avg 中的 "+12%" / "-5%" 转为数值 12.0 / -5.0"""
+    if value is None:
+        return None
+    try:
+        return float(str(value).strip().rstrip("%"))
+    except ValueError:
+        return None
+
+
+def _string_list(value) -> Optional[List[str]]:
+    """把 LLM 输出的 JSON 字段规整为字符串列表（对应 list<string> 列）
+
+    单个值包成一个元素的列表，元素中的数字等转为字符串，对象 / 数组序列化为 JSON 文本。
+    """
+    if value is None:
+        return None
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    return [
+        item if isinstance(item, str) else dumps(item) if isinstance(item, (dict, list, tuple)) else str(item)
+        for item in value
+        if item is not None
+    ]
+
+
+def _arrow_schema():
+    string_list = pa.list_(pa.string())
+    fields = [
+        ("analysis_id", pa.string()),
+        ("analysis_result_id", pa.string()),
+        ("post_id", pa.string()),
+        ("data_id", pa.string()),
+        ("publish_time", pa.timestamp("us")),
+        ("publish_link", pa.string()),
+        ("content_type", pa.string()),
+        ("post_type", pa.string()),
+        ("source", pa.string()),
+        ("style_info", pa.string()),
+        ("content_title", pa.string()),
+        ("cover_image", pa.string()),
+    ]
+    fields += [(metric, pa.float64()) for metric in METRIC_FIELDS]
+    fields += [
+        ("performance", pa.string()),
+        ("problem_metrics", string_list),
+        ("highlight_metrics", string_list),
+    ]
+    fields += [(f"compare_to_avg_{metric}", pa.float64()) for metric in METRIC_FIELDS]
+    fields += [(f"percentile_rank_{metric}", pa.float64()) for metric in METRIC_FIELDS]
+    fields += [
+        ("result_created_at", pa.timestamp("us")),
+        ("ai_summary", pa.string()),
+        ("ai_strengths", string_list),
+        ("ai_weaknesses", string_list),
+        ("ai_suggestions", string_list),
+        ("ai_model_name", pa.string()),
+        ("ai_created_at", pa.timestamp("us")),
+    ]
+    return pa.schema(fields)
+
+
+def arrow_row_values(analysis_id: str, ar) -> List[Any]:
+    """一条分析结果展开后的列值，顺序与 _arrow_schema 一致"""
+    post = getattr(ar, "post", None)
+    result_data = ar.result_data or {}
+    compare_to_avg = {
+        METRIC_FIELDS_BY_NAME.get(name, name): _parse_percent(value)
+        for name, value in (result_data.get('compare_to_avg') or {}).items()
+    }
+    percentile_ranks = result_data.get('percentile_ranks') or {}
+    ai_output = ar.ai_output
+    values = [
+        analysis_id,
+        str(ar.id),
+        str(post.id) if post else None,
+        post.data_id if post else None,
+        post.publish_time if post else None,
+        post.publish_link if post else None,
+        post.content_type if post else None,
+        post.post_type if post else None,
+        post.source if post else None,
+        post.style_info if post else None,
+        post.content_title if post else None,
+        post.cover_image if post else None,
+    ]
+    values += [getattr(post, metric) if post else None for metric in METRIC_FIELDS]
+    values += [
+        ar.performance,
+        _string_list(result_data.get('problem_metrics')) or [],
+        _string_list(result_data.get('highlight_metrics')) or [],
+    ]
+    values += [compare_to_avg.get(metric) for metric in METRIC_FIELDS]
+    values += [percentile_ranks.get(metric) for metric in METRIC_FIELDS]
+    values += [
+        ar.created_at,
+        ai_output.summary if ai_output else None,
+        _string_list(ai_output.strengths) if ai_output else None,
+        _string_list(ai_output.weaknesses) if ai_output else None,
+        _string_list(ai_output.suggestions) if ai_output else None,
+        ai_output.model_name if ai_output else None,
+        ai_output.created_at if ai_output else None,
+    ]
+    return values
+
+
+class ArrowTableWriter:
+    """Parquet / Arrow IPC 写入器
+
+    结果先按列累积，满 row_group_size 行后转换为带类型的 Arrow 表写出一个行组（IPC 为一个记录批），
+    内存占用只与行组大小有关。Parquet 使用 zstd 压缩并对低基数字符串列做字典编码。
+    """
+
+    FORMATS = ("parquet", "arrow")
+
+    def __init__(self, file_path: str, analysis, file_format: str = "parquet", row_group_size: int = 50000):
+        if not PYARROW_AVAILABLE:
+            raise Exception("导出 Parquet/Arrow 需要安装 pyarrow")
+        if file_format not in self.FORMATS:
+            raise ValueError(f"不支持的列式格式: {file_format}")
+        self.file_path = file_path
+        self.file_format = file_format
+        self.row_group_size = max(1, row_group_size)
+        self.analysis_id = str(analysis.id)
+        self.schema = _arrow_schema()
+        self.rows = 0
+        self.row_groups = 0
+        self._columns: List[List[Any]] = [[] for _ in self.schema]
+        self._pending = 0
+        if file_format == "parquet":
+            self._writer = pq.ParquetWriter(file_path, self.schema, compression="zstd")
+        else:
+            self._writer = pa.ipc.new_file(
+                file_path, self.schema, options=pa.ipc.IpcWriteOptions(compression="zstd")
+            )
+
+    def write_result(self, ar) -> None:
+        for column, value in zip(self._columns, arrow_row_values(self.analysis_id, ar)):
+            column.append(value)
+        self._pending += 1
+        self.rows += 1
+        if self._pending >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """把已累积的行写成一个行组"""
+        if not self._pending:
+            return
+        table = pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(self._columns, self.schema)],
+            schema=self.schema
+        )
+        if self.file_format == "parquet":
+            self._writer.write_table(table, row_group_size=self._pending)
+        else:
+            self._writer.write_table(table, max_chunksize=self._pending)
+        self.row_groups += 1
+        self._columns = [[] for _ in self.schema]
+        self._pending = 0
+
+    def close(self) -> None:
+        if self._writer is None:
+            return
+        self.flush()
+        self._writer.close()
+        self._writer = None
@@ -0,0 +1,66 @@
+import time
+from typing import Optional
+
+from app.services.progress_channel import progress_channel
+
+
+class ProgressThrottle:
+    """进度节流器 - 决定何时需要持久化一次进度
+
+    进度更新与行写入解耦：只有距离上次上报超过 min_interval 秒、
+    或新完成的行数达到 min_rows，或任务已完成时才上报。
+    """
+
+    def __init__(self, total: int, min_interval: float = 1.0, min_rows: int = 500):
+        self.total = total
+        self.min_interval = min_interval
+        self.min_rows = min_rows
+        self._last_time = time.monotonic()
+        self._last_done = 0
+
+    def should_report(self, done: int) -> bool:
+        if done >= self.total:
+            return self._mark(done)
+        if done - self._last_done >= self.min_rows:
+            return self._mark(done)
+        if time.monotonic() - self._last_time >= self.min_interval:
+            return self._mark(done)
+        return False
+
+    def _mark(self, done: int) -> bool:
+        if done == self._last_done and done != 0:
+            return False
+        self._last_time = time.monotonic()
+        self._last_done = done
+        return True
+
+    @staticmethod
+    def percent(done: int, total: int) -> str:
+        """格式化为 '45%' 形式的进度字符串"""
+        if total <= 0:
+            return "100%"
+        return f"{int(done / total * 100)}%"
+
+
+async def report_progress(obj, kind: str, value: str, phase: Optional[str] = None) -> bool:
+    """上报任务实时进度
+
+    优先写入 Redis 进度通道，不修改数据库行；Redis 不可用时退回为设置 obj.progress，
+    返回 False 表示调用方需要提交会话才能让进度可见。
+    """
+    if await progress_channel.publish(kind, obj.id, value, phase=phase):
+        return True
+    obj.progress = value
+    return False
+
+
+async def report_state(obj, kind: str, phase: Optional[str] = None, reset: bool = False) -> bool:
+    """状态切换已提交到数据库后，向进度通道广播当前状态，SSE 订阅方据此推送（失败时只是少一条推送）"""
+    return await progress_channel.publish_state(
+        kind, obj.id,
+        status=getattr(obj.status, "value", obj.status),
+        progress=getattr(obj, "progress", None),
+        phase=phase,
+        error_message=obj.error_message,
+        reset=reset
+    )
@@ -0,0 +1,22 @@
+"""JSON 序列化 - 安装了 orjson 时使用 orjson（快数倍，直接输出 UTF-8 字节），否则回退到标准库 json"""
+import json
+from typing import Any
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """序列化为紧凑的 UTF-8 字节（中文不转义；无法序列化的对象按 str() 输出）"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    """序列化为紧凑的 JSON 字符串"""
+    return dumps_bytes(obj).decode("utf-8")
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""对话流式输出延迟测试：经 POST /chat/conversations/{id}/messages 测量首字延迟（TTFT）和输出速率
+
+本地启动一个 OpenAI 兼容的桩服务（首个 token 前等待固定时间，之后按固定间隔逐个输出），
+把 DeepSeek 的 base_url 指向它，再用 uvicorn 启动应用，通过真实 HTTP 读取 SSE 响应。
+对比两种模式：
+  native   - Provider 的原生流式输出（stream=True，边生成边转发）
+  buffered - 等待完整回复后再逐字符输出（原默认实现的行为），首字延迟等于整段生成时间
+两种模式的 chunk 事件数反映分片合并（按时间窗口 / 字节数）的效果。
+最后测试客户端断开：收到第一个分片后关闭连接，检查桩服务是否随之停止输出。
+需要可用的数据库（DATABASE_URL），脚本会创建并在结束时删除一个临时用户。
+
+用法: python scripts/bench_chat_stream.py [token 数] [首 token 延迟毫秒] [token 间隔毫秒]
+"""
+import asyncio
+import json
+import socket
+import sys
+import time
+import uuid
+sys.path.insert(0, '.')
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import delete
+
+from app.core.config import settings
+from app.core.security import create_access_token, get_password_hash
+from app.db.session import async_session_maker
+from app.models.conversation import Conversation, ConversationMessage
+from app.models.user import User
+from app.models.user_settings import UserSettings
+from app.ai.deepseek import DeepSeekProvider
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def build_stub_app(tokens: int, first_token_delay: float, token_interval: float) -> FastAPI:
+    """OpenAI 兼容的 chat/completions 桩服务，stream=True 时按 SSE 逐 token 输出
+
+    stub.state.emitted 记录最近一次流式请求已输出的 token 数
+    """
+    stub = FastAPI()
+    stub.state.emitted = 0
+    words = [f"词{i} " for i in range(tokens)]
+
+    @stub.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        if not body.get("stream"):
+            # 非流式：整段生成完才返回
+            await asyncio.sleep(first_token_delay + token_interval * (tokens - 1))
+            return JSONResponse({"choices": [{"message": {"role": "assistant", "content": "".join(words)}}]})
+
+        async def events():
+            stub.state.emitted = 0
+            await asyncio.sleep(first_token_delay)
+            for index, word in enumerate(words):
+                if index:
+                    await asyncio.sleep(token_interval)
+                stub.state.emitted = index + 1
+                chunk = {"choices": [{"index": 0, "delta": {"content": word}}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return stub
+
+
+async def buffered_chat_stream(self, messages, system_prompt=None, temperature=0.7, max_tokens=2000):
+    """原默认实现：等待完整回复后逐字符输出"""
+    full_response = await self.chat(messages, system_prompt, temperature, max_tokens)
+    for char in full_response:
+        yield char
+
+
+async def start_server(app, port: int) -> uvicorn.Server:
+    """在当前事件循环中启动 uvicorn（与数据库连接池共用同一个循环）"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    server.task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server
+
+
+async def stop_server(server: uvicorn.Server) -> None:
+    server.should_exit = True
+    await server.task
+
+
+async def create_fixture():
+    """创建临时用户、AI 设置和对话，返回 (user_id, conversation_id)"""
+    async with async_session_maker() as db:
+        suffix = uuid.uuid4().hex[:8]
+        user = User(
+            username=f"bench_{suffix}",
+            email=f"bench_{suffix}@example.com",
+            hashed_password=get_password_hash(suffix),
+            is_active=True
+        )
+        db.add(user)
+        await db.flush()
+        db.add(UserSettings(user_id=user.id, ai_provider="deepseek", deepseek_api_key="bench"))
+        conversation = Conversation(user_id=user.id, title="bench")
+        db.add(conversation)
+        await db.commit()
+        return user.id, conversation.id
+
+
+async def drop_fixture(user_id, conversation_id):
+    async with async_session_maker() as db:
+        await db.execute(delete(ConversationMessage).where(ConversationMessage.conversation_id == conversation_id))
+        await db.execute(delete(Conversation).where(Conversation.id == conversation_id))
+        await db.execute(delete(UserSettings).where(UserSettings.user_id == user_id))
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+
+
+async def measure(base_url: str, token: str, conversation_id) -> dict:
+    """发送一条消息并读取 SSE 响应，返回首字延迟、总耗时、content 事件数和收到的字符数"""
+    started = time.perf_counter()
+    first_chunk = None
+    events = chars = 0
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        async with client.stream(
+            "POST",
+            f"{base_url}/api/v1/chat/conversations/{conversation_id}/messages",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"content": "你好"}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = json.loads(line[6:])
+                if data["type"] == "chunk":
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter() - started
+                    events += 1
+                    chars += len(data["content"])
+                elif data["type"] == "error":
+                    raise RuntimeError(data["message"])
+    total = time.perf_counter() - started
+    return {"ttft": first_chunk or total, "total": total, "events": events, "chars": chars}
+
+
+async def measure_disconnect(base_url: str, token: str, conversation_id) -> None:
+    """收到第一个分片后断开连接"""
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        async with client.stream(
+            "POST",
+            f"{base_url}/api/v1/chat/conversations/{conversation_id}/messages",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"content": "你好"}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("data: ") and json.loads(line[6:])["type"] == "chunk":
+                    return
+
+
+async def run(tokens: int, first_token_delay: float, token_interval: float):
+    stub_port, app_port = free_port(), free_port()
+    stub = build_stub_app(tokens, first_token_delay, token_interval)
+    stub_server = await start_server(stub, stub_port)
+    settings.DEEPSEEK_BASE_URL = f"http://127.0.0.1:{stub_port}/v1"
+
+    from app.main import app
+    app_server = await start_server(app, app_port)
+    base_url = f"http://127.0.0.1:{app_port}"
+
+    user_id, conversation_id = await create_fixture()
+    token = create_access_token(str(user_id))
+    native_chat_stream = DeepSeekProvider.chat_stream
+    results = {}
+    try:
+        for mode in ("native", "buffered"):
+            DeepSeekProvider.chat_stream = native_chat_stream if mode == "native" else buffered_chat_stream
+            results[mode] = await measure(base_url, token, conversation_id)
+        DeepSeekProvider.chat_stream = native_chat_stream
+        await measure_disconnect(base_url, token, conversation_id)
+        # 留出几十个 token 间隔的时间，上游未被取消的话会继续输出
+        await asyncio.sleep(max(0.5, token_interval * 50))
+        emitted_after_disconnect = stub.state.emitted
+    finally:
+        DeepSeekProvider.chat_stream = native_chat_stream
+        await drop_fixture(user_id, conversation_id)
+        await stop_server(app_server)
+        await stop_server(stub_server)
+
+    generation = first_token_delay + token_interval * (tokens - 1)
+    print(f"桩服务: {tokens} tokens，首 token {first_token_delay * 1000:.0f}ms，"
+          f"间隔 {token_interval * 1000:.0f}ms（完整生成约 {generation:.2f}s）")
+    for mode, r in results.items():
+        print(f"{mode:>9}: TTFT {r['ttft'] * 1000:.0f}ms  总耗时 {r['total']:.2f}s  "
+              f"{tokens / r['total']:.1f} tokens/s  {r['events']} 个 chunk 事件 / {r['chars']} 字符")
+    print(f"客户端断开: 桩服务共输出 {emitted_after_disconnect}/{tokens} tokens"
+          f"（{'上游已取消' if emitted_after_disconnect < tokens else '上游未取消'}）")
+    print(f"原生流式首字延迟降低 {results['buffered']['ttft'] / max(results['native']['ttft'], 1e-9):.1f}x")
+
+
+def main():
+    tokens = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    first_token_delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 300) / 1000
+    token_interval = (float(sys.argv[3]) if len(sys.argv) > 3 else 10) / 1000
+    asyncio.run(run(tokens, first_token_delay, token_interval))
+
+
+if __name__ == "__main__":
+    main()
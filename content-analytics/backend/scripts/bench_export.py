@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""Excel 导出：xlsxwriter 流式写入与 openpyxl 内存工作簿的峰值内存 / 耗时对比 + 内容一致性校验
+
+每种写入器在独立子进程中运行，峰值内存取子进程的 ru_maxrss 减去构造行数据后的基线。
+缩略图为照片大小的 PNG（约 100KB），与导出任务一样按批（CHUNK_ROWS 行）生成，只保留当前批，
+生成发生在计时 / 测量窗口内（耗时扣除生成时间），因此峰值内存反映写入器是否随图片张数增长。
+运行前先校验 _StreamWorksheet 依赖的 xlsxwriter 内部接口（版本须与 requirements.txt 的固定版本一致），
+图片定位结果或 drawing XML 与原版工作表不同时直接失败。
+
+用法: python scripts/bench_export.py [行数] [缩略图张数]
+"""
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+sys.path.insert(0, '.')
+
+import numpy as np
+import xlsxwriter
+
+from app.tasks.export_writers import ExcelStreamWriter, OpenpyxlExcelWriter, _StreamWorksheet
+
+WRITERS = {
+    "stream": ExcelStreamWriter,
+    "openpyxl": OpenpyxlExcelWriter,
+}
+
+
+# 每批行数，与导出任务按批预取缩略图的方式一致
+CHUNK_ROWS = 1000
+
+
+def cover_url(index: int) -> str:
+    return f"https://img.example.com/cover_{index}.png"
+
+
+def build_thumbnail(index: int, width: int = 200, height: int = 266):
+    """生成一张照片大小的缩略图（渐变加噪声，PNG 约 100KB），返回 (png, (宽, 高))"""
+    from PIL import Image
+    rng = np.random.default_rng(index)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 / width, y * 255 / height, (x + y + index * 7) % 256], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 8, (height, width, 3)), 0, 255).astype("uint8")
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, format="PNG")
+    return output.getvalue(), (width, height)
+
+
+def build_chunk_thumbnails(chunk):
+    """模拟导出任务对一批结果的预取：{url: (png, (宽, 高))}，下载失败的封面不在其中"""
+    thumbnails = {}
+    for ar in chunk:
+        url = ar.post.cover_image
+        if url not in thumbnails and "/cover_" in url:
+            thumbnails[url] = build_thumbnail(int(url.rsplit("_", 1)[1].split(".")[0]))
+    return thumbnails
+
+
+def build_results(rows: int, images: int, seed: int = 42):
+    """构造与导出查询结构相同的模拟分析结果（含笔记、AI 输出，部分封面下载失败）"""
+    rng = np.random.default_rng(seed)
+    metrics = rng.lognormal(mean=4, sigma=1.5, size=(rows, 8)).round().tolist()
+    results = []
+    for i in range(rows):
+        if images and i % 10:
+            cover = cover_url(i % images)
+        else:
+            cover = f"https://img.example.com/missing_{i}.png"
+        post = SimpleNamespace(
+            data_id=f"id_{i}",
+            publish_link=f"https://m.poizon.com/note/{i}",
+            publish_time=f"2024-01-{i % 28 + 1:02d} 12:00:00",
+            content_type="图文",
+            post_type="穿搭",
+            source="自制",
+            style_info="款式1",
+            content_title=f"标题 {i}",
+            content_text="正文内容" * 40,
+            cover_image=cover,
+            read_7d=metrics[i][0], read_14d=metrics[i][1],
+            interact_7d=metrics[i][2], interact_14d=metrics[i][3],
+            visit_7d=metrics[i][4], visit_14d=metrics[i][5],
+            want_7d=metrics[i][6], want_14d=metrics[i][7],
+        )
+        ai_output = SimpleNamespace(
+            summary=f"总结 {i}",
+            strengths=["优点一", "优点二"],
+            weaknesses=["问题一"],
+            suggestions=["建议一", "建议二", "建议三"],
+        ) if i % 3 else None
+        results.append(SimpleNamespace(
+            post=post,
+            performance="优秀" if i % 2 else "一般",
+            result_data={"problem_metrics": ["7天阅读"], "highlight_metrics": ["7天互动", "14天互动"]},
+            ai_output=ai_output,
+        ))
+    return results
+
+
+def run_writer(name: str, rows: int, images: int, file_path: str) -> None:
+    """子进程入口：构造行数据后按批生成缩略图并写出文件，打印 耗时 峰值内存增量(MB) 缩略图总量(MB)"""
+    results = build_results(rows, images)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    generate_seconds = 0.0
+    thumbnail_bytes = 0
+    writer = WRITERS[name](file_path)
+    for offset in range(0, rows, CHUNK_ROWS):
+        chunk = results[offset:offset + CHUNK_ROWS]
+        started = time.perf_counter()
+        writer.thumbnails = {}
+        writer.thumbnails = build_chunk_thumbnails(chunk)
+        generate_seconds += time.perf_counter() - started
+        thumbnail_bytes += sum(len(png) for png, _ in writer.thumbnails.values())
+        for ar in chunk:
+            writer.write_result(ar)
+    writer.thumbnails = {}
+    writer.close()
+    seconds = time.perf_counter() - start - generate_seconds
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{seconds:.3f} {(peak - baseline) / 1024:.1f} {thumbnail_bytes / 1024 / 1024:.1f}")
+
+
+def pinned_xlsxwriter_version() -> str:
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "requirements.txt")) as f:
+        for line in f:
+            if line.startswith("xlsxwriter=="):
+                return line.split("==", 1)[1].split("#", 1)[0].strip()
+    raise SystemExit("requirements.txt 中没有固定 xlsxwriter 版本")
+
+
+def build_position_workbook(worksheet_class, rows: int = 60) -> bytes:
+    """行高各不相同（含隐藏行）、每行一张图片的小工作簿，返回 xlsx 字节"""
+    from PIL import Image
+    image = io.BytesIO()
+    Image.new("RGB", (40, 30), (200, 50, 50)).save(image, format="PNG")
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {"in_memory": True})
+    worksheet = workbook.add_worksheet("Sheet1", worksheet_class=worksheet_class)
+    for row in range(1, rows):
+        if row % 7 == 0:
+            worksheet.set_row(row, None, None, {"hidden": True})
+        else:
+            worksheet.set_row(row, 15 + row % 5 * 12)
+        worksheet.insert_image(row, 2, "cover.png", {
+            "image_data": io.BytesIO(image.getvalue()),
+            "object_position": 1,
+            "y_offset": row % 3
+        })
+    workbook.close()
+    return output.getvalue()
+
+
+def check_stream_worksheet() -> None:
+    """校验 _StreamWorksheet 覆盖的 xlsxwriter 私有接口，与原版 Worksheet 结果不一致时退出"""
+    import zipfile
+    from xlsxwriter.worksheet import Worksheet
+
+    pinned = pinned_xlsxwriter_version()
+    if xlsxwriter.__version__ != pinned:
+        raise SystemExit(
+            f"xlsxwriter {xlsxwriter.__version__} 与 requirements.txt 固定的 {pinned} 不一致，"
+            f"_StreamWorksheet 依赖其内部实现，请在固定版本下运行本校验"
+        )
+
+    # _position_object_pixels 的返回值：
+    # [col_start, row_start, x1, y1, col_end, row_end, x2, y2, x_abs, y_abs]，_StreamWorksheet 改写下标 9
+    workbook = xlsxwriter.Workbook(io.BytesIO(), {"in_memory": True})
+    stock = workbook.add_worksheet("stock")
+    stream = workbook.add_worksheet("stream", worksheet_class=_StreamWorksheet)
+    for worksheet in (stock, stream):
+        for row in range(1, 40):
+            worksheet.set_row(row, 15 + row % 4 * 20, None, {"hidden": row % 9 == 0})
+    for row in range(0, 40, 3):
+        args = (2, row, 0, row % 5, 200, 150, 1)
+        expected = list(stock._position_object_pixels(*args))
+        actual = list(stream._position_object_pixels(*args))
+        if len(expected) != 10 or actual != expected:
+            raise SystemExit(
+                f"xlsxwriter {xlsxwriter.__version__} 的 _position_object_pixels 返回结构已变化"
+                f"（第 {row} 行: 原版 {expected}，_StreamWorksheet {actual}），不能继续使用 _StreamWorksheet"
+            )
+    workbook.close()
+
+    def drawing_xml(worksheet_class) -> bytes:
+        with zipfile.ZipFile(io.BytesIO(build_position_workbook(worksheet_class))) as archive:
+            return archive.read("xl/drawings/drawing1.xml")
+
+    if drawing_xml(_StreamWorksheet) != drawing_xml(Worksheet):
+        raise SystemExit(f"xlsxwriter {xlsxwriter.__version__} 下 _StreamWorksheet 生成的 drawing XML 与原版不一致")
+    print(f"xlsxwriter {xlsxwriter.__version__}: _StreamWorksheet 图片定位与原版一致")
+
+
+def read_values(file_path: str):
+    import openpyxl
+    wb = openpyxl.load_workbook(file_path, read_only=True)
+    # 两种写入器对空字符串的存储方式不同，统一按空值比较
+    return [
+        tuple(None if value == "" else value for value in row)
+        for row in wb.active.iter_rows(values_only=True)
+    ]
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    images = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    check_stream_worksheet()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        measurements = {}
+        for name in WRITERS:
+            file_path = os.path.join(tmp_dir, f"{name}.xlsx")
+            output = subprocess.run(
+                [sys.executable, __file__, "--writer", name, str(rows), str(images), file_path],
+                check=True, capture_output=True, text=True
+            ).stdout.split()
+            measurements[name] = (float(output[0]), float(output[1]), os.path.getsize(file_path) / 1024 / 1024)
+            thumbnail_mb = float(output[2])
+
+        stream_values = read_values(os.path.join(tmp_dir, "stream.xlsx"))
+        openpyxl_values = read_values(os.path.join(tmp_dir, "openpyxl.xlsx"))
+        if stream_values != openpyxl_values:
+            mismatch = next(
+                i for i, (a, b) in enumerate(zip(stream_values, openpyxl_values)) if a != b
+            ) if len(stream_values) == len(openpyxl_values) else min(len(stream_values), len(openpyxl_values))
+            print(f"单元格内容不一致，首个差异在第 {mismatch + 1} 行")
+            sys.exit(1)
+
+    print(f"行数: {rows}，缩略图: {images} 张（按批生成，累计 {thumbnail_mb:.1f}MB），单元格内容一致")
+    for name, (seconds, peak_mb, size_mb) in measurements.items():
+        print(f"{name:>9}: {seconds:.2f}s  峰值内存 +{peak_mb:.1f}MB  文件 {size_mb:.1f}MB")
+    stream_seconds, stream_peak, _ = measurements["stream"]
+    base_seconds, base_peak, _ = measurements["openpyxl"]
+    print(f"流式写入: 耗时 {base_seconds / max(stream_seconds, 1e-9):.1f}x，"
+          f"峰值内存 {base_peak / max(stream_peak, 1e-9):.1f}x 更低")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--writer":
+        run_writer(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), sys.argv[5])
+    else:
+        main()
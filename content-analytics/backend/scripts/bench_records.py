@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""按列转换记录与逐行 iterrows 转换的一致性校验 + 耗时对比
+
+用法: python scripts/bench_records.py [行数]
+"""
+import sys
+import time
+sys.path.insert(0, '.')
+
+import numpy as np
+import pandas as pd
+
+from app.analysis.processor import DataProcessor
+
+
+def build_dataframe(rows: int, seed: int = 42) -> pd.DataFrame:
+    """构造与上传 Excel 相同列名、带缺失值的模拟数据"""
+    rng = np.random.default_rng(seed)
+    publish_time = pd.Series(
+        pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 86400 * 90, size=rows), unit='s')
+    ).astype(object)
+    publish_time[rng.random(rows) < 0.05] = None
+    data = {
+        'data_id': [f"id_{i}" for i in range(rows)],
+        '标题': rng.choice(['标题A', '标题B', None], size=rows),
+        '发文时间': publish_time,
+        '发文链接': rng.choice(['https://m.poizon.com/x', None], size=rows),
+        '内容形式': rng.choice(['图文', '视频'], size=rows),
+        '发文类型': rng.choice(['穿搭', '测评', '开箱'], size=rows),
+        '素材来源': rng.choice(['自制', '搬运', None], size=rows),
+        '款式信息': rng.choice(['款式1', None], size=rows),
+    }
+    for column in ['7天阅读/播放', '7天互动', '7天好物访问', '7天好物想要',
+                   '14天阅读/播放', '14天互动', '14天好物访问', '14天好物想要']:
+        values = rng.lognormal(mean=4, sigma=1.5, size=rows).round()
+        values[rng.random(rows) < 0.05] = np.nan
+        data[column] = values
+    return pd.DataFrame(data)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    processor = DataProcessor(build_dataframe(rows))
+    processor.process()
+
+    start = time.perf_counter()
+    rowwise = processor.to_records_rowwise()
+    rowwise_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columnar = processor.to_records()
+    columnar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tuples = processor.to_tuples()
+    tuples_seconds = time.perf_counter() - start
+
+    assert len(rowwise) == len(columnar) == len(tuples), "结果条数不一致"
+    columns = list(processor.processed_df.columns)
+    mismatches = [
+        i for i, (a, b, t) in enumerate(zip(rowwise, columnar, tuples))
+        if a != b or tuple(b[col] for col in columns) != t
+    ]
+    if mismatches:
+        i = mismatches[0]
+        print(f"发现 {len(mismatches)} 条结果不一致，首条 row={i}")
+        print(f"  逐行: {rowwise[i]}")
+        print(f"  按列: {columnar[i]}")
+        sys.exit(1)
+
+    print(f"行数: {rows}，结果一致")
+    print(f"逐行 iterrows: {rowwise_seconds:.3f}s")
+    print(f"按列 records: {columnar_seconds:.3f}s ({rowwise_seconds / max(columnar_seconds, 1e-9):.1f}x)")
+    print(f"按列 tuples: {tuples_seconds:.3f}s ({rowwise_seconds / max(tuples_seconds, 1e-9):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""向量化评分与逐行评分的一致性校验 + 耗时对比
+
+用法: python scripts/bench_scoring.py [行数]
+"""
+import sys
+import time
+sys.path.insert(0, '.')
+
+import numpy as np
+import pandas as pd
+
+from app.analysis.aggregator import AnalysisAggregator
+
+
+METRICS = [
+    'read_7d', 'interact_7d', 'visit_7d', 'want_7d',
+    'read_14d', 'interact_14d', 'visit_14d', 'want_14d'
+]
+
+
+def build_dataframe(rows: int, seed: int = 42) -> pd.DataFrame:
+    """构造带缺失值、零值和重复值的模拟数据"""
+    rng = np.random.default_rng(seed)
+    data = {
+        'data_id': [f"id_{i}" for i in range(rows)],
+        'content_type': rng.choice(['图文', '视频', ''], size=rows),
+        'post_type': rng.choice(['穿搭', '测评', '开箱'], size=rows),
+    }
+    for metric in METRICS:
+        values = rng.lognormal(mean=4, sigma=1.5, size=rows).round()
+        values[rng.random(rows) < 0.1] = 0
+        values[rng.random(rows) < 0.05] = np.nan
+        data[metric] = values
+    # 一列全为零，覆盖中位数为 0 的分支
+    data['want_14d'] = np.zeros(rows)
+    return pd.DataFrame(data)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    df = build_dataframe(rows)
+
+    aggregator = AnalysisAggregator(df).prepare()
+
+    start = time.perf_counter()
+    rowwise = aggregator.analyze_all_rowwise()
+    rowwise_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = aggregator.analyze_all()
+    vectorized_seconds = time.perf_counter() - start
+
+    assert len(rowwise) == len(vectorized), "结果条数不一致"
+    mismatches = [i for i, (a, b) in enumerate(zip(rowwise, vectorized)) if a != b]
+    if mismatches:
+        i = mismatches[0]
+        print(f"发现 {len(mismatches)} 条结果不一致，首条 row={i}")
+        print(f"  逐行: {rowwise[i]}")
+        print(f"  向量: {vectorized[i]}")
+        sys.exit(1)
+
+    print(f"行数: {rows}，结果一致")
+    print(f"逐行: {rowwise_seconds:.3f}s")
+    print(f"向量化: {vectorized_seconds:.3f}s ({rowwise_seconds / max(vectorized_seconds, 1e-9):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,13 @@ export function triggerAIAnalysis(analysisId: string): Promise<ApiResponse<void>
   return request.post(`/analyses/${analysisId}/ai`)
 }
 
+// datasetId 为重新上传后的数据集时，按 data_id 与原分析结果对比，只重写变化的笔记
+export function reanalyze(analysisId: string, datasetId?: string): Promise<ApiResponse<void>> {
+  const params: any = {}
+  if (datasetId) params.dataset_id = datasetId
+  return request.post(`/analyses/${analysisId}/reanalyze`, null, { params })
+}
+
 export function stopAnalysis(analysisId: string): Promise<ApiResponse<void>> {
   return request.post(`/analyses/${analysisId}/stop`)
 }
@@ -96,12 +96,16 @@ export async function sendMessage(
         throw new Error('无法读取响应流')
       }
       
+      let buffer = ''
+      
       while (true) {
         const { done, value } = await reader.read()
         if (done) break
         
-        const chunk = decoder.decode(value, { stream: true })
-        const lines = chunk.split('\n')
+        // 服务端会合并分片，一条消息可能跨两次读取，未收完的行留到下一次
+        buffer += decoder.decode(value, { stream: true })
+        const lines = buffer.split('\n')
+        buffer = lines.pop() || ''
         
         for (const line of lines) {
           if (line.startsWith('data: ')) {
@@ -0,0 +1,115 @@
+// 任务进度事件流（SSE）：服务端在状态/进度/阶段变化时推送，任务完成或失败后自动结束
+
+export type ProgressKind = 'datasets' | 'analyses' | 'exports'
+
+export interface ProgressState {
+  type: 'state'
+  id: string
+  status: string
+  progress: string | null
+  phase: string | null
+  error_message: string | null
+}
+
+const TERMINAL_STATUSES = ['completed', 'failed']
+
+// 连接断开（代理超时、服务重启、5xx 等）后的重连间隔：从 1 秒起逐次加倍，最长 30 秒；收到事件后重置
+const RETRY_BASE_MS = 1000
+const RETRY_MAX_MS = 30000
+
+class ProgressHttpError extends Error {
+  status: number
+
+  constructor(status: number) {
+    super(`HTTP error! status: ${status}`)
+    this.status = status
+  }
+}
+
+// 订阅进度事件，返回取消订阅函数
+// 连接出错或在任务结束前断开时按退避间隔自动重连；任务进入终态时调用 onEnd()，
+// 记录不存在（404）时不再重连，调用 onEnd(error)
+export function subscribeProgress(
+  kind: ProgressKind,
+  id: string,
+  onState: (state: ProgressState) => void,
+  onEnd?: (error?: Error) => void
+): () => void {
+  const controller = new AbortController()
+  const baseURL = import.meta.env.VITE_API_BASE_URL || '/api/v1'
+  let retryDelay = RETRY_BASE_MS
+  let retryTimer: ReturnType<typeof setTimeout> | undefined
+
+  // 读取一次事件流，收到终态时返回 true
+  const connect = async (): Promise<boolean> => {
+    const { useAuthStore } = await import('@/stores/auth')
+    const authStore = useAuthStore()
+    const token = authStore.token || localStorage.getItem('token') || ''
+
+    const response = await fetch(`${baseURL}/${kind}/${id}/events`, {
+      headers: { 'Authorization': `Bearer ${token}` },
+      signal: controller.signal
+    })
+    if (!response.ok) {
+      throw new ProgressHttpError(response.status)
+    }
+
+    const reader = response.body?.getReader()
+    if (!reader) {
+      throw new Error('无法读取响应流')
+    }
+    const decoder = new TextDecoder()
+    let buffer = ''
+
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) return false
+
+      // 事件以空行分隔，未收完的部分留到下一次读取
+      buffer += decoder.decode(value, { stream: true })
+      const events = buffer.split('\n\n')
+      buffer = events.pop() || ''
+
+      for (const event of events) {
+        if (!event.startsWith('data: ')) continue
+        const state = JSON.parse(event.slice(6)) as ProgressState
+        retryDelay = RETRY_BASE_MS
+        onState(state)
+        if (TERMINAL_STATUSES.includes(state.status)) return true
+      }
+    }
+  }
+
+  const run = () => {
+    connect()
+      .then((finished) => {
+        if (finished) {
+          onEnd?.()
+        } else {
+          scheduleRetry()
+        }
+      })
+      .catch((error) => {
+        if (controller.signal.aborted) return
+        if (error instanceof ProgressHttpError && error.status === 404) {
+          onEnd?.(error)
+          return
+        }
+        console.warn(`进度事件流中断，${retryDelay / 1000} 秒后重连:`, error)
+        scheduleRetry()
+      })
+  }
+
+  const scheduleRetry = () => {
+    if (controller.signal.aborted) return
+    retryTimer = setTimeout(run, retryDelay)
+    retryDelay = Math.min(retryDelay * 2, RETRY_MAX_MS)
+  }
+
+  run()
+
+  return () => {
+    clearTimeout(retryTimer)
+    controller.abort()
+  }
+}
@@ -126,7 +126,7 @@ export interface AIOutputHistory {
 export interface Export {
   id: string
   analysis_id: string
-  format: 'excel' | 'pdf' | 'json'
+  format: 'excel' | 'pdf' | 'json' | 'ndjson' | 'parquet' | 'arrow'
   status: 'pending' | 'processing' | 'completed' | 'failed'
   created_at: string
 }